@@ -10,8 +10,22 @@ __version__     = "0.0.2"
 
 import txConfig
 import txDevMCP
+import txBase
+import txWorker
+import txAsync
+import txScheduler
+import txStats
+import txFlow
+import txRecorder
+import txStall
+import txSupervisor
+from txMessage import Message, FEEDBACK_CODES
 
 import time, datetime
+import importlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, perf_counter_ns
 import threading
 import os, os.path
 import sys
@@ -24,10 +38,78 @@ import traceback
 #def LOG(text:str, level:int=3):
 #    log.LOG('\033[0;30;47m '+text+' \033[0m', level)
 
+#######
+
+class Line:
+    """
+    A teleprinter line: devices (MCP, teleprinter driver, i-Telex, ...) on a
+    bus of their own. Lines are independent of each other; all lines of a
+    process share the main loop and its scheduler.
+    """
+    def __init__(self, name:str):
+        self.name = name
+        # Prefix of device ids in logs and recordings, empty for the default
+        # line
+        self.prefix = name + '/' if name else ''
+
+        self.devices = []
+
+        # Routing table, compiled from the devices' bus interest (see
+        # TelexBase): in_device -> ([char targets], [(command target,
+        # prefixes or None)], [feedback targets])
+        self.routes = {}
+
+        # Write workers of devices configured with "async_write" (see
+        # txWorker)
+        self.workers = {}
+
+        # Flow control: sink device -> Credit (see txFlow), in_device ->
+        # [Credit of its char targets]
+        self.credits = {}
+        self.flow = {}
+
+        # Buffer feedback waiting for delivery by flush_feedback
+        self.feedback = txFlow.Feedback()
+
+    def __repr__(self):
+        return 'Line({!r})'.format(self.name)
+
 #######
 # global variables
 
-DEVICES = []
+# The default line, configured at top level of the configuration; further
+# lines are configured in "lines"
+LINE = Line('')
+
+# Lines hosted in this process, LINE first
+LINES = [LINE]
+
+# Worker processes hosting lines configured with "process": line name ->
+# multiprocessing.Process, and the event stopping them
+LINE_PROCESSES = {}
+LINE_PROCESSES_STOP = None
+
+# Receives the log records of the worker processes (see init_line_processes)
+LOG_LISTENER = None
+
+# The containers of the default line, for modules and tools handling a
+# single line (e.g. txRecorder)
+DEVICES = LINE.devices
+ROUTES = LINE.routes
+WORKERS = LINE.workers
+CREDITS = LINE.credits
+FLOW = LINE.flow
+
+# Records all items passing through process_data if configured (see
+# txRecorder)
+RECORDER = None
+
+# Set by devices (see TelexBase.notify) to wake up the event-driven main loop
+WAKEUP = threading.Event()
+
+# Periodic and one-shot callbacks of the main loop (see init_scheduler)
+SCHEDULER = txScheduler.Scheduler()
+SCHEDULER.wakeup = WAKEUP
 
 # Path where this file is stored
 try:
@@ -146,136 +228,260 @@ def threading_excepthook(args):
     l.critical("Exception in Thread {}".format(args.thread))
     excepthook(args.exc_type, args.exc_value, args.exc_traceback)
 
+# Device types: type name in configuration -> (factory, front, parallel)
+# - factory: called with the device parameters, returns a list of devices
+# - front: insert devices at the beginning of the line instead of appending
+# - parallel: constructor may run in a thread, concurrently to others
+DEVICE_TYPES = {}
+
+def register_device_type(type_name:str, factory, front:bool=False, parallel:bool=False):
+    DEVICE_TYPES[type_name] = (factory, front, parallel)
+
+
+def lazy_factory(module_name:str, class_name:str):
+    """
+    Return a factory importing the device module on first use only.
+    """
+    def factory(**params):
+        module = importlib.import_module(module_name)
+        return [getattr(module, class_name)(**params)]
+    return factory
+
+
+def itelex_factory(**params):
+    devices = lazy_factory('txDevITelexClient', 'TelexITelexClient')(**params)
+    if params['port'] > 0:
+        devices += lazy_factory('txDevITelexSrv', 'TelexITelexSrv')(**params)
+    return devices
+
+
+register_device_type('screen',    lazy_factory('txDevScreen', 'TelexScreen'))
+register_device_type('ED1000',    lazy_factory('txDevED1000SC', 'TelexED1000SC'), parallel=True)
+register_device_type('CH340TTY',  lazy_factory('txDevCH340TTY', 'TelexCH340TTY'))
+register_device_type('terminal',  lazy_factory('txDevTerminal', 'TelexTerminal'))
+register_device_type('RPiTTY',    lazy_factory('txDevRPiTTY', 'TelexRPiTTY'))
+register_device_type('RPiCtrl',   lazy_factory('txDevRPiCtrl', 'TelexRPiCtrl'))
+#register_device_type('telnet',    lazy_factory('txDevTelnetSrv', 'TelexTelnetSrv'))
+register_device_type('i-Telex',   itelex_factory, parallel=True)
+register_device_type('news',      lazy_factory('txDevNews', 'TelexNews'), front=True, parallel=True)
+register_device_type('twitter',   lazy_factory('txDevTwitter', 'TelexTwitter'), parallel=True)
+register_device_type('twitterV2', lazy_factory('txDevTwitterV2', 'TelexTwitterV2'), parallel=True)
+register_device_type('rss',       lazy_factory('txDevRSS', 'TelexRSS'), parallel=True)
+register_device_type('IRC',       lazy_factory('txDevIRC', 'TelexIRC'), front=True, parallel=True)
+register_device_type('REST',      lazy_factory('txDevREST', 'TelexREST'), front=True)
+register_device_type('eliza',     lazy_factory('txDevEliza', 'TelexEliza'))
+register_device_type('archive',   lazy_factory('txDevArchive', 'TelexArchive'))
+register_device_type('shellcmd',  lazy_factory('txDevShellCmd', 'TelexShellCmd'))
+register_device_type('log',       lazy_factory('txDevLog', 'TelexLog'), front=True)
+register_device_type('KeyPad',    lazy_factory('txDevKeyPad', 'TelexKeyPad'), parallel=True)
+
+# -----
+
+def construct(factory, params:dict):
+    """
+    Call factory, return the devices created and the time it took.
+    """
+    time_start = time.monotonic()
+    devices = factory(**params)
+    return devices, time.monotonic() - time_start
+
+
 def init():
-    global DEVICES
+    configs = line_configs()
+    init_line_processes({name: cfg for name, cfg in configs.items() if cfg.get('process', False)})
 
-    ctrl = txDevMCP.TelexMCP(**txConfig.CFG)
-    DEVICES.append(ctrl)
+    init_line(LINE, txConfig.CFG)
+    for name, cfg in configs.items():
+        if not cfg.get('process', False):
+            line = Line(name)
+            LINES.append(line)
+            init_line(line, cfg)
 
-    # Iterate over configuration items, create configured instances and add
-    # them to DEVICES.
-    for dev_name, dev_param in txConfig.CFG['devices'].items():
-        if not dev_param.get('enable', False):
+    for line in LINES:
+        init_devices(line)
+    init_supervisor()
+
+
+def line_configs() -> dict:
+    """
+    Return the configuration of each enabled line in "lines": the top level
+    configuration (MCP options, paths, ...) updated by the line's items, with
+    the line's devices only. i-Telex devices using the port of another line
+    are disabled.
+    """
+    ports = {}   # i-Telex port -> line name
+    def check_ports(name:str, devices:dict):
+        for dev_name, dev_param in devices.items():
+            if dev_param.get('enable', False) and dev_param.get('type') == 'i-Telex' and dev_param.get('port', 0) > 0:
+                port = dev_param['port']
+                if port in ports:
+                    l.error("{!r}: i-Telex port {} already used by line {!r}, {!r} disabled".format(name, port, ports[port], dev_name))
+                    dev_param['enable'] = False
+                else:
+                    ports[port] = name
+
+    check_ports('', txConfig.CFG.get('devices', {}))
+    ret = {}
+    for name, line_cfg in txConfig.CFG.get('lines', {}).items():
+        if not line_cfg.get('enable', True):
             continue
+        cfg = {k: v for k, v in txConfig.CFG.items() if k not in ('devices', 'lines')}
+        cfg.update(line_cfg)
+        cfg.setdefault('devices', {})
+        check_ports(name, cfg['devices'])
+        ret[name] = cfg
+    return ret
 
-        dev_param['name'] = dev_name
-
-        if dev_param['type'] == 'screen':
-            import txDevScreen
-            screen = txDevScreen.TelexScreen(**dev_param)
-            DEVICES.append(screen)
-
-        elif dev_param['type'] == 'ED1000':
-            import txDevED1000SC
-            serial = txDevED1000SC.TelexED1000SC(**dev_param)
-            DEVICES.append(serial)
-
-        elif dev_param['type'] == 'CH340TTY':
-            import txDevCH340TTY
-            serial = txDevCH340TTY.TelexCH340TTY(**dev_param)
-            DEVICES.append(serial)
-
-        elif dev_param['type'] == 'terminal':
-            import txDevTerminal
-            serial = txDevTerminal.TelexTerminal(**dev_param)
-            DEVICES.append(serial)
-
-        elif dev_param['type'] == 'RPiTTY':
-            import txDevRPiTTY
-            serial = txDevRPiTTY.TelexRPiTTY(**dev_param)
-            DEVICES.append(serial)
-
-        elif dev_param['type'] == 'RPiCtrl':
-            import txDevRPiCtrl
-            ctrl = txDevRPiCtrl.TelexRPiCtrl(**dev_param)
-            DEVICES.append(ctrl)
-
-        #elif dev_param['type'] == 'telnet':
-        #    import txDevTelnetSrv
-        #    srv = txDevTelnetSrv.TelexTelnetSrv(**dev_param)
-        #    DEVICES.append(srv)
-
-        elif dev_param['type'] == 'i-Telex':
-            import txDevITelexClient
-            srv = txDevITelexClient.TelexITelexClient(**dev_param)
-            DEVICES.append(srv)
-
-            if dev_param['port'] > 0:
-                import txDevITelexSrv
-                srv = txDevITelexSrv.TelexITelexSrv(**dev_param)
-                DEVICES.append(srv)
-
-        elif dev_param['type'] == 'news':
-            import txDevNews
-            news = txDevNews.TelexNews(**dev_param)
-            DEVICES.insert(0,news)
-
-        elif dev_param['type'] == 'twitter':
-            import txDevTwitter
-            twitter = txDevTwitter.TelexTwitter(**dev_param)
-            DEVICES.append(twitter)
-
-        elif dev_param['type'] == 'twitterV2':
-            import txDevTwitterV2
-            twitterV2 = txDevTwitterV2.TelexTwitterV2(**dev_param)
-            DEVICES.append(twitterV2)
-
-        elif dev_param['type'] == 'rss' :
-            import txDevRSS
-            rss = txDevRSS.TelexRSS(**dev_param)
-            DEVICES.append(rss)
-
-        elif dev_param['type'] == 'IRC':
-            import txDevIRC
-            news = txDevIRC.TelexIRC(**dev_param)
-            DEVICES.insert(0,news)
-
-        elif dev_param['type'] == 'REST':
-            import txDevREST
-            news = txDevREST.TelexREST(**dev_param)
-            DEVICES.insert(0,news)
-
-        elif dev_param['type'] == 'eliza':
-            import txDevEliza
-            eliza = txDevEliza.TelexEliza(**dev_param)
-            DEVICES.append(eliza)
-
-        elif dev_param['type'] == 'archive':
-            import txDevArchive
-            archive = txDevArchive.TelexArchive(**dev_param)
-            DEVICES.append(archive)
-
-        elif dev_param['type'] == 'shellcmd':
-            import txDevShellCmd
-            module = txDevShellCmd.TelexShellCmd(**dev_param)
-            DEVICES.append(module)
-
-        elif dev_param['type'] == 'log':
-            import txDevLog
-            log = txDevLog.TelexLog(**dev_param)
-            DEVICES.insert(0,log)
-
-        elif dev_param['type'] == 'KeyPad':
-            import txDevKeyPad
-            keypad = txDevKeyPad.TelexKeyPad(**dev_param)
-            DEVICES.append(keypad)
 
-        else:
-            l.warning("Unknown module type in configuration, section {!r}: {!r}".format(dev_name, dev_param['type']))
+def init_line(line:Line, cfg:dict):
+    """
+    Create MCP and the devices configured in cfg["devices"] for line.
+    """
+    time_start = time.monotonic()
+    timing = []
+
+    devices, duration = construct(lambda **params: [txDevMCP.TelexMCP(**params)], cfg)
+    line.devices.extend(devices)
+    timing.append(('MCP', duration))
+
+    # Iterate over configuration items and create configured instances;
+    # constructors marked parallel are run in threads meanwhile. Add them to
+    # the line in configuration order afterwards, so that the order doesn't
+    # depend on timing.
+    parallel_init = cfg.get('parallel_init', True)
+    jobs = []
+    with ThreadPoolExecutor(thread_name_prefix='init') as pool:
+        for dev_name, dev_param in cfg['devices'].items():
+            if not dev_param.get('enable', False):
+                continue
+
+            dev_param['name'] = dev_name
+            if line.name:
+                dev_param['line'] = line.name
+
+            try:
+                factory, front, parallel = DEVICE_TYPES[dev_param['type']]
+            except KeyError:
+                l.warning("Unknown module type in configuration, section {!r}: {!r}".format(dev_name, dev_param['type']))
+                continue
+
+            if parallel and parallel_init:
+                job = pool.submit(construct, factory, dev_param)
+            else:
+                job = construct(factory, dev_param)
+            jobs.append((dev_name, front, job))
+
+        for dev_name, front, job in jobs:
+            devices, duration = job if isinstance(job, tuple) else job.result()
+            for device in devices:
+                if front:
+                    line.devices.insert(0, device)
+                else:
+                    line.devices.append(device)
+            timing.append((dev_name, duration))
+
+    l.info("{}Startup time {:.2f} s ({})".format(line.prefix, time.monotonic() - time_start,
+        ', '.join('{}: {:.2f} s'.format(name, duration) for name, duration in timing)))
+
+
+def init_devices(line:Line=LINE):
+    """
+    Hook the devices of line up to the main loop: wakeup event, scheduler,
+    write workers, flow control, routing table and idle callbacks. Also used
+    by the benchmarks (see utils/bench) to run the core with simulated devices.
+    """
+    for device in line.devices:
+        device.set_wakeup(WAKEUP)
+        device.set_scheduler(SCHEDULER)
+        worker = txWorker.create(device)
+        if worker:
+            line.workers[device] = worker
+        credit = txFlow.create(device)
+        if credit:
+            line.credits[device] = credit
+            l.info("{}{}: flow control, window {}".format(line.prefix, device.id, credit.window))
+
+    init_routes(line)
+    init_scheduler(line)
+
+# -----
+
+def init_routes(line:Line=LINE):
+    line.routes.clear()
+    line.flow.clear()
+    line.feedback.pending.clear()
+    for in_device in line.devices:
+        compile_route(in_device, line)
+    l.debug(dump_routing_table(line))
+
+
+def compile_route(in_device, line:Line=LINE):
+    """
+    Compile the write targets for data read from in_device, keeping the order
+    of the line's devices (which matters for discarding data).
+    """
+    chars = []
+    commands = []
+    feedbacks = []
+    credits = []
+    for out_device in line.devices:
+        if out_device == in_device:
+            continue
+        if out_device.bus_sources is not None and in_device.id not in out_device.bus_sources:
+            continue
+        target = line.workers.get(out_device, out_device)
+        if out_device.bus_chars:
+            chars.append(target)
+            if out_device in line.credits:
+                credits.append(line.credits[out_device])
+        if out_device.bus_commands is True:
+            commands.append((target, None))
+        elif out_device.bus_commands:
+            commands.append((target, tuple('\x1b' + p for p in out_device.bus_commands)))
+        if out_device.bus_feedbacks:
+            feedbacks.append(target)
+    line.routes[in_device] = route = (chars, commands, feedbacks)
+    line.flow[in_device] = credits
+    return route
+
+
+def dump_routing_table(line:Line=LINE) -> str:
+    lines = ['{}Routing table:'.format(line.prefix)]
+    for in_device, (chars, commands, feedbacks) in line.routes.items():
+        lines.append('  {:<5} chars    -> {}'.format(in_device.id,
+            ', '.join(d.id for d in chars) or '-'))
+        lines.append('  {:<5} commands -> {}'.format(in_device.id,
+            ', '.join(d.id if p is None else '{}({})'.format(d.id, '|'.join(a[1:] for a in p)) for d, p in commands) or '-'))
+        lines.append('  {:<5} feedback -> {}'.format(in_device.id,
+            ', '.join(d.id for d in feedbacks) or '-'))
+    return '\n'.join(lines)
 
 
 # =====
 
 def exit():
-    global DEVICES
+    global RECORDER
 
-    for device in DEVICES:
-        try:
-            device.exit()
-            del device
-        except Exception as e:
-            pass
-    DEVICES = []
+    if RECORDER:
+        RECORDER.close()
+        RECORDER = None
+
+    exit_line_processes()
+    txStall.stop()
+    supervised = txSupervisor.SUPERVISOR.stats()
+    if supervised:
+        l.info("Supervisor stats {}".format(supervised))
+
+    l.info("Scheduler statistics:\n" + SCHEDULER.report())
+    if txStats.ENABLED and txStats.HISTOGRAMS:
+        txStats.dump()
+
+    for line in LINES:
+        exit_line(line)
+    del LINES[1:]
+
+    if LOG_LISTENER:
+        LOG_LISTENER.stop()
     logging.shutdown()
     return
     # Comment out the return above to view non-terminating threads
@@ -285,72 +491,332 @@ def exit():
             [l.info(i) for i in traceback.format_stack(stack)]
         time.sleep(5)
 
+
+def exit_line(line:Line):
+    for credit in line.credits.values():
+        l.info("{}{}: flow control stats {}".format(line.prefix, credit.id, credit.stats()))
+    line.credits.clear()
+    l.info("{}Buffer feedback stats {}".format(line.prefix, line.feedback.stats()))
+
+    for worker in line.workers.values():
+        l.info("{}{}: write worker stats {}".format(line.prefix, worker.id, worker.stats()))
+        worker.exit()
+    line.workers.clear()
+
+    for device in line.devices:
+        if device.commands and device.commands.unknown:
+            l.info("{}{}: unknown commands {}".format(line.prefix, device.id, device.commands.unknown))
+
+    for device in line.devices:
+        try:
+            device.exit()
+            del device
+        except Exception as e:
+            pass
+    line.devices.clear()
+    line.routes.clear()
+    line.flow.clear()
+
 # =====
 
-def process_data():
+def process_lines() -> bool:
+    """
+    Process the data of all lines of this process, return True if there was
+    any.
+    """
     new_data = False
+    for line in LINES:
+        if process_data(line):
+            new_data = True
+    return new_data
+
 
-    for in_device in DEVICES:
+def process_data(line:Line=LINE):
+    new_data = False
+    stats = txStats.ENABLED
+    stall = txStall.DETECTOR
+    routes = line.routes
+    flow = line.flow
+
+    for in_device in line.devices:
+        c = None
+        if in_device.bus_throttle:
+            in_device.flow_credit = txFlow.available(flow.get(in_device))
+        if stats:
+            t = perf_counter_ns()
+        if stall:
+            stall.current = (line.prefix + in_device.id + '.read', None, perf_counter())
         try:
-            c = in_device.read()
+            if in_device.batch_read:
+                c = in_device.read_many()
+            else:
+                c = in_device.read()
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception as e:
-            l.warning("Uncaught Exception in {}.read(): {!r}".format(in_device.id, e))
+            l.warning("Uncaught Exception in {}{}.read(): {!r}".format(line.prefix, in_device.id, e))
+        if stall:
+            stall.current = None
+        if stats:
+            txStats.histogram(line.prefix + in_device.id + '.read').add(perf_counter_ns() - t)
         if c:
             new_data = True
             l.debug("read {!r} from {!r}".format(c, in_device))
-            for out_device in DEVICES:
-                if out_device != in_device:
-                    l.debug("writing {!r} to {!r}".format(c, out_device))
-                    try:
-                        ret = out_device.write(c, in_device.id)
-                    except (KeyboardInterrupt, SystemExit):
-                        raise
-                    except Exception as e:
-                        l.warning("Uncaught Exception in {}.write({!r}), {!r}: {!r}".format(out_device.id, c, in_device.id, e))
-                    if ret:
-                        l.debug("writing returned {!r}".format(ret))
-                        break   # stop writing to other devices (discard data)
+            chars, commands, _ = routes.get(in_device) or compile_route(in_device, line)
+            msg = None
+            if c.__class__ is Message:
+                # command parsed by its producer; string form for the others
+                msg = c
+                if msg.source is None:
+                    msg.source = in_device.id
+                c = str(msg)
+            elif c[0] != '\x1b':
+                for credit in flow.get(in_device, ()):
+                    credit.written += len(c)
+                if len(c) > 1:
+                    # run of characters from read_many
+                    stopped_by = process_text(c, in_device, chars, line.prefix)
+                    if RECORDER:
+                        RECORDER.record(in_device.id, c, chars, stopped_by, line.prefix)
+                    continue
+                targets = chars
+            if c[0] == '\x1b':
+                credit = line.credits.get(in_device)
+                if credit and c.startswith(credit.feedback_code, 1):
+                    # buffer feedback of a sink renews its credit
+                    if msg is None:
+                        msg = Message.parse(c, in_device.id)
+                    if msg.code == credit.feedback_code and msg.payload is not None:
+                        credit.feedback(msg.payload)
+                if c.startswith(FEEDBACK_CODES, 1):
+                    # buffer feedback is delivered coalesced by flush_feedback
+                    if msg is None:
+                        msg = Message.parse(c, in_device.id)
+                    line.feedback.put(in_device, msg)
+                    continue
+                targets = [d for d, p in commands if p is None or c.startswith(p)]
+                if msg is None and any(d.bus_messages for d in targets):
+                    # parse once for all devices declaring bus_messages
+                    msg = Message.parse(c, in_device.id)
+            stopped_by = process_item(c, msg, in_device, targets, line.prefix)
+            if RECORDER:
+                RECORDER.record(in_device.id, c, targets, stopped_by, line.prefix)
 
     return new_data
 
 # -----
 
-def process_idle():
-    for device in DEVICES:
+def process_item(c:str, msg:Message, in_device, targets:list, prefix:str=''):
+    """
+    Write a single character or command c to targets; devices declaring
+    bus_messages get msg instead, if given. Returns the device that discarded
+    c, if any. prefix is the line's prefix of device ids (see Line).
+    """
+    stats = txStats.ENABLED
+    stall = txStall.DETECTOR
+
+    for out_device in targets:
+        a = msg if msg is not None and out_device.bus_messages else c
+        l.debug("writing {!r} to {!r}".format(a, out_device))
+        if stats:
+            t = perf_counter_ns()
+        if stall:
+            stall.current = (prefix + out_device.id + '.write', a, perf_counter())
         try:
-            device.idle()
+            ret = out_device.write(a, in_device.id)
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception as e:
-            l.warning("Uncaught Exception in {}.idle(): {!r}".format(device.id, e))
+            l.warning("Uncaught Exception in {}{}.write({!r}), {!r}: {!r}".format(prefix, out_device.id, a, in_device.id, e))
+            ret = None
+        if stall:
+            stall.current = None
+        if stats:
+            txStats.histogram(prefix + out_device.id + '.write').add(perf_counter_ns() - t)
+        if ret:
+            l.debug("writing returned {!r}".format(ret))
+            return out_device   # stop writing to other devices (discard data)
+
+
+def flush_feedback(line:Line=LINE):
+    """
+    Deliver the buffer feedback read since the last call, the latest value
+    per source only, to the devices declaring bus_feedbacks. Called every
+    txFlow.FEEDBACK_PERIOD seconds by the scheduler.
+    """
+    for in_device, msg in line.feedback.take():
+        targets = (line.routes.get(in_device) or compile_route(in_device, line))[2]
+        c = str(msg)
+        stopped_by = process_item(c, msg, in_device, targets, line.prefix)
+        if RECORDER:
+            RECORDER.record(in_device.id, c, targets, stopped_by, line.prefix)
 
 # -----
 
-def process_idle20Hz():
-    for device in DEVICES:
-        try:
-            device.idle20Hz()
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except Exception as e:
-            l.warning("Uncaught Exception in {}.idle20Hz(): {!r}".format(device.id, e))
+def process_text(text:str, in_device, targets:list, prefix:str=''):
+    """
+    Write a run of characters to targets, using write_many where supported
+    and single write calls otherwise. Characters discarded by a device are not
+    written to the following devices, same as in process_data. Returns the
+    device that discarded all remaining characters, if any. prefix is the
+    line's prefix of device ids (see Line).
+    """
+    stats = txStats.ENABLED
+    stall = txStall.DETECTOR
+
+    for out_device in targets:
+        l.debug("writing {!r} to {!r}".format(text, out_device))
+        if out_device.batch_write:
+            if stats:
+                t = perf_counter_ns()
+            if stall:
+                stall.current = (prefix + out_device.id + '.write_many', text, perf_counter())
+            try:
+                ret = out_device.write_many(text, in_device.id)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception as e:
+                l.warning("Uncaught Exception in {}{}.write_many({!r}), {!r}: {!r}".format(prefix, out_device.id, text, in_device.id, e))
+                ret = None
+            if stall:
+                stall.current = None
+            if stats:
+                txStats.histogram(prefix + out_device.id + '.write_many').add(perf_counter_ns() - t)
+            if ret is not None:
+                text = ret
+        else:
+            passed = []
+            if stats:
+                hist = txStats.histogram(prefix + out_device.id + '.write')
+            for a in text:
+                if stats:
+                    t = perf_counter_ns()
+                if stall:
+                    stall.current = (prefix + out_device.id + '.write', a, perf_counter())
+                try:
+                    ret = out_device.write(a, in_device.id)
+                except (KeyboardInterrupt, SystemExit):
+                    raise
+                except Exception as e:
+                    l.warning("Uncaught Exception in {}{}.write({!r}), {!r}: {!r}".format(prefix, out_device.id, a, in_device.id, e))
+                    ret = None
+                if stall:
+                    stall.current = None
+                if stats:
+                    hist.add(perf_counter_ns() - t)
+                if not ret:
+                    passed.append(a)
+            if len(passed) != len(text):
+                text = ''.join(passed)
+        if not text:
+            l.debug("writing discarded all data")
+            return out_device   # stop writing to other devices
 
 # -----
 
-def process_idle2Hz():
-    for device in DEVICES:
-        try:
-            device.idle2Hz()
-        except (KeyboardInterrupt, SystemExit):
-            raise
-        except Exception as e:
-            l.warning("Uncaught Exception in {}.idle2Hz(): {!r}".format(device.id, e))
+def init_scheduler(line:Line=LINE):
+    """
+    Register the idle methods each device of line actually implements: idle()
+    every 5 ms, idle20Hz() every 50 ms, idle2Hz() every 500 ms; and the
+    delivery of buffer feedback (flush_feedback).
+    """
+    start = time.monotonic()
+    for name, period in (('idle', 0.005), ('idle20Hz', 0.050), ('idle2Hz', 0.500)):
+        base = getattr(txBase.TelexBase, name)
+        for device in line.devices:
+            if getattr(type(device), name) is not base:
+                SCHEDULER.every(period, getattr(device, name), '{}{}.{}'.format(line.prefix, device.id, name), start + period)
+    SCHEDULER.every(txFlow.FEEDBACK_PERIOD, lambda: flush_feedback(line), line.prefix + 'feedback',
+        start + txFlow.FEEDBACK_PERIOD)
+
+
+def init_supervisor():
+    """ check the module threads started by txSupervisor once a second """
+    SCHEDULER.every(1.0, txSupervisor.SUPERVISOR.check, 'supervisor')
+
+# =====
+
+def init_line_processes(configs:dict):
+    """
+    Start a worker process for each line in configs (line name ->
+    configuration). Their log records are handled by the log handlers of this
+    process, so that there is a single error log.
+    """
+    global LINE_PROCESSES_STOP, LOG_LISTENER
+
+    if not configs:
+        return
+    # spawn: don't inherit threads and sockets of this process
+    ctx = multiprocessing.get_context('spawn')
+    logger = logging.getLogger("piTelex")
+    log_queue = ctx.Queue()
+    LOG_LISTENER = logging.handlers.QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+    LOG_LISTENER.start()
+    LINE_PROCESSES_STOP = ctx.Event()
+    for name, cfg in configs.items():
+        process = ctx.Process(target=run_line_process, name='line-' + name,
+            args=(name, cfg, log_queue, logger.level, txStats.FILENAME, LINE_PROCESSES_STOP))
+        process.start()
+        LINE_PROCESSES[name] = process
+        l.info("Line {!r} started in process {}".format(name, process.pid))
+    SCHEDULER.every(2.0, check_line_processes, 'line_processes')
+
+
+def check_line_processes():
+    for name, process in list(LINE_PROCESSES.items()):
+        if not process.is_alive():
+            l.error("Line {!r}: process ended unexpectedly, exit code {}".format(name, process.exitcode))
+            del LINE_PROCESSES[name]
+
+
+def exit_line_processes():
+    if LINE_PROCESSES_STOP:
+        LINE_PROCESSES_STOP.set()
+    for name, process in LINE_PROCESSES.items():
+        process.join(5)
+        if process.is_alive():
+            l.warning("Line {!r}: process didn't stop, terminated".format(name))
+            process.terminate()
+    LINE_PROCESSES.clear()
+
+
+def run_line_process(name:str, cfg:dict, log_queue, log_level:int, stats_file:str, stop):
+    """
+    Main function of a worker process hosting the line name alone, as its
+    default line. Logs to log_queue, runs until stop is set.
+    """
+    logger = logging.getLogger("piTelex")
+    logger.setLevel(log_level)
+    handler = logging.handlers.QueueHandler(log_queue)
+    def tag(record):
+        record.name += '[' + name + ']'
+        return True
+    handler.addFilter(tag)
+    logger.handlers[:] = [handler]
+
+    txConfig.CFG = cfg
+    txStats.ENABLED = cfg.get('stats', True)
+    txStats.FILENAME = stats_file
+    txStall.start(cfg)
+    LINE.name = name
+    LINE.prefix = name + '/'
+
+    try:
+        init_line(LINE, cfg)
+        init_devices(LINE)
+        init_supervisor()
+        txAsync.start_background_loop(LINE.devices)
+        main_loop_event(stop)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        exit()
 
 # =====
 
 def main():
+    global RECORDER
+
     txConfig.load()
 
     LOGLVL = { 'NOTSET' : 0 , 'DEBUG' : 10 , 'INFO' : 20 , 'WARN' : 30 , 'ERROR' : 40 , 'CRITICAL' : 50 }
@@ -367,45 +833,90 @@ def main():
 
     init_error_log(errorlog_path,loglvl)
 
+    txStats.ENABLED = txConfig.CFG.get('stats', True)
+    stats_file = txConfig.CFG.get('stats_file', os.path.join(errorlog_path, 'piTelex-stats.txt'))
+    if not os.path.isabs(stats_file):
+        stats_file = os.path.join(OUR_PATH, stats_file)
+    txStats.FILENAME = stats_file
+    txStats.install_signal_handler()
+    txStall.start(txConfig.CFG)
+
     #test()   # for debug only
     init()
 
+    record_file = txConfig.CFG.get('record', None)
+    if record_file:
+        if not os.path.isabs(record_file):
+            record_file = os.path.join(OUR_PATH, record_file)
+        RECORDER = txRecorder.Recorder(record_file, [line.prefix + device.id for line in LINES for device in line.devices])
+        SCHEDULER.every(1.0, RECORDER.flush, 'recorder')
+        l.info("Recording bus traffic to {!r}".format(record_file))
+
     print('\n\033[0;30;47m -=TELEX=- \033[0m\n')
 
-    time_2Hz = time.monotonic()
-    time_20Hz = time.monotonic()
-    time_200Hz = time.monotonic()
-    sleep_time = 0.001
+    main_loop = txConfig.CFG.get('main_loop', 'event')
 
+    devices = [device for line in LINES for device in line.devices]
     try:
-        while True:
-            time_act = int(time.monotonic() * 1000)   # time in ms
+        if main_loop == 'asyncio':
+            txAsync.Runtime(devices, process_lines, SCHEDULER).run()
+        else:
+            # asynchronous device modules get an event loop of their own
+            txAsync.start_background_loop(devices)
+            if main_loop == 'poll':
+                main_loop_poll()
+            else:
+                if main_loop != 'event':
+                    l.warning("Unknown main loop {!r}, using 'event'".format(main_loop))
+                main_loop_event()
 
-            new_data = process_data()
-            if new_data:
-                sleep_time = 0.0001
+    except (KeyboardInterrupt, SystemExit):
+        l.info('Exit by Keyboard')
 
-            if (time_act - time_200Hz) >= 5:
-                time_200Hz = time_act
-                process_idle()
+    finally:
+        exit()
 
-                if (time_act - time_20Hz) >= 50:
-                    time_20Hz = time_act
-                    process_idle20Hz()
+# -----
 
-                    if (time_act - time_2Hz) >= 500:
-                        time_2Hz = time_act
-                        process_idle2Hz()
+def main_loop_poll(stop:threading.Event=None):
+    """
+    Legacy main loop: poll all devices and sleep between 0.1 ms and 10 ms,
+    depending on traffic. Runs until stop is set, if given.
+    """
+    sleep_time = 0.001
 
-            time.sleep(sleep_time)   # update with max ??? Hz
-            if sleep_time < 0.010:
-                sleep_time += 0.0001
+    while not (stop and stop.is_set()):
+        new_data = process_lines()
+        if new_data:
+            sleep_time = 0.0001
 
-    except (KeyboardInterrupt, SystemExit):
-        l.info('Exit by Keyboard')
+        SCHEDULER.run_due()
 
-    finally:
-        exit()
+        time.sleep(sleep_time)   # update with max ??? Hz
+        if sleep_time < 0.010:
+            sleep_time += 0.0001
+
+# -----
+
+def main_loop_event(stop:threading.Event=None):
+    """
+    Wakeup-driven main loop: process data as long as there is any, otherwise
+    block until a device signals new data (see TelexBase.notify) or the next
+    scheduled callback is due. Runs until stop is set, if given (set WAKEUP
+    as well to end it without delay).
+    """
+    while not (stop and stop.is_set()):
+        # Clear before reading so that data queued meanwhile wakes us again
+        WAKEUP.clear()
+
+        new_data = process_lines()
+
+        if SCHEDULER.run_due():
+            # callbacks may have queued data; read it without delay
+            new_data = True
+
+        if not new_data:
+            WAKEUP.wait(SCHEDULER.next_deadline() - time.monotonic())
 
 # =====
 
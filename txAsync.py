@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+"""
+Telex asyncio Runtime - run the piTelex main loop and asynchronous device
+modules on an asyncio event loop
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import asyncio
+import time
+from threading import Thread
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+import txBase
+import txMessage
+
+#######
+
+class AsyncWakeup:
+    '''
+    Wakeup event for the asyncio main loop. Looks like threading.Event to
+    TelexBase.notify, so it may be set from any thread.
+    '''
+    def __init__(self, loop):
+        self._loop = loop
+        self.event = asyncio.Event()
+
+    def set(self):
+        try:
+            self._loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # loop already closed (exit)
+            pass
+
+    def clear(self):
+        self.event.clear()
+
+#######
+
+class AsyncTelexBase(txBase.TelexBase):
+    '''
+    Base class for device modules doing their I/O in coroutines instead of
+    threads. Override run(), put received data by put_rx(); read(),
+    read_many(), write() and the idle methods are called by the main loop as
+    for every other device, on the event loop's thread if the main loop is
+    "asyncio".
+    '''
+    def __init__(self):
+        super().__init__()
+        self._rx_buffer = txBase.RingBuffer()
+        self.loop = None
+        self._task = None
+
+
+    def read(self) -> str:
+        if self._rx_buffer:
+            return self._rx_buffer.popleft()
+
+    def read_many(self) -> str:
+        return self.pop_many(self._rx_buffer)
+
+
+    def exit(self):
+        if self._task:
+            self._task.cancel()
+
+    # =====
+
+    async def run(self):
+        ''' the device's main coroutine, started by the runtime '''
+        pass
+
+    # -----
+
+    def start(self, loop):
+        ''' called by system to start run() on loop '''
+        self.loop = loop
+        self._task = asyncio.run_coroutine_threadsafe(self._run_guarded(), loop)
+
+    async def _run_guarded(self):
+        try:
+            await self.run()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            l.warning("Uncaught Exception in {}.run(): {!r}".format(self.id, e))
+
+    # -----
+
+    def put_rx(self, data):
+        ''' queue received command (string or Message) or characters for read and wake up main loop '''
+        if txMessage.is_command(data):
+            self._rx_buffer.append(data)
+        else:
+            self._rx_buffer.extend(data)
+        self.notify()
+
+    async def run_blocking(self, func, *args):
+        ''' run a blocking function (e.g. a library call) in the executor '''
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+#######
+
+def start_devices(devices:list, loop):
+    ''' start the coroutines of all asynchronous devices on loop '''
+    for device in devices:
+        if isinstance(device, AsyncTelexBase):
+            device.start(loop)
+
+
+def start_background_loop(devices:list):
+    '''
+    Run the asynchronous devices on an event loop in a thread of its own; used
+    with the threaded main loops ("event", "poll"). Returns the loop, or None
+    if there are no asynchronous devices.
+    '''
+    if not any(isinstance(device, AsyncTelexBase) for device in devices):
+        return None
+    loop = asyncio.new_event_loop()
+    Thread(target=loop.run_forever, name='asyncio', daemon=True).start()
+    start_devices(devices, loop)
+    return loop
+
+#######
+
+class Runtime:
+    '''
+    asyncio main loop. Device modules derived from TelexBase are driven
+    unchanged by the bus coroutine through process_data and the scheduler;
+    their own threads keep running and wake up the loop via notify().
+    '''
+    def __init__(self, devices:list, process_data, scheduler):
+        self._devices = devices
+        self._process_data = process_data
+        self._scheduler = scheduler
+        self.wakeup = None
+
+
+    def run(self):
+        asyncio.run(self.main())
+
+    # =====
+
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        self.wakeup = AsyncWakeup(loop)
+        for device in self._devices:
+            device.set_wakeup(self.wakeup)
+        self._scheduler.wakeup = self.wakeup
+        start_devices(self._devices, loop)
+
+        await self.bus()
+
+    # -----
+
+    async def bus(self):
+        '''
+        process data whenever a device has signalled some, run scheduled
+        callbacks when due
+        '''
+        loop = asyncio.get_running_loop()
+        event = self.wakeup.event
+        while True:
+            event.clear()
+            new_data = self._process_data()
+            if self._scheduler.run_due():
+                # callbacks may have queued data
+                new_data = True
+
+            if new_data:
+                # give other coroutines a chance while data is flowing
+                await asyncio.sleep(0)
+                continue
+
+            timeout = self._scheduler.next_deadline() - time.monotonic()
+            if timeout > 0:
+                timer = loop.call_later(timeout, event.set)
+                await event.wait()
+                timer.cancel()
+
+#######
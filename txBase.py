@@ -9,13 +9,228 @@ __license__     = "GPL3"
 __version__     = "0.0.1"
 
 import txCode
+from txMessage import Message, URGENT, is_urgent
+
+from threading import Thread, RLock
+from collections import deque
+from itertools import islice
+from contextlib import nullcontext
+import queue
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+#######
+
+class RingBuffer(deque):
+    '''
+    FIFO buffer for bus items (characters and commands), O(1) at both ends.
+    Single append/popleft calls are atomic anyway; with locked=True, the bulk
+    methods below are atomic against each other, too.
+    '''
+    def __init__(self, items=(), locked:bool=False):
+        super().__init__(items)
+        self.lock = RLock() if locked else nullcontext()
+
+
+    def push(self, item):
+        '''
+        Queue item in the priority lane if it is urgent: a Message marked so or
+        a command string listed in txMessage.URGENT (returned as urgent
+        Message). It overtakes all items but the urgent ones queued before.
+        Other items are appended.
+        '''
+        if item.__class__ is not Message:
+            if len(item) < 2 or item[0] != '\x1b' or not item.startswith(URGENT, 1):
+                self.append(item)
+                return
+            item = Message.parse(item)
+            if item.code not in URGENT:
+                self.append(item)
+                return
+            item.urgent = True
+        elif not item.urgent:
+            self.append(item)
+            return
+        with self.lock:
+            n = 0
+            try:
+                while is_urgent(self[n]):
+                    n += 1
+            except IndexError:
+                self.append(item)
+                return
+            self.insert(n, item)
+
+
+    def push_many(self, items):
+        ''' append all items (e.g. the characters of a str) '''
+        with self.lock:
+            self.extend(items)
+
+
+    def pop_many(self, count:int) -> list:
+        ''' remove and return up to count items from the start '''
+        with self.lock:
+            count = min(count, len(self))
+            return [self.popleft() for _ in range(count)]
+
+
+    def peek(self):
+        ''' return the first item without removing it, None if empty '''
+        try:
+            return self[0]
+        except IndexError:
+            return None
+
+
+    def discard_chars(self) -> int:
+        ''' remove all characters keeping the commands, return their number '''
+        with self.lock:
+            items = [a for a in self if a.__class__ is not str or len(a) != 1]
+            n = len(self) - len(items)
+            if n:
+                self.clear()
+                self.extend(items)
+            return n
+
+
+    def pop_run(self, max_len:int=64) -> str:
+        '''
+        Remove and return the first item if it is a command (string or
+        Message), else the run of single characters (up to max_len) at the
+        start.
+        '''
+        with self.lock:
+            if not self:
+                return ''
+            a = self[0]
+            if a.__class__ is not str or len(a) != 1:
+                return self.popleft()
+            n = 0
+            for a in islice(self, max_len):
+                if a.__class__ is not str or len(a) != 1:
+                    break
+                n += 1
+            popleft = self.popleft
+            return ''.join([popleft() for _ in range(n)])
+
+#######
+
+class CommandTable:
+    '''
+    Dispatch of bus commands to the handlers of a device, filled once in its
+    __init__. Codes are given without ESC; exact codes ('A', 'ZZ', 'TP0') are
+    looked up directly, prefixes of parameterized commands ('#', '~', 'READ')
+    longest first. Commands without handler are counted in unknown.
+    '''
+    def __init__(self, owner:str='???'):
+        self.owner = owner
+        self._exact = {}
+        self._prefixes = {}   # prefix length -> {prefix: handler}
+        self._lengths = ()
+        self.unknown = {}   # code -> count
+
+
+    def add(self, codes, handler, prefix:bool=False):
+        ''' register handler for one code or a tuple of codes '''
+        if isinstance(codes, str):
+            codes = (codes,)
+        for code in codes:
+            if prefix:
+                self._prefixes.setdefault(len(code), {})[code] = handler
+            else:
+                self._exact[code] = handler
+        self._lengths = sorted(self._prefixes, reverse=True)
+
+
+    def ignore(self, codes):
+        ''' register codes to be dropped silently (not counted as unknown) '''
+        self.add(codes, _ignore)
+
+
+    def resolve(self, code:str):
+        ''' return the handler for code (without ESC), None if unknown '''
+        handler = self._exact.get(code)
+        if handler is None:
+            for length in self._lengths:
+                handler = self._prefixes[length].get(code[:length])
+                if handler:
+                    break
+        return handler
+
+
+    def dispatch(self, a, *args):
+        '''
+        Call the handler for command a (Message, '\\x1b'-prefixed string or
+        code without ESC) with a and args, return its result. Unknown commands
+        return None.
+        '''
+        if a.__class__ is Message:
+            code = a.code
+        else:
+            if a[:1] == '\x1b':
+                a = a[1:]
+            code = a
+        handler = self.resolve(code)
+        if handler is None:
+            count = self.unknown.get(code, 0) + 1
+            self.unknown[code] = count
+            if count == 1:
+                l.debug("{}: unknown command {!r}".format(self.owner, code))
+            return None
+        return handler(a, *args)
+
+
+def _ignore(a, *args):
+    pass
 
 #######
 
 class TelexBase:
+    # Wakeup event of the main loop, set by telex.init (see notify)
+    _wakeup = None
+    # Scheduler of the main loop for additional periodic or one-shot
+    # callbacks, set by telex.init (see txScheduler)
+    scheduler = None
+
+    # Bus interest, compiled into the routing table by telex.init:
+    # - bus_chars: write() gets printable characters
+    # - bus_commands: write() gets commands; True for all, False for none or a
+    #   tuple of command prefixes (without ESC), e.g. ('A', 'Z', 'WB')
+    # - bus_sources: None for all sources or a tuple of source ids
+    # - bus_messages: write() gets commands as txMessage.Message instead of
+    #   '\x1b'-prefixed strings
+    # - bus_feedbacks: write() gets the buffer feedback of the other devices
+    #   (ESC-~, ESC-^), regardless of bus_commands; coalesced to the latest
+    #   value per source by the main loop (see txFlow.Feedback)
+    bus_chars = True
+    bus_commands = True
+    bus_sources = None
+    bus_messages = False
+    bus_feedbacks = False
+
+    # Command handlers of the device (CommandTable), if it uses one
+    commands = None
+
+    # Flow control (see txFlow):
+    # - bus_window: sinks only; number of characters to accept beyond those
+    #   reported by the feedback command bus_feedback (e.g. ESC-~<n>), None
+    #   for no flow control
+    # - bus_throttle: sources only; read_many() is limited to flow_credit
+    #   characters, the smallest credit of all sinks, set by the main loop
+    bus_window = None
+    bus_feedback = '~'
+    bus_throttle = False
+    flow_credit = None
+
     def __init__(self):
         self.id = '???'
         self.loopback = True
+        # Batch capabilities, used by the main loop to pass whole strings
+        # instead of single characters (see read_many/write_many)
+        self.batch_read = type(self).read_many is not TelexBase.read_many
+        self.batch_write = type(self).write_many is not TelexBase.write_many
 
 
     def __del__(self):
@@ -30,6 +245,23 @@ class TelexBase:
     def write(self, a:str, source:str):
         pass
 
+    def read_many(self) -> str:
+        '''
+        called by system to get a single command or a run of characters;
+        devices overriding this must never mix commands and characters
+        '''
+        return self.read()
+
+    def write_many(self, text:str, source:str):
+        '''
+        called by system to output a run of characters (never a command).
+        Return None to pass text on to the following devices unchanged, else
+        the (possibly empty) part of it to pass on.
+        '''
+        passed = [a for a in text if not self.write(a, source)]
+        if len(passed) != len(text):
+            return ''.join(passed)
+
     def idle(self):
         pass
 
@@ -42,5 +274,87 @@ class TelexBase:
     def exit(self):
         pass
 
+    # =====
+
+    def set_wakeup(self, event):
+        ''' called by system to hand over the wakeup event of the main loop '''
+        self._wakeup = event
+
+    def set_scheduler(self, scheduler):
+        ''' called by system to hand over the scheduler of the main loop '''
+        self.scheduler = scheduler
+
+    def notify(self):
+        '''
+        Wake up the main loop. Must be called by device threads after new data
+        has been queued for read(), otherwise the event-driven main loop will
+        pick it up on the next idle tick only.
+        '''
+        if self._wakeup:
+            self._wakeup.set()
+
+    # -----
+
+    def pop_many(self, buffer:list, max_len:int=64) -> str:
+        '''
+        Remove and return the first item of buffer if it is a command, else
+        the run of single characters (up to max_len) at the start of buffer.
+        Helper for read_many implementations; honours flow_credit, so
+        throttled sources return commands only.
+        '''
+        if self.flow_credit is not None and self.flow_credit < max_len:
+            max_len = max(self.flow_credit, 0)
+        if isinstance(buffer, RingBuffer):
+            return buffer.pop_run(max_len)
+        if not buffer:
+            return ''
+        if buffer[0].__class__ is not str or len(buffer[0]) != 1:
+            return buffer.pop(0)
+        n = 0
+        for a in buffer[:max_len]:
+            if a.__class__ is not str or len(a) != 1:
+                break
+            n += 1
+        text = ''.join(buffer[:n])
+        del buffer[:n]
+        return text
+
 #######
 
+# Stop sentinel for QueueConsumer
+STOP = object()
+
+class QueueConsumer:
+    '''
+    Thread handing the items of a blocking queue to handler, one by one. Use
+    this in service modules instead of polling a queue; the thread sleeps
+    until an item arrives. stop() ends the thread after the items queued so
+    far have been handled.
+    '''
+    def __init__(self, handler, name:str, q:queue.Queue=None):
+        self.q = q if q is not None else queue.Queue()
+        self._handler = handler
+        self._thread = Thread(target=self.thread_function, name=name, daemon=True)
+        self._thread.start()
+
+
+    def put(self, item):
+        self.q.put(item)
+
+
+    def stop(self, timeout:float=None):
+        self.q.put(STOP)
+        self._thread.join(timeout)
+
+
+    def thread_function(self):
+        while True:
+            item = self.q.get()
+            if item is STOP:
+                break
+            try:
+                self._handler(item)
+            except Exception as e:
+                l.warning("Uncaught Exception in {}: {!r}".format(self._thread.name, e))
+
+#######
@@ -83,6 +83,27 @@ class CLI():
                     if dev['enable']:
                         ans += '\r\n{}: {}'.format(name, dev['type'])
 
+        elif cmd == 'STATS':
+            import txStats
+            txStats.dump()
+            ans = 'SAVED'
+            for name, p99 in txStats.slowest():
+                ans += '\r\n{} P99 {:.0f} US'.format(name.upper().replace('_', ' '), p99)
+            import txSupervisor
+            restarts = txSupervisor.SUPERVISOR.restarts()
+            if restarts:
+                ans += '\r\n{} THREAD RESTARTS'.format(restarts)
+
+        elif cmd == 'STALLS':
+            import txStall
+            if txStall.DETECTOR:
+                stats = txStall.DETECTOR.stats()
+                ans = '{} STALLS OVER {:.1f} S'.format(stats['stalls'], stats['threshold'])
+                for stall in stats['recent'][-3:]:
+                    ans += '\r\n{} {} {:.1f} S'.format(stall['time'][11:16], stall['call'].upper().replace('_', ' '), stall['duration'])
+            else:
+                ans = 'OFF'
+
         elif cmd == 'EXIT':
             return 'BYE\r\n'   # magic word to exit CLI
 
@@ -9,6 +9,7 @@ __copyright__   = "Copyright 2020, JK"
 __license__     = "GPL3"
 __version__     = "0.1.0"
 
+import re
 import time
 import unicodedata
 #from unidecode import unidecode
@@ -18,6 +19,19 @@ l = logging.getLogger("piTelex." + __name__)
 
 #######
 
+class _TTYTextTable(dict):
+    '''
+    str.translate table of ascii_to_tty_text: code point -> text. Filled with
+    ASCII and the Latin letters at import; other characters are added when
+    met first (see BaudotMurrayCode._tty_text_char).
+    '''
+    def __missing__(self, key:int) -> str:
+        a = BaudotMurrayCode._tty_text_char(chr(key))
+        self[key] = a
+        return a
+
+#######
+
 class BaudotMurrayCode:
     # Baudot-Murray-Code to ASCII table
     _LUT_BM2A_ITA2 = (
@@ -85,6 +99,18 @@ class BaudotMurrayCode:
     CODING_MKT2 = 2
     CODING_ZUSE = 3
 
+    # ASCII to Baudot-Murray-Code tables per coding and flip_bits (see
+    # _build_A2BM), built on first use
+    _LUT_A2BM_cache = {}
+    # Tables of the bulk codec per coding (see _build_bulk), built on first use
+    _LUT_bulk_cache = {}
+    # str.translate table of ascii_to_tty_text, see _TTYTextTable
+    _LUT_tty_text = None
+
+    # bytes.translate table reversing the 5 data bits of each code (see
+    # do_flip_bits); bits above are dropped
+    _LUT_flip = bytes.maketrans(bytes(range(256)), bytes(int('{:05b}'.format(b & 0x1F)[::-1], 2) for b in range(256)))
+
     # =====
 
     @staticmethod
@@ -101,49 +127,111 @@ class BaudotMurrayCode:
         Ensure that text is an iterable containing already-decoded Python
         strings, not bytes.
         """
-        ret = ''
-
         text = text.upper()
 
-        for a in text:
-            try:
-                if a not in BaudotMurrayCode._valid_ASCII_convert_chars:
-                    if a in BaudotMurrayCode._LUT_convert_chars:
-                        a = BaudotMurrayCode._LUT_convert_chars.get(a, '?')
-                    else:
-                        nkfd_norm = unicodedata.normalize('NFKD', a)
-                        a =  u"".join([c for c in nkfd_norm if not unicodedata.combining(c)])
-                        #a = unicodedata.normalize('NFD', a).encode('ascii', 'ignore')
-                        #a = unidecode(a)
-                        if a not in BaudotMurrayCode._valid_ASCII_convert_chars:
-                            a = '?'
-                ret += a
-            except:
-                pass
+        if not isinstance(text, str):
+            return ''
 
-        return ret
+        return text.translate(BaudotMurrayCode._LUT_tty_text)
+
+    # -----
+
+    @staticmethod
+    def _tty_text_char(a:str) -> str:
+        """
+        Return the text for character a (upper case) of ascii_to_tty_text:
+        a itself if valid, its replacement from _LUT_convert_chars, a without
+        accents if that is valid, or '?'.
+        """
+        try:
+            if a not in BaudotMurrayCode._valid_ASCII_convert_chars:
+                if a in BaudotMurrayCode._LUT_convert_chars:
+                    a = BaudotMurrayCode._LUT_convert_chars.get(a, '?')
+                else:
+                    nkfd_norm = unicodedata.normalize('NFKD', a)
+                    a =  u"".join([c for c in nkfd_norm if not unicodedata.combining(c)])
+                    #a = unicodedata.normalize('NFD', a).encode('ascii', 'ignore')
+                    #a = unidecode(a)
+                    if a not in BaudotMurrayCode._valid_ASCII_convert_chars:
+                        a = '?'
+            return a
+        except:
+            return ''
 
     # -----
 
     @staticmethod
     def do_flip_bits(code: bytes) -> bytes:
-        ret = bytearray()
+        ''' reverse the 5 data bits of each code, return a bytearray '''
+        return bytearray(code).translate(BaudotMurrayCode._LUT_flip)
 
-        for b in code:
-            rb = 0
-            if b & 1:
-                rb |= 16
-            if b & 2:
-                rb |= 8
-            if b & 4:
-                rb |= 4
-            if b & 8:
-                rb |= 2
-            if b & 16:
-                rb |= 1
-            ret.append(rb)
+    # -----
 
-        return ret
+    @staticmethod
+    def _build_A2BM(LUT_BM2A:tuple, LUT_BMsw:tuple, flip_bits:bool=False) -> tuple:
+        '''
+        Build the reverse tables of LUT_BM2A: one dict per mode, mapping each
+        character to the codes to send for it in this mode (preceded by a mode
+        switch code if it is found in another layer only) and the mode after
+        it. Layers are searched from the current one on, wrapping around (the
+        third layer of MKT2 follows FIGS); explicit switch codes ('<', '>',
+        '°' in MKT2) change the mode, too. With flip_bits, the codes are bit
+        reversed already.
+        '''
+        chars = set(''.join(LUT_BM2A))
+        tables = []
+        for mode in range(len(LUT_BM2A)):
+            table = {}
+            for a in chars:
+                if a in LUT_BM2A[mode]:
+                    b = LUT_BM2A[mode].index(a)
+                    table[a] = (bytes((b,)), LUT_BMsw.index(b) if b in LUT_BMsw else mode)
+                    continue
+                nm = mode
+                for _ in range(2):
+                    nm = (nm + 1) % len(LUT_BM2A)
+                    if a in LUT_BM2A[nm]:
+                        table[a] = (bytes((LUT_BMsw[nm], LUT_BM2A[nm].index(a))), nm)
+                        break
+            if flip_bits:
+                table = {a: (codes.translate(BaudotMurrayCode._LUT_flip), new_mode) for a, (codes, new_mode) in table.items()}
+            tables.append(table)
+        return tuple(tables)
+
+    # -----
+
+    @staticmethod
+    def _build_bulk(LUT_BM2A:tuple, LUT_BMsw:tuple, LUT_A2BM:tuple) -> tuple:
+        '''
+        Build the tables of encodeA2BM_bulk and decodeBM2A_bulk:
+        - per mode, a str.translate table of the characters staying in this
+          mode (to their code as character) and a regex finding the others
+        - per mode (and None), a str.translate table of all 256 byte values
+          (as latin-1 characters) to their text, as decodeBM2A prints them
+        - a bytes regex splitting code at the mode switch codes
+        '''
+        stay = []
+        breaks = []
+        for table in LUT_A2BM:
+            mode = len(stay)
+            chars = {a: codes[0] for a, (codes, new_mode) in table.items() if new_mode == mode and len(codes) == 1}
+            stay.append({ord(a): chr(b) for a, b in chars.items()})
+            breaks.append(re.compile('[^' + re.escape(''.join(chars)) + ']'))
+
+        unknown = ['{?#' + hex(b)[2:] + '}' for b in range(256)]
+        decode = {None: {b: '{?' + LUT_BM2A[0][b] + LUT_BM2A[1][b] + '}' if b < 0x20 else unknown[b] for b in range(256)}}
+        for mode, lut in enumerate(LUT_BM2A):
+            decode[mode] = {b: lut[b] if b < 0x20 else unknown[b] for b in range(256)}
+
+        split = re.compile(b'([' + re.escape(bytes(LUT_BMsw)) + b'])')
+        return tuple(stay), tuple(breaks), decode, split
+
+    def _bulk(self) -> tuple:
+        key = (self._LUT_BM2A, self._LUT_BMsw, bool(self._flip_bits))
+        bulk = self._LUT_bulk_cache.get(key)
+        if bulk is None:
+            bulk = self._LUT_bulk_cache[key] = self._build_bulk(self._LUT_BM2A, self._LUT_BMsw, self._LUT_A2BM)
+        return bulk
 
     # =====
 
@@ -167,6 +255,14 @@ class BaudotMurrayCode:
         else:
             self._LUT_BM2A = self._LUT_BM2A_ITA2
             self._LUT_BMsw = self._LUT_BMsw_ITA2
+        key = (self._LUT_BM2A, self._LUT_BMsw, bool(flip_bits))
+        self._LUT_A2BM = self._LUT_A2BM_cache.get(key)
+        if self._LUT_A2BM is None:
+            self._LUT_A2BM = self._LUT_A2BM_cache[key] = self._build_A2BM(*key)
+        # LTRS sent before the first character, bit reversed like the tables
+        self._BM_LTRS = bytes((self._LUT_BMsw[0],))
+        if flip_bits:
+            self._BM_LTRS = self._BM_LTRS.translate(self._LUT_flip)
 
     # -----
 
@@ -186,40 +282,21 @@ class BaudotMurrayCode:
 
         if self._mode is None:
             self._mode = 0  # letters
-            ret.append(self._LUT_BMsw[self._mode])
+            ret += self._BM_LTRS
 
+        # the tables hold bit reversed codes already if flip_bits is set
+        tables = self._LUT_A2BM
+        mode = self._mode
+        table = tables[mode]
         for a in ascii:
-            try:  # symbol in current layer?
-                nm = self._mode
-                b = self._LUT_BM2A[nm].index(a)
-                ret.append(b)
-                if b in self._LUT_BMsw:  # explicit Bu or Zi
-                    self._mode = self._LUT_BMsw.index(b)
-            except ValueError:
-                try:  # symbol in other layer?
-                    nm += 1
-                    if nm >= len(self._LUT_BM2A):
-                        nm = 0
-                    b = self._LUT_BM2A[nm].index(a)
-                    ret.append(self._LUT_BMsw[nm])
-                    ret.append(b)
-                    self._mode = nm
-                except ValueError:
-                    try:  # symbol in other layer?
-                        nm += 1
-                        if nm >= len(self._LUT_BM2A):
-                            nm = 0
-                        b = self._LUT_BM2A[nm].index(a)
-                        ret.append(self._LUT_BMsw[nm])
-                        ret.append(b)
-                        self._mode = nm
-                    except:  # symbol not found -> ignore
-                        pass
-            except:  # unknown -> ignore
-                pass
-
-        if ret and self._flip_bits:
-            ret = self.do_flip_bits(ret)
+            entry = table.get(a)
+            if entry is None:   # unknown -> ignore
+                continue
+            ret += entry[0]
+            if entry[1] != mode:
+                mode = entry[1]
+                table = tables[mode]
+        self._mode = mode
 
         if self._loop_back:
             length  = len(ret)
@@ -233,6 +310,47 @@ class BaudotMurrayCode:
 
     # -----
 
+    def encodeA2BM_bulk(self, ascii:str) -> bytes:
+        '''
+        convert a whole ASCII text (e.g. a file) like encodeA2BM: the runs of
+        characters not changing the mode are converted by str.translate
+        '''
+        if self._loop_back:
+            return self.encodeA2BM(ascii)
+
+        stay, breaks, _, _ = self._bulk()
+        tables = self._LUT_A2BM
+        ret = []
+
+        if not isinstance(ascii, str):
+            ascii = str(ascii)
+
+        ascii = ascii.upper()
+
+        if self._mode is None:
+            self._mode = 0  # letters
+            ret.append(self._BM_LTRS.decode('latin-1'))
+
+        mode = self._mode
+        pos = 0
+        while True:
+            m = breaks[mode].search(ascii, pos)
+            end = m.start() if m else len(ascii)
+            if end > pos:
+                ret.append(ascii[pos:end].translate(stay[mode]))
+            if not m:
+                break
+            entry = tables[mode].get(ascii[end])
+            if entry:   # else unknown -> ignore
+                ret.append(entry[0].decode('latin-1'))
+                mode = entry[1]
+            pos = end + 1
+        self._mode = mode
+
+        return bytearray(''.join(ret), 'latin-1')
+
+    # -----
+
     def decodeBM2A(self, code:bytes) -> str:
         ''' convert a list/bytearray of baudot-murray-coded bytes to an ASCII string '''
         ret = ''
@@ -274,4 +392,40 @@ class BaudotMurrayCode:
 
         return ret
 
+    # -----
+
+    def decodeBM2A_bulk(self, code:bytes) -> str:
+        '''
+        convert whole baudot-murray-coded data (e.g. a punch tape file) like
+        decodeBM2A: the runs between mode switch codes are converted by
+        str.translate
+        '''
+        if self._loop_back:
+            return self.decodeBM2A(code)
+
+        _, _, decode, split = self._bulk()
+
+        code = bytes(code)
+        if self._flip_bits:
+            code = code.translate(self._LUT_flip)
+
+        parts = split.split(code)
+        ret = [parts[0].decode('latin-1').translate(decode[self._mode])]
+        for n in range(1, len(parts), 2):
+            b = parts[n][0]
+            self._mode = self._LUT_BMsw.index(b)
+            if self._show_BuZi > 1:   # else no or explicit BuZi only
+                ret.append(self._LUT_BM2A[self._mode][b])
+            if parts[n+1]:
+                ret.append(parts[n+1].decode('latin-1').translate(decode[self._mode]))
+
+        return ''.join(ret)
+
+#######
+
+BaudotMurrayCode._LUT_tty_text = _TTYTextTable()
+for _code in range(0x250):   # up to Latin Extended-B
+    BaudotMurrayCode._LUT_tty_text[_code]
+del _code
+
 #######
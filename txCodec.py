@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+"""
+Telex Codecs - the Baudot-Murray-Code codings of txCode as Python codecs,
+registered on import:
+
+    'ita2', 'ita2-us', 'mkt2', 'zuse'
+
+and the same with suffix '-flipped' for bit reversed codes (i-Telex, .ls
+punch tapes). Encoding and decoding work like BaudotMurrayCode.encodeA2BM
+and decodeBM2A: text is converted to upper case, LTRS is sent first, mode
+switch codes are decoded as '<' and '>'. The incremental encoders and
+decoders (used by io.TextIOWrapper and codecs.iterdecode) keep the mode
+between chunks.
+
+Error handler 'telex' gives the results of today's conversion: bytes
+beyond the 5 data bits are decoded as '{?#xx}', characters not in the
+coding are dropped.
+
+    import txCodec
+    data = 'RYRY 1234'.encode('ita2')
+    text = data.decode('ita2', 'telex')
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import codecs
+import re
+
+import txCode
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+BMC = txCode.BaudotMurrayCode
+
+CODINGS = {
+    'ita2': BMC.CODING_ITA2,
+    'ita2-us': BMC.CODING_US,
+    'mkt2': BMC.CODING_MKT2,
+    'zuse': BMC.CODING_ZUSE,
+    }
+
+# Bytes beyond the 5 data bits (not flipped codings only)
+_invalid_bytes = re.compile(b'[\x20-\xff]+')
+
+#######
+
+def telex_errors(exc):
+    '''
+    Error handler 'telex': decode invalid bytes as '{?#xx}' (hex), drop
+    characters not in the coding, as BaudotMurrayCode does
+    '''
+    if isinstance(exc, UnicodeDecodeError):
+        return ''.join('{?#' + hex(b)[2:] + '}' for b in exc.object[exc.start:exc.end]), exc.end
+    if isinstance(exc, UnicodeEncodeError):
+        return '', exc.end
+    raise exc
+
+codecs.register_error('telex', telex_errors)
+
+#######
+
+class _Converter:
+    '''
+    Stateful conversion of one codec: a BaudotMurrayCode for the coding and
+    the handling of errors, shared by its stateless and incremental classes
+    '''
+    name = None
+    coding = BMC.CODING_ITA2
+    flip_bits = False
+
+    def __init__(self):
+        self.mc = BMC(coding=self.coding, flip_bits=self.flip_bits)
+        chars = ''.join(set(''.join(self.mc._LUT_BM2A)))
+        self._unknown_chars = re.compile('[^' + re.escape(chars) + ']+')
+
+
+    def encode(self, text:str, errors:str) -> bytes:
+        ''' LTRS is sent before the first character, not for empty text '''
+        if not text:
+            return b''
+        text = text.upper()
+        if errors in ('telex', 'ignore'):
+            return bytes(self.mc.encodeA2BM_bulk(text))
+
+        ret = []
+        pos = 0
+        while True:
+            m = self._unknown_chars.search(text, pos)
+            end = m.start() if m else len(text)
+            if end > pos:
+                ret.append(self.mc.encodeA2BM_bulk(text[pos:end]))
+            if not m:
+                break
+            exc = UnicodeEncodeError(self.name, text, m.start(), m.end(), 'character not in coding')
+            replacement, pos = codecs.lookup_error(errors)(exc)
+            if pos < 0:
+                pos += len(text)
+            if isinstance(replacement, str):
+                replacement = self.mc.encodeA2BM_bulk(replacement.upper())
+            ret.append(replacement)
+        return b''.join(ret)
+
+
+    def decode(self, data:bytes, errors:str) -> str:
+        data = bytes(data)
+        if self.flip_bits or errors == 'telex':
+            return self.mc.decodeBM2A_bulk(data)
+
+        ret = []
+        pos = 0
+        while True:
+            m = _invalid_bytes.search(data, pos)
+            end = m.start() if m else len(data)
+            if end > pos:
+                ret.append(self.mc.decodeBM2A_bulk(data[pos:end]))
+            if not m:
+                break
+            exc = UnicodeDecodeError(self.name, data, m.start(), m.end(), 'byte beyond 5 data bits')
+            replacement, pos = codecs.lookup_error(errors)(exc)
+            if pos < 0:
+                pos += len(data)
+            ret.append(replacement)
+        return ''.join(ret)
+
+    # -----
+
+    def getstate(self) -> int:
+        ''' mode + 1, 0 for no mode yet '''
+        return 0 if self.mc._mode is None else self.mc._mode + 1
+
+
+    def setstate(self, state:int):
+        self.mc._mode = None if not state else state - 1
+
+# =====
+
+class _Codec(codecs.Codec):
+    def encode(self, input:str, errors:str='strict'):
+        return self.converter().encode(input, errors), len(input)
+
+    def decode(self, input:bytes, errors:str='strict'):
+        return self.converter().decode(input, errors), len(input)
+
+
+class _IncrementalEncoder(codecs.IncrementalEncoder):
+    def __init__(self, errors:str='strict'):
+        super().__init__(errors)
+        self._converter = self.converter()
+
+    def encode(self, input:str, final:bool=False) -> bytes:
+        return self._converter.encode(input, self.errors)
+
+    def reset(self):
+        self._converter.setstate(0)
+
+    def getstate(self) -> int:
+        return self._converter.getstate()
+
+    def setstate(self, state:int):
+        self._converter.setstate(state)
+
+
+class _IncrementalDecoder(codecs.IncrementalDecoder):
+    def __init__(self, errors:str='strict'):
+        super().__init__(errors)
+        self._converter = self.converter()
+
+    def decode(self, input:bytes, final:bool=False) -> str:
+        return self._converter.decode(input, self.errors)
+
+    def reset(self):
+        self._converter.setstate(0)
+
+    def getstate(self) -> tuple:
+        return b'', self._converter.getstate()
+
+    def setstate(self, state:tuple):
+        self._converter.setstate(state[1])
+
+
+class _StreamWriter(_Codec, codecs.StreamWriter):
+    def __init__(self, stream, errors:str='strict'):
+        super().__init__(stream, errors)
+        self._converter = self.converter()
+
+    def encode(self, input:str, errors:str='strict'):
+        return self._converter.encode(input, errors), len(input)
+
+    def reset(self):
+        self._converter.setstate(0)
+
+
+class _StreamReader(_Codec, codecs.StreamReader):
+    def __init__(self, stream, errors:str='strict'):
+        super().__init__(stream, errors)
+        self._converter = self.converter()
+
+    def decode(self, input:bytes, errors:str='strict'):
+        return self._converter.decode(input, errors), len(input)
+
+    def reset(self):
+        super().reset()
+        self._converter.setstate(0)
+
+#######
+
+def codec_info(name:str) -> codecs.CodecInfo:
+    ''' build the CodecInfo of name, e.g. 'ita2-us' or 'ita2-flipped' '''
+    flip_bits = name.endswith('-flipped')
+    coding = CODINGS[name[:-len('-flipped')] if flip_bits else name]
+    converter = type('Converter', (_Converter,), {'name': name, 'coding': coding, 'flip_bits': flip_bits})
+    classes = {n: type(n, (base,), {'converter': converter}) for n, base in (
+        ('Codec', _Codec),
+        ('IncrementalEncoder', _IncrementalEncoder),
+        ('IncrementalDecoder', _IncrementalDecoder),
+        ('StreamWriter', _StreamWriter),
+        ('StreamReader', _StreamReader),
+        )}
+    codec = classes['Codec']()
+    return codecs.CodecInfo(
+        name = name,
+        encode = codec.encode,
+        decode = codec.decode,
+        incrementalencoder = classes['IncrementalEncoder'],
+        incrementaldecoder = classes['IncrementalDecoder'],
+        streamwriter = classes['StreamWriter'],
+        streamreader = classes['StreamReader'],
+        )
+
+
+_NAMES = {}
+for _name in CODINGS:
+    for _name in (_name, _name + '-flipped'):
+        _NAMES[_name.replace('-', '_')] = _name
+del _name
+
+def search(name:str):
+    ''' codec search function, names normalized by codecs ('ita2_us') '''
+    name = _NAMES.get(name.lower().replace('-', '_').replace(' ', '_'))
+    if name:
+        return codec_info(name)
+
+codecs.register(search)
+
+#######
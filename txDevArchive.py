@@ -8,11 +8,13 @@ __license__     = "GPL3"
 import datetime
 import os
 import re
+from threading import Lock
 
 import logging
 l = logging.getLogger("piTelex." + __name__)
 
 import txBase
+import txMessage
 
 # ASCII shifts (called "direction shifts" from here on out) for tagging
 # inbound/outbound text
@@ -23,7 +25,54 @@ OUTBOUND = "\x0f" # SO
 ANSI_RED_FOREGROUND = "\x1b[31m"
 ANSI_RESET = "\x1b[0m"
 
+# Threads writing the archive files, one per archive path, shared by the
+# archive devices of all lines of the process (see writer): path ->
+# [consumer, number of devices using it]
+_writers = {}
+_writers_lock = Lock()
+
+def writer(path:str) -> txBase.QueueConsumer:
+    """
+    Return the thread writing files to path, start it on first use.
+    Each call must be paired with a call of release_writer.
+    """
+    with _writers_lock:
+        entry = _writers.get(path)
+        if entry is None:
+            entry = _writers[path] = [txBase.QueueConsumer(write_file, 'Archive_Writer'), 0]
+        entry[1] += 1
+        return entry[0]
+
+def release_writer(path:str):
+    """
+    Stop the thread writing files to path after the files queued so far
+    have been written, if no other archive device uses it anymore.
+    """
+    with _writers_lock:
+        entry = _writers.get(path)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        del _writers[path]
+    entry[0].stop(5)
+
+def write_file(item):
+    """
+    Write item (file name, message) to file.
+    """
+    filename, msg = item
+    try:
+        with open(filename, mode="w", encoding="utf-8", newline="") as f:
+            f.write(msg)
+    except OSError as e:
+        l.error("OS error while trying to write file: {!s}".format(e))
+
 class TelexArchive(txBase.TelexBase):
+    bus_commands = ('WB', '#', 'A', 'Z')
+    bus_messages = True
+
     def __init__(self, **params):
         super().__init__()
 
@@ -46,6 +95,14 @@ class TelexArchive(txBase.TelexBase):
         # Time when connection was made
         self._timestamp = None
 
+        self.commands = txBase.CommandTable(self.id)
+        self.commands.add("WB", self._cmd_dial)
+        self.commands.add("#", self._cmd_number, prefix=True)
+        self.commands.add("A", self._cmd_start)
+        self.commands.add("Z", self._cmd_stop)
+        # delivered by the prefixes of bus_commands, but of no interest
+        self.commands.ignore(("AA", "AT", "ZZ"))
+
         # The subdirectory to place archive files in is read from
         # configuration. Relative paths are taken relative to where piTelex
         # scripts are stored; absolute paths are just that.
@@ -60,13 +117,17 @@ class TelexArchive(txBase.TelexBase):
         except FileExistsError:
             pass
         l.info("Archiving in {!r}".format(self.arclog_path))
+        self._writer = writer(self.arclog_path)
 
     def __del__(self):
         self.exit()
         super().__del__()
 
     def exit(self):
-        pass
+        # Release the writer (once, exit is called by __del__ again)
+        if getattr(self, '_writer', None):
+            self._writer = None
+            release_writer(self.arclog_path)
 
     def read(self) -> str:
         return ''
@@ -76,32 +137,9 @@ class TelexArchive(txBase.TelexBase):
         telex.py main loop writes all data passing through piTelex to us by
         this method.
         """
-        if len(data) > 1:
+        if data.__class__ is txMessage.Message:
             # this is a command
-            if data == "\x1bWB":
-                # Dialling triggered
-                if self._state <= 1:
-                    # Prevent rogue WB commands from resetting us
-                    self._state = 1
-            elif data.startswith("\x1b#") and self._state == 1:
-                # Dial command: record. The number dialled last will remain
-                # (and should be the one that was successful)
-                self._dial_number = data[2:]
-            elif data == "\x1bA":
-                if self._state >= 2:
-                    l.warning("Redundant printer start command detected (ignored)")
-                    return
-                self._state = 2
-                l.info("recording new message") # TODO debug
-                self._timestamp = datetime.datetime.now()
-            elif data == "\x1bZ":
-                if self._state <= 0:
-                    l.warning("Redundant printer stop command detected (ignored)")
-                    return
-                elif self._state >= 2:
-                    self.save_msg()
-                self._direction_out = None
-                self._state = 0
+            self.commands.dispatch(data)
         else:
             # this is data
             if self._state < 1:
@@ -119,6 +157,49 @@ class TelexArchive(txBase.TelexBase):
             data = data.lower()
             self._current_msg.append(data)
 
+    def _cmd_dial(self, msg):
+        """
+        Dialling triggered
+        """
+        if self._state <= 1:
+            # Prevent rogue WB commands from resetting us
+            self._state = 1
+
+    def _cmd_number(self, msg):
+        """
+        Dial command: record. The number dialled last will remain (and should
+        be the one that was successful)
+        """
+        if self._state == 1:
+            self._dial_number = msg.payload
+
+    def _cmd_start(self, msg):
+        if self._state >= 2:
+            l.warning("Redundant printer start command detected (ignored)")
+            return
+        self._state = 2
+        l.info("recording new message") # TODO debug
+        self._timestamp = datetime.datetime.now()
+
+    def _cmd_stop(self, msg):
+        if self._state <= 0:
+            l.warning("Redundant printer stop command detected (ignored)")
+            return
+        elif self._state >= 2:
+            self.save_msg()
+        self._direction_out = None
+        self._state = 0
+
+    def write_many(self, text:str, source:str):
+        """
+        Same as write, for a run of characters.
+        """
+        if self._state < 1:
+            # printer not running -- don't save data
+            return
+        self.write(text[0], source)
+        self._current_msg.append(text[1:].lower())
+
     def filename(self, wru="[unknown]", direction="with", timestamp=None) -> str:
         """
         Return filename for an archive file.
@@ -136,6 +217,9 @@ class TelexArchive(txBase.TelexBase):
         fn["timestamp"] = timestamp.strftime("%Y-%m-%d %H.%M.%S.%f")[:-3]
 
         fn["title"] = "msg {} {}".format(direction, wru)
+        if self.params.get("line"):
+            # Multi-line operation: tell the lines apart
+            fn["title"] += " ({})".format(self.params["line"])
 
         fname = fname_orig = "{timestamp} {title}.txt".format(**fn)
         # Replace illegal characters by U+FFFD. GNU/Linux tolerates most of
@@ -268,11 +352,7 @@ class TelexArchive(txBase.TelexBase):
         self._timestamp = None
 
         l.info("saving {}, length {}".format(filename, len(msg)))
-        try:
-            with open(filename, mode="w", encoding="utf-8", newline="") as f:
-                f.write(msg)
-        except OSError as e:
-            l.error("OS error while trying to write file: {!s}".format(e))
+        self._writer.put((filename, msg))
 
         return filename
 
@@ -20,6 +20,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txMessage
 
 #def LOG(text:str, level:int=3):
 #    #log.LOG('\033[30;43m<'+text+'>\033[0m', level)
@@ -27,6 +28,9 @@ import txBase
 #######
 
 class TelexCH340TTY(txBase.TelexBase):
+    # Flow control by printer buffer feedback (ESC-~), see txFlow
+    bus_window = 50
+
     def __init__(self, **params):
         super().__init__()
 
@@ -42,8 +46,8 @@ class TelexCH340TTY(txBase.TelexBase):
         inverse_dtr = params.get('inverse_dtr', False)
         self._local_echo = params.get('loc_echo', False)
 
-        self._rx_buffer = []
-        self._tx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
+        self._tx_buffer = txBase.RingBuffer()
         self._counter_LTRS = 0
         self._counter_FIGS = 0
         self._counter_dial = 0
@@ -84,6 +88,12 @@ class TelexCH340TTY(txBase.TelexBase):
         character_duration = (bytesize + 3.0 ) / baudrate   # CH340 sends always with 2 stop bits
         self._mc = txCode.BaudotMurrayCode(self._loopback, coding=coding, character_duration=character_duration)
 
+        # init commands
+        self.commands = txBase.CommandTable(self.id)
+        self.commands.add(('A', 'AA'), self._cmd_online)
+        self.commands.add(('Z', 'ZZ'), self._cmd_offline)
+        self.commands.add('WB', self._cmd_dial)
+
         self._set_enable(False)
         self._set_online(False)
 
@@ -175,14 +185,14 @@ class TelexCH340TTY(txBase.TelexBase):
                     #    self._tx_buffer.append(a)
 
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
             return ret
 
     # -----
 
     def write(self, a:str, source:str):
         if len(a) > 1 and a[0] == '\x1b':
-            self._check_commands(a[1:])
+            self.commands.dispatch(a)
             return 
 
         if a == '#':
@@ -192,6 +202,10 @@ class TelexCH340TTY(txBase.TelexBase):
             if self._is_enabled or self._use_dedicated_line:
                 self._tx_buffer.append(a)
 
+    def write_many(self, text:str, source:str):
+        if self._is_enabled or self._use_dedicated_line:
+            self._tx_buffer.extend(text.replace('#', '@'))   # ask teletype for hardware ID
+
     # =====
 
     def idle(self):
@@ -200,7 +214,7 @@ class TelexCH340TTY(txBase.TelexBase):
                 aa = []
                 a = None
                 while a != '@' and self._tx_buffer:
-                    a = self._tx_buffer.pop(0)
+                    a = self._tx_buffer.popleft()
                     aa.append(a)
                     if a == '@':
                         # WRU received: lock sending until after 21 character's
@@ -209,10 +223,10 @@ class TelexCH340TTY(txBase.TelexBase):
                         self._time_tx_lock = time.monotonic() + 7.5*21/self._baudrate
 
                 aa = ''.join(aa)
-                self._tx_buffer = []
+                self._tx_buffer.clear()
                 bb = self._mc.encodeA2BM(aa)
                 if bb:
-                    self._rx_buffer.append('\x1b~' + str(self._tty.out_waiting + len(bb)))
+                    self._rx_buffer.push(txMessage.Message('~', self._tty.out_waiting + len(bb)))
                     # Force-update last out_waiting value to trigger idle2Hz update
                     self._last_out_waiting += len(bb)
                     self._tty.write(bb)
@@ -237,7 +251,7 @@ class TelexCH340TTY(txBase.TelexBase):
                 if self._cts_counter == 10:   # 0.5sec
                     self._cts_stable = cts
                     if not cts:   # rxd=Low
-                        self._rx_buffer.append('\x1bST')
+                        self._rx_buffer.push('\x1bST')
                         pass
                     elif not self._is_enabled:   # rxd=High
                         self._rx_buffer.append('\x1bAT')
@@ -252,7 +266,7 @@ class TelexCH340TTY(txBase.TelexBase):
         # send printer FIFO info
         out_waiting = self._tty.out_waiting
         if out_waiting != self._last_out_waiting:
-            self._rx_buffer.append('\x1b~' + str(out_waiting))
+            self._rx_buffer.push(txMessage.Message('~', out_waiting))
             self._last_out_waiting = out_waiting
 
     # -----
@@ -298,7 +312,7 @@ class TelexCH340TTY(txBase.TelexBase):
             if a == '<':
                 self._counter_LTRS += 1
                 if self._counter_LTRS == 5:
-                    self._rx_buffer.append('\x1bST')
+                    self._rx_buffer.push('\x1bST')
             else:
                 self._counter_LTRS = 0
 
@@ -311,36 +325,29 @@ class TelexCH340TTY(txBase.TelexBase):
 
     # -----
 
-    def _check_commands(self, a:str):
-        enable = None
-
-        if a in ('A',):
+    def _cmd_online(self, a:str):
+        if a == 'A':
             # Confirm enable status for MCP
             self._rx_buffer.append('\x1bAA')
+        self._set_pulse_dial(False)
+        self._set_online(True)
+        self._set_enable(True)
 
-        if a in ('A', 'AA'):
-            self._set_pulse_dial(False)
-            self._set_online(True)
-            enable = True
-
-        if a in ('Z', 'ZZ'):
-            self._tx_buffer = []    # empty write buffer...
-            self._set_pulse_dial(False)
-            self._set_online(False)
-            enable = False   #self._use_dedicated_line
-            if not enable and self._use_squelch:
-                self._set_time_squelch(1.5)
-
-        if a in ('WB',):
-            self._set_online(True)
-            if self._use_pulse_dial:   # TW39
-                self._set_pulse_dial(True)
-                self._tty.write(b'\x1E')   # send pulse with 25ms low to signal 'ready for dialing' ('Wahlbereitschaft')
-                enable = False
-            else:   # dedicated line, TWM, V.10
-                enable = True
-
-        if enable is not None:
-            self._set_enable(enable)
+    def _cmd_offline(self, a:str):
+        self._tx_buffer.clear()    # empty write buffer...
+        self._set_pulse_dial(False)
+        self._set_online(False)
+        if self._use_squelch:
+            self._set_time_squelch(1.5)
+        self._set_enable(False)   #self._use_dedicated_line
+
+    def _cmd_dial(self, a:str):
+        self._set_online(True)
+        if self._use_pulse_dial:   # TW39
+            self._set_pulse_dial(True)
+            self._tty.write(b'\x1E')   # send pulse with 25ms low to signal 'ready for dialing' ('Wahlbereitschaft')
+            self._set_enable(False)
+        else:   # dedicated line, TWM, V.10
+            self._set_enable(True)
 
 #######
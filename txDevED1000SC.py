@@ -17,7 +17,7 @@ __copyright__   = "Copyright 2018, JK"
 __license__     = "GPL3"
 __version__     = "0.0.1"
 
-from threading import Thread, Event
+from threading import Event
 import time
 import pyaudio
 import math
@@ -33,6 +33,8 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txMessage
+import txSupervisor
 
 sample_f = 48000       # sampling rate, Hz, must be integer
 
@@ -65,6 +67,11 @@ class ST(enum.IntEnum):
 
 
 class TelexED1000SC(txBase.TelexBase):
+    # Flow control by printer buffer feedback (ESC-~), see txFlow
+    bus_window = 50
+    # Commands as txMessage.Message, to see urgent ones (priority lane)
+    bus_messages = True
+
     def __init__(self, **params):
         super().__init__()
 
@@ -73,8 +80,8 @@ class TelexED1000SC(txBase.TelexBase):
         self.id = 'edS'
         self.params = params
 
-        self._tx_buffer = []
-        self._rx_buffer = []
+        self._tx_buffer = txBase.RingBuffer()
+        self._rx_buffer = txBase.RingBuffer()
         self._is_online = Event()
         self._ST_pressed = False
         # State of rx thread, governs most of the module operation (see class
@@ -101,10 +108,18 @@ class TelexED1000SC(txBase.TelexBase):
         # Track MCP active state for printer start feedback
         self._MCP_active = False
 
+        self.commands = txBase.CommandTable(self.id)
+        self.commands.add('A', self._cmd_online)
+        self.commands.add('Z', self._cmd_offline)
+        self.commands.add('WB', self._cmd_dial)
+
+        # Both threads are restarted by the supervisor if they end by an
+        # exception (e.g. an audio device error); they beat at least once a
+        # second, even when offline
         self._run = True
-        self._tx_thread = Thread(target=self.thread_tx, name='ED1000tx')
+        self._tx_thread = txSupervisor.register('ED1000tx', self.thread_tx, heartbeat_timeout=10)
+        self._rx_thread = txSupervisor.register('ED1000rx', self.thread_rx, heartbeat_timeout=10)
         self._tx_thread.start()
-        self._rx_thread = Thread(target=self.thread_rx, name='ED1000rx')
         self._rx_thread.start()
 
     def __del__(self):
@@ -113,6 +128,8 @@ class TelexED1000SC(txBase.TelexBase):
 
     def exit(self):
         self._run = False
+        self._tx_thread.stop()
+        self._rx_thread.stop()
         # Set online status to wake tx thread
         self._is_online.set()
 
@@ -120,16 +137,22 @@ class TelexED1000SC(txBase.TelexBase):
 
     def read(self) -> str:
         if self._rx_buffer:
-            a = self._rx_buffer.pop(0)
+            a = self._rx_buffer.popleft()
             l.debug("read: {!r}".format(a))
             return a
 
+    def read_many(self) -> str:
+        aa = self.pop_many(self._rx_buffer)
+        if aa:
+            l.debug("read: {!r}".format(aa))
+        return aa
+
     # -----
 
     def write(self, a:str, source:str):
         l.debug("write from {!r}: {!r}".format(source, a))
-        if len(a) != 1:
-            self._check_commands(a)
+        if a.__class__ is txMessage.Message or len(a) != 1:
+            self.commands.dispatch(a)
             return
 
         if a == '#':
@@ -138,25 +161,34 @@ class TelexED1000SC(txBase.TelexBase):
         if a and self._is_online.is_set():
             self._tx_buffer.append(a)
 
-    # =====
+    def write_many(self, text:str, source:str):
+        l.debug("write from {!r}: {!r}".format(source, text))
+        if self._is_online.is_set():
+            self._tx_buffer.extend(text.replace('#', '@'))   # ask teletype for hardware ID
 
-    def _check_commands(self, a:str):
-        if a == '\x1bA':
-            l.debug("received online command")
-            self._tx_buffer.append('§A')   # signaling type A - connection
-            self._MCP_active = True
-            self._set_online(True)
+    # =====
 
-        if a == '\x1bZ':
-            l.debug("received offline command (ST pressed: {})".format(self._ST_pressed))
-            self._MCP_active = False
-            self._set_online(False)
+    def _cmd_online(self, a:str):
+        l.debug("received online command")
+        self._tx_buffer.append('§A')   # signaling type A - connection
+        self._MCP_active = True
+        self._set_online(True)
 
-        if a == '\x1bWB':
-            l.debug("ready to dial")
-            if self.send_WB_pulse:
-                self._tx_buffer.append('§W')   # signaling type W - ready for dial
-            self._set_online(True)
+    def _cmd_offline(self, a:str):
+        l.debug("received offline command (ST pressed: {})".format(self._ST_pressed))
+        self._MCP_active = False
+        if txMessage.is_urgent(a) and self._tx_buffer:
+            # aborted by ST elsewhere (see txMessage.URGENT), don't write out
+            # the tx buffer
+            l.warning("Discarding tx buffer due to ST ({} characters)".format(len(self._tx_buffer)))
+            self._tx_buffer.clear()
+        self._set_online(False)
+
+    def _cmd_dial(self, a:str):
+        l.debug("ready to dial")
+        if self.send_WB_pulse:
+            self._tx_buffer.append('§W')   # signaling type W - ready for dial
+        self._set_online(True)
 
     # -----
 
@@ -208,6 +240,7 @@ class TelexED1000SC(txBase.TelexBase):
         #a = stream.get_write_available()
         try:
             while self._run:
+                self._tx_thread.beat()
                 # Going online: send Z
                 if self._rx_state == ST.ONLINE_REQ:
                     l.debug("[tx] Sending Z level")
@@ -217,7 +250,7 @@ class TelexED1000SC(txBase.TelexBase):
                 # Bd.
                 elif ST.ONLINE <= self._rx_state <= ST.OFFLINE_REQ:
                     if self._tx_buffer:
-                        a = self._tx_buffer.pop(0)
+                        a = self._tx_buffer.popleft()
                         if len(a) == 1:
                             self.printed_chars += 1
                         l.debug("[tx] Sending {!r} (buffer length {})".format(a, len(self._tx_buffer)))
@@ -238,7 +271,7 @@ class TelexED1000SC(txBase.TelexBase):
                                 # Teleprinter's WRU unit will trigger after
                                 # this character -- lock further sending to
                                 # prevent collisions
-                                self._tx_buffer.insert(0, '§L')
+                                self._tx_buffer.appendleft('§L')
                             bb = self._mc.encodeA2BM(a)
                             if not bb:
                                 continue
@@ -280,14 +313,12 @@ class TelexED1000SC(txBase.TelexBase):
                     else:
                         l.debug("[tx] Offline, waiting")
                         # If there's absolutely nothing to do, block until
-                        # we're going online again
-                        self._is_online.wait()
+                        # we're going online again (waking up once a second
+                        # for the heartbeat)
+                        self._is_online.wait(1)
 
                 time.sleep(0.001)
 
-        except Exception as e:
-            print(e)
-
         finally:
             stream.stop_stream()
             stream.close()
@@ -323,276 +354,283 @@ class TelexED1000SC(txBase.TelexBase):
 
         bit_last = None
 
-        while self._run:
-            # Executing the IIR filter for bit recognition takes a lot of CPU
-            # power. Normally, we do it four times per bit or every 5 ms (once
-            # per "slice", "quick scan").
-            #
-            # When offline, this is quite a waste. We'll read A level for a
-            # long time without any benefit. So we lower scan interval to 1000
-            # ms ("slow scan").
-            #
-            # When the operator presses AT, the teleprinter sends Z level.
-            # We need to recognise this ASAP to maximise responsiveness. But we
-            # also need to avoid recognising freak AT presses (e.g. when
-            # plugging or unplugging the data line). To this end, we need to
-            # establish a train of stable Z readings. To obtain this quickly,
-            # after detecting the first Z, we switch to quick scan. From here
-            # on, there are two possibilities:
-            # - We read 20x Z: go online
-            # - We read an A: go back to slow scan
-            #
-            # The responsiveness delay is about 2x scan interval. (The receive
-            # IIR filter also seems to introduce a delay. In trials under
-            # optimal circumstances, after pressing AT on the teleprinter,
-            # it took the filter two cycles to recognise the change.)
-
-            if quick_scanning or self._rx_state > ST.OFFLINE:
-                pass
-            else:
-                self._is_online.wait(1)
-
-            # Read audio input
-            bdata = stream.read(FpS, exception_on_overflow=False)   # blocking
-            data = np.frombuffer(bdata, dtype=np.int16)
-
-            # Run FSK demodulation (bit detection)
-            bit = self._recv_decode(data)
-
-            if bit_last != bit and not (ST.ONLINE <= self._rx_state < ST.OFFLINE_DELAY):
-                if bit is None:
-                    l.debug("[rx] Squelch active, last bit {}, previous counter value: {}".format(
-                        "Z" if bit_last else "A",
-                        _bit_counter_1 if bit_last else _bit_counter_0
+        try:
+            while self._run:
+                self._rx_thread.beat()
+                # Executing the IIR filter for bit recognition takes a lot of CPU
+                # power. Normally, we do it four times per bit or every 5 ms (once
+                # per "slice", "quick scan").
+                #
+                # When offline, this is quite a waste. We'll read A level for a
+                # long time without any benefit. So we lower scan interval to 1000
+                # ms ("slow scan").
+                #
+                # When the operator presses AT, the teleprinter sends Z level.
+                # We need to recognise this ASAP to maximise responsiveness. But we
+                # also need to avoid recognising freak AT presses (e.g. when
+                # plugging or unplugging the data line). To this end, we need to
+                # establish a train of stable Z readings. To obtain this quickly,
+                # after detecting the first Z, we switch to quick scan. From here
+                # on, there are two possibilities:
+                # - We read 20x Z: go online
+                # - We read an A: go back to slow scan
+                #
+                # The responsiveness delay is about 2x scan interval. (The receive
+                # IIR filter also seems to introduce a delay. In trials under
+                # optimal circumstances, after pressing AT on the teleprinter,
+                # it took the filter two cycles to recognise the change.)
+
+                if quick_scanning or self._rx_state > ST.OFFLINE:
+                    pass
+                else:
+                    self._is_online.wait(1)
+
+                # Read audio input
+                bdata = stream.read(FpS, exception_on_overflow=False)   # blocking
+                data = np.frombuffer(bdata, dtype=np.int16)
+
+                # Run FSK demodulation (bit detection)
+                bit = self._recv_decode(data)
+
+                if bit_last != bit and not (ST.ONLINE <= self._rx_state < ST.OFFLINE_DELAY):
+                    if bit is None:
+                        l.debug("[rx] Squelch active, last bit {}, previous counter value: {}".format(
+                            "Z" if bit_last else "A",
+                            _bit_counter_1 if bit_last else _bit_counter_0
+                            )
                         )
-                    )
-                elif bit_last is None:
-                    l.debug("[rx] Squelch off, bit changed to {}, previous counter value: {}".format(
-                        "Z" if bit else "A",
-                        _bit_counter_0
+                    elif bit_last is None:
+                        l.debug("[rx] Squelch off, bit changed to {}, previous counter value: {}".format(
+                            "Z" if bit else "A",
+                            _bit_counter_0
+                            )
                         )
-                    )
-                else:
-                    l.debug("[rx] Bit changed to {}, previous counter value: {}".format(
-                        "Z" if bit else "A",
-                        _bit_counter_1 if bit_last else _bit_counter_0
+                    else:
+                        l.debug("[rx] Bit changed to {}, previous counter value: {}".format(
+                            "Z" if bit else "A",
+                            _bit_counter_1 if bit_last else _bit_counter_0
+                            )
                         )
-                    )
-                bit_last = bit
-
-            # The purpose of these bit counters is to detect a stable level of
-            # A or Z, which triggers state changes.
-            if bit:
-                _bit_counter_0 = 0
-                _bit_counter_1 += 1
-                if self._rx_state <= ST.OFFLINE:
-                    if _bit_counter_1 == 1:
-                        # First Z level detected; raise scanning rate to timely
-                        # react to AT press
-                        quick_scanning = True
-                        l.debug("[rx] Enabling quick scanning")
-            else:
-                _bit_counter_0 += 1
-                _bit_counter_1 = 0
-                if quick_scanning:
-                    # "A" level detected; disable quick scanning so that we scan
-                    # the input signal less often (see above)
-                    quick_scanning = False
-                    l.debug("[rx] Disabling quick scanning")
-
-            #l.debug("[rx] Bit counters: A:{}/Z:{}".format(_bit_counter_0, _bit_counter_1))
-
-            # Main state machine tracking what the teleprinter hardware does.
-            # Tx thread is slaved to this state.
-            state_before = self._rx_state # Only for logging
-            if self._rx_state <= ST.OFFLINE: # ====================
-                if self._is_online.is_set():
-                    self._rx_state = ST.ONLINE_REQ
-                    # Online by external command: reset bit counters because we
-                    # need a defined starting point for Z level recognition
-                    _bit_counter_0 = 0
-                    _bit_counter_1 = 0
-                # Send ESC-AT after 20 consecutive Zs (100 ms + rest of
-                # _is_online.wait delay, see above). Don't advance state;
-                # ESC-AT will cause us to receive ESC-WB/ESC-A by txDevMCP and
-                # this will toggle is_online. Use == 20 to ensure sending
-                # ESC-AT only once.
-                if _bit_counter_1 == 20:
-                    l.info("[rx] Detected AT press")
-                    self._rx_buffer.append('\x1bAT')
-                    # Don't send printer start confirmation since AT was
-                    # pressed.
-            elif self._rx_state == ST.ONLINE_REQ: # ====================
-                # Go online after 20 consecutive Zs.
-                # - If we come here after ESC-AT, we fall through since
-                #   _bit_counter_1 is already >= 20.
-                # - If we come here by ESC-A from incoming connection, we
-                #   properly wait for a stable Z reading.
-                if _bit_counter_1 >= 20:
-                    self._rx_state = ST.ONLINE
-                    # Reset character recognition
-                    slice_counter = 0
-                # If the teleprinter doesn't switch to Z, but stays in A for at
-                # least 100 scans (500 ms), detect it as unresponsive. This can
-                # theoretically also happen if ST is pressed just at the right
-                # moment, but this is very unlikely.
-                #
-                # This typically happens on an incoming connection, so don't
-                # send ESC-ST because this would terminate it immediately. To
-                # keep this transparent and allow fallback mechanisms like the
-                # archive module to continue receiving, just set offline and
-                # reset our internal state to ST.OFFLINE.
-                if _bit_counter_0 == self.unres_threshold:
-                    l.info("[rx] Detected unresponsive teleprinter")
-                    self._set_online(False)
-                    self._rx_state = ST.OFFLINE
+                    bit_last = bit
+
+                # The purpose of these bit counters is to detect a stable level of
+                # A or Z, which triggers state changes.
+                if bit:
                     _bit_counter_0 = 0
-                    _bit_counter_1 = 0
-                    if self._tx_buffer:
-                        l.warning("[rx] Discarding tx buffer due to unresponsive teleprinter ({} characters)".format(len(self._tx_buffer)))
-                        l.debug("[rx] tx buffer contents: {!r}".format(self._tx_buffer))
-                        self._tx_buffer = []
-            elif self._rx_state == ST.ONLINE: # ====================
-                # Go offline on ESC-Z
-                if not self._is_online.is_set():
-                    self._rx_state = ST.OFFLINE_REQ
-                # Send ESC-ST after 100 consecutive As (500 ms). Don't advance
-                # state; ESC-ST will cause us to receive ESC-Z by txDevMCP and
-                # this will toggle is_online. Use == 100 to ensure sending
-                # ESC-ST only once.
-                if _bit_counter_0 == 100:
-                    l.info("[rx] Detected ST press")
-                    self._rx_buffer.append('\x1bST')
-                    self._ST_pressed = True
-                    if self._tx_buffer:
-                        l.warning("[rx] Discarding tx buffer due to ST press ({} characters)".format(len(self._tx_buffer)))
-                        l.debug("[rx] tx buffer contents: {!r}".format(self._tx_buffer))
-                        self._tx_buffer = []
-            elif self._rx_state == ST.OFFLINE_REQ: # ====================
-                # Write out tx buffer
-                if not self._tx_buffer:
-                    l.info("[rx] tx buffer empty, printed characters: {}".format(self.printed_chars))
-                    # Ensure that everyone knows our buffer is empty
-                    self._rx_buffer.append('\x1b~0')
-                    self._rx_state = ST.OFFLINE_DELAY
-                # ... but break on ST (if the operator wishes to go offline
-                # immediately).
-                # (If we reached this state by pressing ST, the buffer will be
-                # empty and this point in code is not reached.  It wouldn't
-                # matter though.)
-                if _bit_counter_0 >= 100:
-                    l.info("[rx] Detected ST press")
-                    # Sending ST now probably won't be needed since _is_online
-                    # has already been cleared.
-                    self._rx_buffer.append('\x1bST')
-                    self._ST_pressed = True
-                    # Don't advance state since emptying the buffer now will
-                    # trigger state ST.OFFLINE_DELAY on next loop (see above).
-                    if self._tx_buffer:
-                        l.warning("[rx] Discarding tx buffer due to ST press ({} characters)".format(len(self._tx_buffer)))
-                        l.debug("[rx] tx buffer contents: {!r}".format(self._tx_buffer))
-                        self._tx_buffer = []
-            elif self._rx_state == ST.OFFLINE_DELAY: # ====================
-                if self._ST_pressed:
-                    # Skip delay if ST was pressed to improve responsiveness
-                    self._ST_pressed = False
-                    self._rx_state = ST.OFFLINE_WAIT
-                offline_delay_counter += 1
-                # Wait 3000 ms until switching to A level.
-                if offline_delay_counter > 600:
-                    self._rx_state = ST.OFFLINE_WAIT
-                    offline_delay_counter = 0
+                    _bit_counter_1 += 1
+                    if self._rx_state <= ST.OFFLINE:
+                        if _bit_counter_1 == 1:
+                            # First Z level detected; raise scanning rate to timely
+                            # react to AT press
+                            quick_scanning = True
+                            l.debug("[rx] Enabling quick scanning")
                 else:
-                    if offline_delay_counter % 100 == 0:
-                        l.debug("[rx] Offline delay running: {!r}/600".format(offline_delay_counter))
-            elif self._rx_state >= ST.OFFLINE_WAIT: # ====================
-                if _bit_counter_0 > 100:
-                    self._rx_state = ST.OFFLINE
-                    _bit_counter_0 = 0
+                    _bit_counter_0 += 1
                     _bit_counter_1 = 0
-                    self.printed_chars = 0
-                    l.debug("[rx] Received A level, offline confirmed")
-
-            #l.debug("[rx] _is_online: {} bit: {}".format(self._is_online.is_set(), bit))
-            if state_before != self._rx_state:
-                l.info("[rx] State transition: {!s}=>{!s}".format(state_before, self._rx_state))
-
-            # Suppress symbol recognition until we're in full online state.
-            #
-            # If we don't wait for a stable Z, we might spuriously decode one
-            # of these symbols (start bit, 5x character bit, stop bits):
-            #
-            # ScccccSs
-            # ========
-            # AAAAAAZZ: NULL (~ in piTelex)
-            # AAAAAZZZ: T
-            # AAAAZZZZ: O
-            # AAAZZZZZ: M
-            # AAZZZZZZ: V
-            # AZZZZZZZ: letter shift ([ in piTelex)
-            #
-            # We must not detect any A level that only results from the earlier
-            # not-quite-online-yet state -- this would be the start bit
-            # triggering one of the above characters. For the two possible ways
-            # of going online this means:
-            #
-            # - AT is pressed: All ok, we've got a stable Z level already,
-            #   that's why we went online in the first place.
-            #
-            # - Incoming connection: We send Z first, the teleprinter
-            #   acknowledges this by switching from A to Z after some time.
-            #
-            # The second case is critical: We have to wait for the teleprinter
-            # to send a Z; only after this we are online (_rx_state ==
-            # ST.ONLINE). Turn off character recognition in later states
-            # because the other endpoint is already disconnected; received data
-            # would be useless. But ST operation always works independently.
-            if not self._rx_state == ST.ONLINE: # online
-                continue
-
-            # Character recognition
-            if slice_counter == 0:
-                if not bit:   # found start step
-                    symbol = 0
-                    slice_counter = 1
-
-            else:
-                if slice_counter in (1, 2):   # middle of start step
-                    if bit: # check if correct start bit
-                        slice_counter = -1
-                if slice_counter == 6:   # middle of step 1
-                    if bit:
-                        symbol |= 1
-                if slice_counter == 10:   # middle of step 2
-                    if bit:
-                        symbol |= 2
-                if slice_counter == 14:   # middle of step 3
-                    if bit:
-                        symbol |= 4
-                if slice_counter == 18:   # middle of step 4
-                    if bit:
-                        symbol |= 8
-                if slice_counter == 22:   # middle of step 5
-                    if bit:
-                        symbol |= 16
-                if slice_counter == 26:   # middle of stop step
-                    if not bit:
-                        slice_counter = -5   # wrong stop bit!
-                if slice_counter >= 28:   # end of stop step
-                    slice_counter = 0
-                    #print(symbol, val)   #debug
-                    a = self._mc.decodeBM2A([symbol])
-                    if a:
-                        self._rx_buffer.append(a)
+                    if quick_scanning:
+                        # "A" level detected; disable quick scanning so that we scan
+                        # the input signal less often (see above)
+                        quick_scanning = False
+                        l.debug("[rx] Disabling quick scanning")
+
+                #l.debug("[rx] Bit counters: A:{}/Z:{}".format(_bit_counter_0, _bit_counter_1))
+
+                # Main state machine tracking what the teleprinter hardware does.
+                # Tx thread is slaved to this state.
+                state_before = self._rx_state # Only for logging
+                if self._rx_state <= ST.OFFLINE: # ====================
+                    if self._is_online.is_set():
+                        self._rx_state = ST.ONLINE_REQ
+                        # Online by external command: reset bit counters because we
+                        # need a defined starting point for Z level recognition
+                        _bit_counter_0 = 0
+                        _bit_counter_1 = 0
+                    # Send ESC-AT after 20 consecutive Zs (100 ms + rest of
+                    # _is_online.wait delay, see above). Don't advance state;
+                    # ESC-AT will cause us to receive ESC-WB/ESC-A by txDevMCP and
+                    # this will toggle is_online. Use == 20 to ensure sending
+                    # ESC-AT only once.
+                    if _bit_counter_1 == 20:
+                        l.info("[rx] Detected AT press")
+                        self._rx_buffer.append('\x1bAT')
+                        self.notify()
+                        # Don't send printer start confirmation since AT was
+                        # pressed.
+                elif self._rx_state == ST.ONLINE_REQ: # ====================
+                    # Go online after 20 consecutive Zs.
+                    # - If we come here after ESC-AT, we fall through since
+                    #   _bit_counter_1 is already >= 20.
+                    # - If we come here by ESC-A from incoming connection, we
+                    #   properly wait for a stable Z reading.
+                    if _bit_counter_1 >= 20:
+                        self._rx_state = ST.ONLINE
+                        # Reset character recognition
+                        slice_counter = 0
+                    # If the teleprinter doesn't switch to Z, but stays in A for at
+                    # least 100 scans (500 ms), detect it as unresponsive. This can
+                    # theoretically also happen if ST is pressed just at the right
+                    # moment, but this is very unlikely.
+                    #
+                    # This typically happens on an incoming connection, so don't
+                    # send ESC-ST because this would terminate it immediately. To
+                    # keep this transparent and allow fallback mechanisms like the
+                    # archive module to continue receiving, just set offline and
+                    # reset our internal state to ST.OFFLINE.
+                    if _bit_counter_0 == self.unres_threshold:
+                        l.info("[rx] Detected unresponsive teleprinter")
+                        self._set_online(False)
+                        self._rx_state = ST.OFFLINE
+                        _bit_counter_0 = 0
+                        _bit_counter_1 = 0
+                        if self._tx_buffer:
+                            l.warning("[rx] Discarding tx buffer due to unresponsive teleprinter ({} characters)".format(len(self._tx_buffer)))
+                            l.debug("[rx] tx buffer contents: {!r}".format(self._tx_buffer))
+                            self._tx_buffer.clear()
+                elif self._rx_state == ST.ONLINE: # ====================
+                    # Go offline on ESC-Z
+                    if not self._is_online.is_set():
+                        self._rx_state = ST.OFFLINE_REQ
+                    # Send ESC-ST after 100 consecutive As (500 ms). Don't advance
+                    # state; ESC-ST will cause us to receive ESC-Z by txDevMCP and
+                    # this will toggle is_online. Use == 100 to ensure sending
+                    # ESC-ST only once.
+                    if _bit_counter_0 == 100:
+                        l.info("[rx] Detected ST press")
+                        self._rx_buffer.push('\x1bST')
+                        self.notify()
+                        self._ST_pressed = True
+                        if self._tx_buffer:
+                            l.warning("[rx] Discarding tx buffer due to ST press ({} characters)".format(len(self._tx_buffer)))
+                            l.debug("[rx] tx buffer contents: {!r}".format(self._tx_buffer))
+                            self._tx_buffer.clear()
+                elif self._rx_state == ST.OFFLINE_REQ: # ====================
+                    # Write out tx buffer
+                    if not self._tx_buffer:
+                        l.info("[rx] tx buffer empty, printed characters: {}".format(self.printed_chars))
+                        # Ensure that everyone knows our buffer is empty
+                        self._rx_buffer.push(txMessage.Message('~', 0))
+                        self.notify()
+                        self._rx_state = ST.OFFLINE_DELAY
+                    # ... but break on ST (if the operator wishes to go offline
+                    # immediately).
+                    # (If we reached this state by pressing ST, the buffer will be
+                    # empty and this point in code is not reached.  It wouldn't
+                    # matter though.)
+                    if _bit_counter_0 >= 100:
+                        l.info("[rx] Detected ST press")
+                        # Sending ST now probably won't be needed since _is_online
+                        # has already been cleared.
+                        self._rx_buffer.push('\x1bST')
+                        self.notify()
+                        self._ST_pressed = True
+                        # Don't advance state since emptying the buffer now will
+                        # trigger state ST.OFFLINE_DELAY on next loop (see above).
+                        if self._tx_buffer:
+                            l.warning("[rx] Discarding tx buffer due to ST press ({} characters)".format(len(self._tx_buffer)))
+                            l.debug("[rx] tx buffer contents: {!r}".format(self._tx_buffer))
+                            self._tx_buffer.clear()
+                elif self._rx_state == ST.OFFLINE_DELAY: # ====================
+                    if self._ST_pressed:
+                        # Skip delay if ST was pressed to improve responsiveness
+                        self._ST_pressed = False
+                        self._rx_state = ST.OFFLINE_WAIT
+                    offline_delay_counter += 1
+                    # Wait 3000 ms until switching to A level.
+                    if offline_delay_counter > 600:
+                        self._rx_state = ST.OFFLINE_WAIT
+                        offline_delay_counter = 0
+                    else:
+                        if offline_delay_counter % 100 == 0:
+                            l.debug("[rx] Offline delay running: {!r}/600".format(offline_delay_counter))
+                elif self._rx_state >= ST.OFFLINE_WAIT: # ====================
+                    if _bit_counter_0 > 100:
+                        self._rx_state = ST.OFFLINE
+                        _bit_counter_0 = 0
+                        _bit_counter_1 = 0
+                        self.printed_chars = 0
+                        l.debug("[rx] Received A level, offline confirmed")
+
+                #l.debug("[rx] _is_online: {} bit: {}".format(self._is_online.is_set(), bit))
+                if state_before != self._rx_state:
+                    l.info("[rx] State transition: {!s}=>{!s}".format(state_before, self._rx_state))
+
+                # Suppress symbol recognition until we're in full online state.
+                #
+                # If we don't wait for a stable Z, we might spuriously decode one
+                # of these symbols (start bit, 5x character bit, stop bits):
+                #
+                # ScccccSs
+                # ========
+                # AAAAAAZZ: NULL (~ in piTelex)
+                # AAAAAZZZ: T
+                # AAAAZZZZ: O
+                # AAAZZZZZ: M
+                # AAZZZZZZ: V
+                # AZZZZZZZ: letter shift ([ in piTelex)
+                #
+                # We must not detect any A level that only results from the earlier
+                # not-quite-online-yet state -- this would be the start bit
+                # triggering one of the above characters. For the two possible ways
+                # of going online this means:
+                #
+                # - AT is pressed: All ok, we've got a stable Z level already,
+                #   that's why we went online in the first place.
+                #
+                # - Incoming connection: We send Z first, the teleprinter
+                #   acknowledges this by switching from A to Z after some time.
+                #
+                # The second case is critical: We have to wait for the teleprinter
+                # to send a Z; only after this we are online (_rx_state ==
+                # ST.ONLINE). Turn off character recognition in later states
+                # because the other endpoint is already disconnected; received data
+                # would be useless. But ST operation always works independently.
+                if not self._rx_state == ST.ONLINE: # online
                     continue
 
-                slice_counter += 1
-
-            #time.sleep(0.001)
+                # Character recognition
+                if slice_counter == 0:
+                    if not bit:   # found start step
+                        symbol = 0
+                        slice_counter = 1
 
+                else:
+                    if slice_counter in (1, 2):   # middle of start step
+                        if bit: # check if correct start bit
+                            slice_counter = -1
+                    if slice_counter == 6:   # middle of step 1
+                        if bit:
+                            symbol |= 1
+                    if slice_counter == 10:   # middle of step 2
+                        if bit:
+                            symbol |= 2
+                    if slice_counter == 14:   # middle of step 3
+                        if bit:
+                            symbol |= 4
+                    if slice_counter == 18:   # middle of step 4
+                        if bit:
+                            symbol |= 8
+                    if slice_counter == 22:   # middle of step 5
+                        if bit:
+                            symbol |= 16
+                    if slice_counter == 26:   # middle of stop step
+                        if not bit:
+                            slice_counter = -5   # wrong stop bit!
+                    if slice_counter >= 28:   # end of stop step
+                        slice_counter = 0
+                        #print(symbol, val)   #debug
+                        a = self._mc.decodeBM2A([symbol])
+                        if a:
+                            self._rx_buffer.append(a)
+                            self.notify()
+                        continue
+
+                    slice_counter += 1
+
+                #time.sleep(0.001)
 
-        stream.stop_stream()
-        stream.close()
+        finally:
+            stream.stop_stream()
+            stream.close()
 
     # =====
 
@@ -715,7 +753,7 @@ class TelexED1000SC(txBase.TelexBase):
                 self._rx_buffer.append('\x1bAA')
             elif self._last_printed_chars != self.printed_chars:
                 # Normal feedback (when number of printed characters changed)
-                self._rx_buffer.append('\x1b~' + str(tx_buf_len))
+                self._rx_buffer.push(txMessage.Message('~', tx_buf_len))
 
             if not printer_online:
                 # We went offline: turn off feedback
@@ -263,6 +263,8 @@ class Eliza:
 #######
 
 class TelexEliza(txBase.TelexBase):
+    bus_commands = False
+
     def __init__(self, **params):
         super().__init__()
 
@@ -272,8 +274,8 @@ class TelexEliza(txBase.TelexBase):
         # init Eliza
         self._eliza = Eliza()
 
-        self._rx_buffer = []
-        self._tx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
+        self._tx_buffer = txBase.RingBuffer()
 
 
     def __del__(self):
@@ -286,10 +288,13 @@ class TelexEliza(txBase.TelexBase):
         ret = ''
 
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
 
         return ret
 
+    def read_many(self) -> str:
+        return self.pop_many(self._rx_buffer)
+
 
     def write(self, a:str, source:str):
         if len(a) != 1:
@@ -305,7 +310,7 @@ class TelexEliza(txBase.TelexBase):
 
                 for a in r:
                     self._rx_buffer.append(a)
-                self._tx_buffer = []
+                self._tx_buffer.clear()
 
         elif a == '\r':
             pass
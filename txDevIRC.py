@@ -25,11 +25,19 @@ import queue
 import logging
 l = logging.getLogger("piTelex." + __name__)
 
+import txBase
 import txDevITelexCommon
 import txCode
+import txSupervisor
 
 
 class TelexIRC(txDevITelexCommon.TelexITelexCommon):
+    bus_commands = ('A', 'Z', 'WB')
+    # write() parses command strings itself (unlike TelexITelexCommon)
+    bus_messages = False
+    # no use for the buffer feedback of the other devices
+    bus_feedbacks = False
+
     def __init__(self, **params):
         super().__init__()
 
@@ -42,21 +50,23 @@ class TelexIRC(txDevITelexCommon.TelexITelexCommon):
 
         self.irc_client = IRC_Client(params.get("irc_server", "irc.nerd2nerd.org"), params.get("irc_port", 6697), params.get("irc_nick", "telextest"), params.get("irc_channel", "#tctesting"))
 
-        self.thread = threading.Thread(target=self.thread_function, name='IRC_Handler')
-        self.thread.start()
+        self._last_date = None
+        self._consumer = txBase.QueueConsumer(self.handle_msg, 'IRC_Handler', self.irc_client.q)
+        self._tx_consumer = txBase.QueueConsumer(self.add_chars, 'IRC_Tx')
 
 
     def exit(self):
         self.irc_client.stop()
         self.running = False
-        self.thread.join()
+        self._consumer.stop()
+        self._tx_consumer.stop()
 
     # =====
 
     def read(self) -> str:
         if self._rx_buffer:
             if self._is_online:
-                return self._rx_buffer.pop(0)
+                return self._rx_buffer.popleft()
             else:
                 self._is_online = True
                 return '\x1bA'
@@ -74,7 +84,7 @@ class TelexIRC(txDevITelexCommon.TelexITelexCommon):
             return
 
         if a not in "[]":
-            self._tx_buffer.append(a)
+            self._tx_consumer.put(str(a.encode('ASCII'), 'utf8').lower())
 
     # =====
 
@@ -92,53 +102,41 @@ class TelexIRC(txDevITelexCommon.TelexITelexCommon):
             self.chars_buffer += char
 
 
-    def thread_function(self):
+    def handle_msg(self, data):
         """
-            IRC client handler
+            IRC message handler, called by the consumer thread
         """
-        last_date = None
-        while self.running:
-            try:
-                data = self.irc_client.get_msg()
-                if data is not None:
-                    # TODO: wait for debian to catch up with real events
-                    if data['type'] == 'PRIVMSG':
-                        msg = f'={data["channel"][1:]} {data["nick"]}: {data["msg"]}'
-                    if data['type'] == 'ACTION':
-                        msg = f'={data["channel"][1:]} = {data["nick"]} {data["msg"]}'
-                    if data['type'] == 'TOPIC':
-                        msg = f'={data["channel"][1:]} TOPIC CHANGED by {data["nick"]}: {data["msg"]}'
-
-                    if data['msg'].startswith(f'{self.irc_client.nick}:'):
-                        msg = f'{msg}\a\a\a' # BEL
-
-                    if data['msg'].startswith(f'{self.irc_client.nick}:') or not self.directed_only:
-                        msg = f'{time.strftime("%H:%M", time.gmtime(data["timestamp"]))} {msg}\n\r'
-                        if last_date != time.gmtime(data["timestamp"]).tm_yday:
-                            msg = f'{time.strftime("%A %d %B", time.gmtime(data["timestamp"]))}\n\r {msg}'
-                            last_date = time.gmtime(data["timestamp"]).tm_yday
-                        text = txCode.BaudotMurrayCode.ascii_to_tty_text(msg)
-                        # TODO: insert linebreak after 65 characters
-                        for a in text:
-                            self._rx_buffer.append(a)
-
-                if self._tx_buffer:
-                    a = self._tx_buffer.pop(0)
-                    data = str(a.encode('ASCII'), 'utf8').lower()
-                    self.add_chars(data)
-
-            except socket.error:
-                l.warning('ERROR socket', 2)
-                break
-
-        l.warning('end connection', 3)
-        self._connected = False
+        # TODO: wait for debian to catch up with real events
+        if data['type'] == 'PRIVMSG':
+            msg = f'={data["channel"][1:]} {data["nick"]}: {data["msg"]}'
+        if data['type'] == 'ACTION':
+            msg = f'={data["channel"][1:]} = {data["nick"]} {data["msg"]}'
+        if data['type'] == 'TOPIC':
+            msg = f'={data["channel"][1:]} TOPIC CHANGED by {data["nick"]}: {data["msg"]}'
+
+        if data['msg'].startswith(f'{self.irc_client.nick}:'):
+            msg = f'{msg}\a\a\a' # BEL
+
+        if data['msg'].startswith(f'{self.irc_client.nick}:') or not self.directed_only:
+            msg = f'{time.strftime("%H:%M", time.gmtime(data["timestamp"]))} {msg}\n\r'
+            if self._last_date != time.gmtime(data["timestamp"]).tm_yday:
+                msg = f'{time.strftime("%A %d %B", time.gmtime(data["timestamp"]))}\n\r {msg}'
+                self._last_date = time.gmtime(data["timestamp"]).tm_yday
+            text = txCode.BaudotMurrayCode.ascii_to_tty_text(msg)
+            # TODO: insert linebreak after 65 characters
+            for a in text:
+                self._rx_buffer.append(a)
+            self.notify()
 
 #######
 
 class IRC_Client():
+    # Seconds without any data from the server (it PINGs every few minutes)
+    # until the connection is considered dead
+    RX_TIMEOUT = 600
+
     def __init__(self, server, port, nick, channel):
-        self.irc = ssl.wrap_socket(socket.socket())
+        self.irc = None
 
         self.q = queue.Queue()
 
@@ -147,25 +145,35 @@ class IRC_Client():
         self.nick = nick
         self.channel = channel
 
-        self.registered = False
-
-        self.irc.connect((self.server, self.port))
+        self.registered = threading.Event()
 
+        # The client thread connects; it is restarted by the supervisor (and
+        # reconnects) if the connection fails
         self.running = True
-        self.thread = threading.Thread(target=self.thread_function, name='IRC_Client')
+        self.thread = txSupervisor.register('IRC_Client', self.thread_function, heartbeat_timeout=60)
         self.thread.start()
 
-        self._raw_send(f'USER {self.nick} 0 * :{self.nick}')
-        self._raw_send(f'NICK {self.nick}')
         # TODO: handle auto nick append when nick in use
-        while not self.registered:
-            pass
+        if not self.registered.wait(30):
+            l.warning(f'Not registered at {self.server}:{self.port} yet')
+
+    def connect(self):
+        self.registered.clear()
+        self.irc = ssl.wrap_socket(socket.socket())
+        self.irc.settimeout(30)
+        self.irc.connect((self.server, self.port))
+        # short timeout for recv, to check running and beat
+        self.irc.settimeout(1)
 
-        self._raw_send(f'JOIN {self.channel}')
+        self._raw_send(f'USER {self.nick} 0 * :{self.nick}')
+        self._raw_send(f'NICK {self.nick}')
 
     def _raw_send(self, data):
         l.debug(f'OUT: {data}')
-        self.irc.send(bytes(f'{data}\r\n', 'utf-8'))
+        try:
+            self.irc.send(bytes(f'{data}\r\n', 'utf-8'))
+        except (OSError, AttributeError) as e:
+            l.warning(f'Sending to {self.server} failed: {e!r}')
 
     def send_msg(self, msg, action=False):
         if action:
@@ -173,10 +181,11 @@ class IRC_Client():
         self._raw_send(f'PRIVMSG {self.channel} :{msg}')
 
     def stop(self, quit_msg='Wah!'):
+        # no restart when the server closes the connection on QUIT
+        self.thread.stop()
         self._raw_send(f'QUIT :{quit_msg}')
         self.running = False
-        self.thread.join()
-        self.irc.close()
+        self.thread.join(5)
 
         del self
 
@@ -212,22 +221,42 @@ class IRC_Client():
         return source, nick, command, target, message
 
     def thread_function(self):
-        while self.running:
-            data_raw = self.irc.recv(4096)
-            data = str(data_raw, 'utf8', 'replace').replace('\n', '').split('\r')
-
-            for line in data:
-                if line == '':
+        try:
+            self.connect()
+            last_rx = time.monotonic()
+            while self.running:
+                self.thread.beat()
+                try:
+                    data_raw = self.irc.recv(4096)
+                except socket.timeout:
+                    if time.monotonic() - last_rx > self.RX_TIMEOUT:
+                        raise ConnectionError(f'no data from {self.server} for {self.RX_TIMEOUT} s')
                     continue
+                if not data_raw:
+                    raise ConnectionError(f'connection closed by {self.server}')
+                last_rx = time.monotonic()
+                self.handle_data(data_raw)
+        finally:
+            if self.irc:
+                self.irc.close()
+
+    def handle_data(self, data_raw):
+        data = str(data_raw, 'utf8', 'replace').replace('\n', '').split('\r')
+
+        for line in data:
+            if line == '':
+                continue
 
-                l.debug(f'IN: {line}')
+            l.debug(f'IN: {line}')
 
-                if line.startswith('PING'):
-                    self._raw_send(line.replace('PING', 'PONG', 1))
-                    self.registered = True
-                    continue
+            if line.startswith('PING'):
+                self._raw_send(line.replace('PING', 'PONG', 1))
+                if not self.registered.is_set():
+                    self.registered.set()
+                    self._raw_send(f'JOIN {self.channel}')
+                continue
 
-                source, nick, command, target, message = self.parse_irc_msg(line)
-                if target == self.channel and command in ['PRIVMSG', 'TOPIC', 'ACTION']:
-                    self.q.put({'type': command, 'user': source, 'nick': nick, 'channel': self.channel, 'msg': message, 'timestamp': time.monotonic()})
-                    continue
+            source, nick, command, target, message = self.parse_irc_msg(line)
+            if target == self.channel and command in ['PRIVMSG', 'TOPIC', 'ACTION']:
+                self.q.put({'type': command, 'user': source, 'nick': nick, 'channel': self.channel, 'msg': message, 'timestamp': time.monotonic()})
+                continue
@@ -13,7 +13,7 @@ __copyright__   = "Copyright 2018, JK"
 __license__     = "GPL3"
 __version__     = "0.0.1"
 
-from threading import Thread
+from threading import Thread, Lock
 import socket
 import time
 import csv
@@ -25,12 +25,19 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txMessage
 import txDevITelexCommon
 from txDevITelexCommon import ST
 
+# Seconds a TNS answer is reused for further calls to the same number
+TNS_CACHE_TIME = 600
+
 
 class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
     USERLIST = []   # cached list of user dicts of file 'userlist.csv'
+    # TNS answers, shared by all lines of the process: number -> (time, user)
+    _tns_cache = {}
+    _tns_cache_lock = Lock()
     _tns_port = 0
     _userlist = ''
 
@@ -55,29 +62,32 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
     def read(self) -> str:
         if self._rx_buffer:
             l.debug("read: {!r}".format(self._rx_buffer[0]))
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
+
+    def read_many(self) -> str:
+        aa = self.pop_many(self._rx_buffer)
+        if aa:
+            l.debug("read: {!r}".format(aa))
+        return aa
 
 
     def write(self, a:str, source:str):
         super().write(a, source)
         l.debug("write from {!r}: {!r}".format(source, a))
-        if len(a) != 1:
-            if a == '\x1bZ':   # end session
+        if a.__class__ is txMessage.Message:
+            if a.code == 'Z':   # end session
                 self.disconnect_client()
 
-            if a[:2] == '\x1b#':   # dial
-                try:
-                    instant_dial = (a[2] == '!')
-                except IndexError:
-                    instant_dial = False
+            if a.code == '#':   # dial
+                instant_dial = a.payload.startswith('!')
                 if instant_dial:
                     # Instant dial: Fail silently if number not found
-                    user = self.get_user(a[3:])
+                    user = self.get_user(a.payload[1:])
                     if user:
                         self.connect_client(user)
                 else:
                     # Normal dial: Fail loudly if number not found
-                    user = self.get_user(a[2:])
+                    user = self.get_user(a.payload)
                     if user:
                         self.connect_client(user)
                     else:
@@ -86,8 +96,8 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
                         self._rx_buffer.append('\x1bZ')
 
 
-            if a[:2] == '\x1b?':   # ask TNS
-                user = self.get_user(a[2:], tns_force = True)
+            if a.code == '?':   # ask TNS
+                user = self.get_user(a.payload, tns_force = True)
                 print(user)
             return
 
@@ -100,9 +110,13 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
         self._tx_buffer.append(a)
         #return True   #debug
 
-
-    def idle(self):
-        pass
+    def write_many(self, text:str, source:str):
+        l.debug("write from {!r}: {!r}".format(source, text))
+        if source in ['iTc', 'iTs']:
+            return
+        if self._connected <= ST.DISCON:
+            return
+        self._tx_buffer.extend(text)
 
     # =====
 
@@ -148,6 +162,7 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
 
         s.close()
         self._rx_buffer.append('\x1bZ')
+        self.notify()
         self._printer_running = False
 
     # =====
@@ -173,11 +188,11 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
 
         # With at least 5 digits, also query remotely
         if not user and (len(number) >= 5 or tns_force):
-            user = cls.query_TNS_bin(number)
+            user = cls.query_TNS_cached(number)
 
             # Also accept leading zero for compatibility reasons
             if not user and number[0] == '0':
-                user = cls.query_TNS_bin(number[1:])
+                user = cls.query_TNS_cached(number[1:])
 
         # Direct dial override continued
         if user and ddext:
@@ -191,6 +206,26 @@ class TelexITelexClient(txDevITelexCommon.TelexITelexCommon):
             l.info("No user found for number {!r}".format(number))
         return user
 
+    @classmethod
+    def query_TNS_cached(cls, number):
+        """
+        Same as query_TNS_bin, but reuse a user found within the last
+        TNS_CACHE_TIME seconds. Numbers not found aren't cached, as TNS errors
+        look the same.
+        """
+        now = time.monotonic()
+        with cls._tns_cache_lock:
+            entry = cls._tns_cache.get(number)
+        if entry and now - entry[0] < TNS_CACHE_TIME:
+            l.info('Found user in TNS cache: '+str(entry[1]))
+            # copy, as get_user may change it
+            return dict(entry[1])
+        user = cls.query_TNS_bin(number)
+        if user:
+            with cls._tns_cache_lock:
+                cls._tns_cache[number] = (now, dict(user))
+        return user
+
     @classmethod
     def query_TNS_bin(cls, number):
         """
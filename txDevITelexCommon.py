@@ -23,6 +23,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txMessage
 
 # i-Telex allowed package types for Baudot texting mode
 # (everything else triggers ASCII texting mode)
@@ -122,6 +123,9 @@ class ST(enum.IntEnum):
     CON_FULL = 6
 
 class TelexITelexCommon(txBase.TelexBase):
+    bus_messages = True
+    bus_feedbacks = True
+
     def __init__(self):
         super().__init__()
 
@@ -129,9 +133,9 @@ class TelexITelexCommon(txBase.TelexBase):
         # operating as server. For this reason, the _rx_lock MUST be acquired
         # while accessing it, or calculating anything depending on it.
         # Otherwise, bad stuff™ will ensue! Use "with" to prevent deadlocks.
-        self._rx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
         self._rx_lock = Lock()
-        self._tx_buffer = []
+        self._tx_buffer = txBase.RingBuffer()
         self._connected = ST.DISCON
         self._run = True
 
@@ -159,7 +163,8 @@ class TelexITelexCommon(txBase.TelexBase):
 
     def write(self, a:str, source:str):
         # Important: This method must be called from subclasses.
-        if a == "\x1bZ":
+        code = a.code if a.__class__ is txMessage.Message else None
+        if code == "Z":
             self._printer_running = False
             # This is only half of the truth: We do reset printer_running
             # whenever we receive ESC-Z. Often times however, we're the
@@ -167,7 +172,7 @@ class TelexITelexCommon(txBase.TelexBase):
             # which is why we need to explicitly set it to False when the
             # connection is terminated (typically inside the derived class's
             # connection handling thread).
-        elif a == "\x1bAA": # Printer started
+        elif code == "AA": # Printer started
             # In case we're not connected when the printer starts (e.g. for
             # keyboard dial), save started state.
             self._printer_running = True
@@ -178,16 +183,15 @@ class TelexITelexCommon(txBase.TelexBase):
                 # we're server
                 self._connected = ST.CON_TP_RUN
 
-        elif a.startswith("\x1b~"): # Printer buffer feedback
+        elif code == "~": # Printer buffer feedback
             if self._connected >= ST.CON_FULL or self._connected <= ST.DISCON_TP_WAIT:
                 # Evaluate only:
                 # - if welcome banner has been sent, if applicable, to minimise
                 #   chances to prematurely increment the Acknowledge counter or
                 # - if we've disconnected and are waiting for the printer to
                 #   finish printing.
-                try:
-                    print_buf_len = int(a[2:])
-                except ValueError:
+                print_buf_len = a.payload
+                if print_buf_len is None:
                     l.warning("Invalid printer buffer length feedback received: {!r}".format(a))
                 else:
                     self._print_buf_len = print_buf_len
@@ -203,7 +207,7 @@ class TelexITelexCommon(txBase.TelexBase):
     def disconnect_client(self):
         if self._tx_buffer:
             l.warning("While disconnecting, transmit buffer not empty, discarded; contents were: {!r}".format(self._tx_buffer))
-        self._tx_buffer = []
+        self._tx_buffer.clear()
         # Set to fully disconnected only if printer buffer is empty. Otherwise,
         # ST.DISCON will be set in write method upon receipt of ESC-~0.
         self._connected = ST.DISCON_TP_WAIT if self._print_buf_len else ST.DISCON
@@ -232,7 +236,7 @@ class TelexITelexCommon(txBase.TelexBase):
         all characters "on the way", i.e. residing in any buffer.
         """
         with self._rx_lock:
-            rx_buffer_unread = len([i for i in self._rx_buffer if not i.startswith("\x1b")])
+            rx_buffer_unread = len([i for i in self._rx_buffer if not txMessage.is_command(i)])
             self._acknowledge_counter = self._received_counter - print_buf_len - rx_buffer_unread
             if self._acknowledge_counter < self._last_acknowledge_counter:
                 # New count is smaller than before: reset it to the old value to
@@ -331,13 +335,14 @@ class TelexITelexCommon(txBase.TelexBase):
                         # we're server
                         self._connected = ST.CON_TP_RUN
                         self._rx_buffer.append('\x1bA')
+                    self.notify()
                     continue
                 # We just entered ST.CON_TP_RUN (printer running, waiting for
                 # welcome banner)
                 elif self._connected == ST.CON_TP_RUN:
                     if is_server:
                         # Send welcome banner
-                        self._tx_buffer = []
+                        self._tx_buffer.clear()
                         self.send_welcome(s)
                     else:
                         # We're client: skip ST.CON_TP_RUN
@@ -473,6 +478,7 @@ class TelexITelexCommon(txBase.TelexBase):
                             self._rx_buffer.append('\x1bA')
                             for a in aa:
                                 self._rx_buffer.append(a)
+                        self.notify()
                         break
 
                     # Acknowledge
@@ -512,7 +518,7 @@ class TelexITelexCommon(txBase.TelexBase):
                         #     self.send_ack(s, self._acknowledge_counter)
 
                         # Send remote printer buffer feedback
-                        with self._rx_lock: self._rx_buffer.append('\x1b^' + str(unprinted))
+                        with self._rx_lock: self._rx_buffer.append(txMessage.Message('^', unprinted))
 
                     # Version
                     elif data[0] == 7 and packet_len >= 1 and packet_len <= 20:
@@ -561,6 +567,9 @@ class TelexITelexCommon(txBase.TelexBase):
                         l.warning('Received invalid i-Telex Packet: {}'.format(display_hex(data)))
                         packet_error = True
 
+                    # Wake up main loop for anything queued above
+                    self.notify()
+
                     if not packet_error:
                         if is_ascii is None:
                             l.info('Detected i-Telex connection')
@@ -613,6 +622,7 @@ class TelexITelexCommon(txBase.TelexBase):
                                 a = '#'
                             self._rx_buffer.append(a)
                             self._received_counter += 1
+                    self.notify()
 
             except socket.timeout:
                 #l.debug('.')
@@ -764,7 +774,7 @@ class TelexITelexCommon(txBase.TelexBase):
         '''Send ASCII data direct'''
         a = ''
         while self._tx_buffer and len(a) < 250:
-            b = self._tx_buffer.pop(0)
+            b = self._tx_buffer.popleft()
             if b not in '<>°%':
                 a += b
         data = a.encode('ASCII')
@@ -777,7 +787,7 @@ class TelexITelexCommon(txBase.TelexBase):
         '''Send baudot data packet (2)'''
         data = bytearray([2, 0])
         while self._tx_buffer and len(data) < 42:
-            a = self._tx_buffer.pop(0)
+            a = self._tx_buffer.popleft()
             bb = bmc.encodeA2BM(a)
             if bb:
                 for b in bb:
@@ -823,6 +833,7 @@ class TelexITelexCommon(txBase.TelexBase):
             #self._rx_buffer.append('#')
             #self._rx_buffer.append('@')
             self._rx_buffer.append('\x1bI')
+        self.notify()
         return 24 # fixed length of welcome banner, see txDevMCP
 
     # i-Telex epoch has been defined as 1900-01-00 00:00:00 (sic)
@@ -18,6 +18,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txMessage
 import txDevITelexCommon
 from txDevITelexCommon import ST
 
@@ -99,6 +100,11 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
         # Flag for blocking inbound connections when an outbound one is active
         self.block_inbound = False
 
+        self.commands = txBase.CommandTable(self.id)
+        self.commands.add(('WB', 'A'), self._cmd_outbound)
+        self.commands.add('Z', self._cmd_Z)
+        self.commands.add('WELCOME', self._cmd_WELCOME)
+
         # Create event just for sleeping. The event is only triggered on
         # quitting piTelex, to wake up everyone still sleeping.
         self.term = Event()
@@ -123,39 +129,24 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
                     # Welcome banner hasn't been sent yet. Pop only non-printable
                     # items.
                     for nr, item in enumerate(self._rx_buffer):
-                        if item.startswith('\x1b'):
-                            return self._rx_buffer.pop(nr)
+                        if txMessage.is_command(item):
+                            del self._rx_buffer[nr]
+                            return item
                 else:
-                    return self._rx_buffer.pop(0)
+                    return self._rx_buffer.popleft()
+
+    def read_many(self) -> str:
+        with self._rx_lock:
+            if not ST.DISCON < self._connected <= ST.CON_TP_RUN:
+                return self.pop_many(self._rx_buffer)
+        # Welcome banner hasn't been sent yet, see read
+        return self.read()
 
 
     def write(self, a:str, source:str):
         super().write(a, source)
-        if len(a) != 1:
-            if self._connected <= ST.DISCON:
-                if a in ('\x1bWB', '\x1bA'):
-                    # Ready-to-dial or printer start states triggered: There is
-                    # an outgoing connection. Block inbound ones.
-                    self.block_inbound = True
-                    l.debug("Blocking inbound connections")
-                elif a == '\x1bZ':
-                    # Connection ended, unblock
-                    self.block_inbound = False
-                    l.debug("Unblocking inbound connections")
-            elif self._connected > ST.DISCON:
-                if a == '\x1bZ':   # end session
-                    if self._connected < ST.CON_TP_RUN and source == 'MCP':
-                        # Printer start failed, initiate disconnect with error
-                        # message
-                        self.printer_start_timed_out = True
-                    else:
-                        # Printer had already been started, disconnect normally
-                        self.disconnect_client()
-                elif self._connected == ST.CON_TP_RUN and a == '\x1bWELCOME' and source == 'MCP':
-                    # MCP says: Welcome banner has been received completely. Enable
-                    # non-command reads in read method so that normal communication
-                    # can begin.
-                    self._connected = ST.CON_FULL
+        if a.__class__ is txMessage.Message:
+            self.commands.dispatch(a, source)
             return
 
         if source in ['iTc', 'iTs']:
@@ -164,6 +155,41 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
 
         self._tx_buffer.append(a)
 
+    def write_many(self, text:str, source:str):
+        if source in ['iTc', 'iTs']:
+            return
+        self._tx_buffer.extend(text)
+
+    # -----
+
+    def _cmd_outbound(self, msg, source):
+        if self._connected <= ST.DISCON:
+            # Ready-to-dial or printer start states triggered: There is
+            # an outgoing connection. Block inbound ones.
+            self.block_inbound = True
+            l.debug("Blocking inbound connections")
+
+    def _cmd_Z(self, msg, source):
+        if self._connected <= ST.DISCON:
+            # Connection ended, unblock
+            self.block_inbound = False
+            l.debug("Unblocking inbound connections")
+        elif self._connected < ST.CON_TP_RUN and source == 'MCP':
+            # End session: Printer start failed, initiate disconnect with
+            # error message
+            self.printer_start_timed_out = True
+        else:
+            # End session: Printer had already been started, disconnect
+            # normally
+            self.disconnect_client()
+
+    def _cmd_WELCOME(self, msg, source):
+        if self._connected == ST.CON_TP_RUN and source == 'MCP':
+            # MCP says: Welcome banner has been received completely. Enable
+            # non-command reads in read method so that normal communication
+            # can begin.
+            self._connected = ST.CON_FULL
+
     # =====
 
     def thread_srv_accept_incoming_connections(self):
@@ -211,7 +237,7 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
                 client.close()
                 continue
             self.clients[client] = client_address
-            self._tx_buffer = []
+            self._tx_buffer.clear()
             Thread(target=self.thread_srv_handle_client, name='iTelexSrvHC', args=(client,)).start()
 
 
@@ -226,6 +252,7 @@ class TelexITelexSrv(txDevITelexCommon.TelexITelexCommon):
 
         s.close()
         with self._rx_lock: self._rx_buffer.append('\x1bZ')
+        self.notify()
         self._printer_running = False
         del self.clients[s]
 
@@ -24,13 +24,17 @@ import txBase
 #######
 
 class TelexKeyPad(txBase.TelexBase):
+    bus_chars = False
+    bus_commands = False
+    bus_throttle = True
+
     def __init__(self, **params):
         super().__init__()
 
         self.id = 'KPd'
         self.params = params
 
-        self._rx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
 
         self._device = None
 
@@ -85,10 +89,13 @@ class TelexKeyPad(txBase.TelexBase):
 
     def read(self) -> str:
         if self._rx_buffer:
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
         else:
             return ''
 
+    def read_many(self) -> str:
+        return self.pop_many(self._rx_buffer)
+
 
     def write(self, a:str, source:str):
         pass
@@ -126,6 +133,7 @@ class TelexKeyPad(txBase.TelexBase):
                         else:
                             text = ''
                         self._rx_buffer.append('\x1b' + x[0])
+                        self.notify()
                         continue
 
                     elif a in LUT_replace_chars:
@@ -133,5 +141,6 @@ class TelexKeyPad(txBase.TelexBase):
 
                     if a:
                         self._rx_buffer.append(a)
+                        self.notify()
 
 #######
\ No newline at end of file
@@ -17,7 +17,9 @@ import logging
 l = logging.getLogger("piTelex." + __name__)
 
 import txCode
+import txCodec   # registers the ita2, ita2-us, mkt2 and zuse codecs
 import txBase
+import txMessage
 import txCLI
 from txDevMCP_escape_texts import escape_texts
 from txWatchdog import Watchdog
@@ -45,6 +47,11 @@ S_ACTIVE_FONT = 22
 #######
 
 class TelexMCP(txBase.TelexBase):
+    bus_messages = True
+    bus_feedbacks = True
+    # read_file, escape texts and CLI answers must not flood the teleprinter
+    bus_throttle = True
+
     _fontstr = {'A': 'VSSV', 'B': '<YYR', 'C': 'CZZZ', 'D': '<ZZC', 'E': '<YYZ', 'F': '<SSE', 'G': 'CZYX', 'H': '<  <', 'I': 'Z<Z', 'J': '\rTZK', 'K': '< RZ', 'L': '<TTT', 'M': '<\n \n<', 'N': '<\n <', 'O': 'CZZZC', 'P': '<SS\n', 'Q': 'CZBV', 'R': '<SFL', 'S': 'LYYD', 'T': 'EE<EE', 'U': 'KTTK', 'V': 'U\rT\rU', 'W': '<\rI\r<', 'X': 'ZR RZ', 'Y': 'E\nM\nE', 'Z': 'ZBYWZ', '0': 'CZZC', '1': 'L<T', '2': 'BYYL', '3': 'ZYYR', '4': 'U V ', '5': 'UYYD', '6': 'NPYD', '7': 'EBSA', '8': 'RYYR', '9': 'LYFI', '.': 'OO', ',': 'ON', ';': 'GR', '+': '  <  ', '-': '    ', '*': 'YC CY', '/': 'T\r \nE', '=': 'RRRR', '(': 'CZ', ')': 'ZC', '?': 'EYY\n', "'": 'AA', ' ': '°°', '': '°', '\r': ' RZZ', '<': ' RZZ', '\n': 'YYYYY', '|': 'YYYYY'}
     _fontsep = '°'
 
@@ -66,7 +73,7 @@ class TelexMCP(txBase.TelexBase):
         self._power_button_timeout = params.get('power_button_timeout', 5*60)
         self._welcome_msg = params.get('welcome_msg', True)
         
-        self._rx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
 
         self._state = S_SLEEPING
         self._dial_number = ''
@@ -99,12 +106,14 @@ class TelexMCP(txBase.TelexBase):
 
         self._on_by_PT = False
 
-        self._hand_type_buffer = []
-        self._hand_type_wait = -1
+        self._hand_type_buffer = txBase.RingBuffer()
+        self._hand_type_timer = None
 
         self._last_char_was_cr = False
         self._cr_count = 0
 
+        self._init_commands()
+
     def __del__(self):
         super().__del__()
 
@@ -113,133 +122,23 @@ class TelexMCP(txBase.TelexBase):
         pass
 
 
-    def read(self) -> str:
-        if self._rx_buffer:
-            return self._rx_buffer.pop(0)
-
-
-    def write(self, a:str, source:str):
-        if len(a) > 1 and a[0] == '\x1b':
-            a = a[1:]
-            if a == '1T':   # 1T
-                if self._state <= S_OFFLINE:
-                    a = 'AT'
-                elif self._state == S_DIALING:
-                    a = 'LT'
-                else:
-                    a = 'ST'
-
-            if a == 'AT':   # AT
-                self._set_state(S_DIALING, True)
-                return True
-
-            if a == 'ST':   # ST
-                self._set_state(S_OFFLINE, True)
-                return True
-
-            if a == 'LT':   # LT
-                self._set_state(S_ACTIVE_INIT, True)
-                return True
-
-            if a == 'PT':   # PT
-                if self._state == S_SLEEPING:
-                    self._set_state(S_OFFLINE, True)
-                    self._wd.restart('POWER', self._power_button_timeout)
-                    self._on_by_PT = True
-                else:
-                    self._set_state(S_OFFLINE, True)
-                    self._wd.restart('POWER', 1)
-                return True
-
-            if a == 'Z':   # stop motor
-                self._set_state(S_OFFLINE)
-
-            if a == 'ZZ':   # sleeping
-                self._set_state(S_SLEEPING)
-
-            if a == 'A':   # start printer motor
-                self._set_state(S_ACTIVE_INIT)
-
-            if a == 'AA':   # printer ready
-                self._set_state(S_ACTIVE_READY)
-
-            if a == 'WB':   # start dialing
-                self._set_state(S_DIALING)
-
-            if a.startswith('~') or a.startswith('^'):   # printer buffer feedback
-                # Reset ACTIVE watchdog only if we're still online, to prevent
-                # re-enabling teleprinter power later
-                if self._state > S_OFFLINE:
-                    self._wd.restart('ACTIVE')
-                # If we're already in S_OFFLINE after a connection terminated,
-                # but have still data to print, avoid cutting power too early
-                # by resetting the timer on each ESC-~. On empty printer
-                # buffer, ESC-~'s will stop.
-                if self._wd.is_active('POWER'):
-                    if self._on_by_PT:
-                        self._wd.restart('POWER', self._power_button_timeout)
-                    else:
-                        self._wd.restart('POWER')
-                # Also reset WRU timer to avoid the fallback WRU responder from
-                # triggering before the teleprinter's has had a chance
-                if self._wd.is_active('WRU'):
-                    self._wd.restart('WRU')
-                return
-
-            if a == '...':   # printer busy
-                pass
-
-            if a == 'FONT':   # set to font mode
-                if self._state == S_ACTIVE_FONT:
-                    self._set_state(S_ACTIVE_READY)
-                else:
-                    self._set_state(S_ACTIVE_FONT)
-                return True
-
-            if a in escape_texts:
-                self._rx_buffer.extend(list(escape_texts[a]))   # send text
-                return True
-
-            if a == 'DATE':   # current date and time
-                text = time.strftime("%Y-%m-%d  %H:%M", time.localtime()) + '\r\n'
-                self._rx_buffer.extend(list(text))   # send text
-                return True
+    def set_scheduler(self, scheduler):
+        super().set_scheduler(scheduler)
+        # Run the timeouts as one-shot timers of the main loop
+        self._wd.set_scheduler(scheduler)
 
-            if a == 'I':   # welcome as server
-                # The welcome banner itself has a fixed total length of 24 characters:
-                text= '<<<\r\n'
-                if self._welcome_msg:
-                    text += time.strftime("%d.%m.%Y  %H:%M", time.localtime()) + '\r\n' 
-                #if self._WRU_ID:
-                #    text += self._WRU_ID   # send back device id
-                #else:
-                #    text += '#'
-                self._rx_buffer.extend(list(text))   # send text
-                if source == 'iTs':
-                    # Send command to inform ITelexSrv that the welcome banner has
-                    # been queued completely (unlocks non-command reads from
-                    # ITelexSrv)
-                    self._rx_buffer.append('\x1bWELCOME')
-                return True
 
-            if a == 'CLI':   # command line interface
-                l.info("Start CLI")
-                self.enable_cli(True)
-                return True
+    def read(self) -> str:
+        if self._rx_buffer:
+            return self._rx_buffer.popleft()
 
-            if a.startswith('READ'):
-                self.read_file(a[5:])
+    def read_many(self) -> str:
+        return self.pop_many(self._rx_buffer)
 
-            if a == 'EXIT':   # leave program
-                l.info("ESC-EXIT")
-                #self._set_state(S_OFFLINE)
-                raise(SystemExit('EXIT'))
 
-            if a == 'T':   # hand type simulator
-                if self._hand_type_wait >= 0:
-                    self._hand_type_wait = -1
-                else:
-                    self._hand_type_wait = 40   # 2 sec delay
+    def write(self, a:str, source:str):
+        if txMessage.is_command(a):
+            return self.commands.dispatch(txMessage.to_message(a, source), source)
 
         else:   # single char -------------------------------------------------
 
@@ -327,25 +226,149 @@ class TelexMCP(txBase.TelexBase):
                         # Invalid data, discard
                         return True
 
+    # =====
+
+    def _init_commands(self):
+        cmds = self.commands = txBase.CommandTable(self.id)
+        cmds.add('1T', self._cmd_1T)
+        cmds.add('AT', self._cmd_AT)
+        cmds.add('ST', self._cmd_ST)
+        cmds.add('LT', self._cmd_LT)
+        cmds.add('PT', self._cmd_PT)
+        cmds.add('Z', lambda msg, source: self._stop(S_OFFLINE))   # stop motor
+        cmds.add('ZZ', lambda msg, source: self._stop(S_SLEEPING))   # sleeping
+        cmds.add('A', lambda msg, source: self._set_state(S_ACTIVE_INIT))   # start printer motor
+        cmds.add('AA', lambda msg, source: self._set_state(S_ACTIVE_READY))   # printer ready
+        cmds.add('WB', lambda msg, source: self._set_state(S_DIALING))   # start dialing
+        cmds.add(('~', '^'), self._cmd_feedback, prefix=True)
+        cmds.ignore('...')   # printer busy
+        cmds.add('FONT', self._cmd_FONT)
+        cmds.add(tuple(escape_texts), self._cmd_text)
+        cmds.add('DATE', self._cmd_DATE)
+        cmds.add('I', self._cmd_I)
+        cmds.add('CLI', self._cmd_CLI)
+        cmds.add('READ', lambda msg, source: self.read_file(msg.payload), prefix=True)
+        cmds.add('EXIT', self._cmd_EXIT)
+        cmds.add('T', self._cmd_T)
+
     # -----
 
-    def idle20Hz(self):
-        self._wd.process()
-
-        # hand type simulator
-        if self._hand_type_wait >= 0:
-            if self._hand_type_wait == 0:
-                if not self._hand_type_buffer:
-                    self._hand_type_buffer = list(escape_texts['LOREM'])
-                a = self._hand_type_buffer.pop(0)
-                self._rx_buffer.append(a)   # send text
-                self._hand_type_wait = int(random.random()**2.0 * 5 + 2)   # emulate human typing waits
-                if a in ('\r', '\n'):
-                    self._hand_type_wait += 7
-                if a in (' ', '.', ',', '<', '>'):
-                    self._hand_type_wait += 1
+    def _cmd_1T(self, msg, source):
+        if self._state <= S_OFFLINE:
+            return self._cmd_AT(msg, source)
+        elif self._state == S_DIALING:
+            return self._cmd_LT(msg, source)
+        else:
+            return self._cmd_ST(msg, source)
+
+    def _cmd_AT(self, msg, source):
+        self._set_state(S_DIALING, True)
+        return True
+
+    def _cmd_ST(self, msg, source):
+        if msg.urgent and self._state == S_OFFLINE:
+            # Stop key while text is still printing after the end of a
+            # connection (e.g. a news item): abort printing
+            self._send_control_sequence('Z', True)
+        self._stop(S_OFFLINE, True, msg.urgent)
+        return True
+
+    def _cmd_LT(self, msg, source):
+        self._set_state(S_ACTIVE_INIT, True)
+        return True
+
+    def _cmd_PT(self, msg, source):
+        if self._state == S_SLEEPING:
+            self._set_state(S_OFFLINE, True)
+            self._wd.restart('POWER', self._power_button_timeout)
+            self._on_by_PT = True
+        else:
+            self._set_state(S_OFFLINE, True)
+            self._wd.restart('POWER', 1)
+        return True
+
+    def _cmd_feedback(self, msg, source):   # printer buffer feedback
+        # Reset ACTIVE watchdog only if we're still online, to prevent
+        # re-enabling teleprinter power later
+        if self._state > S_OFFLINE:
+            self._wd.restart('ACTIVE')
+        # If we're already in S_OFFLINE after a connection terminated,
+        # but have still data to print, avoid cutting power too early
+        # by resetting the timer on each ESC-~. On empty printer
+        # buffer, ESC-~'s will stop.
+        if self._wd.is_active('POWER'):
+            if self._on_by_PT:
+                self._wd.restart('POWER', self._power_button_timeout)
             else:
-                self._hand_type_wait -= 1
+                self._wd.restart('POWER')
+        # Also reset WRU timer to avoid the fallback WRU responder from
+        # triggering before the teleprinter's has had a chance
+        if self._wd.is_active('WRU'):
+            self._wd.restart('WRU')
+
+    def _cmd_FONT(self, msg, source):   # set to font mode
+        if self._state == S_ACTIVE_FONT:
+            self._set_state(S_ACTIVE_READY)
+        else:
+            self._set_state(S_ACTIVE_FONT)
+        return True
+
+    def _cmd_text(self, msg, source):
+        self._rx_buffer.extend(escape_texts[msg.code])   # send text
+        return True
+
+    def _cmd_DATE(self, msg, source):   # current date and time
+        text = time.strftime("%Y-%m-%d  %H:%M", time.localtime()) + '\r\n'
+        self._rx_buffer.extend(text)   # send text
+        return True
+
+    def _cmd_I(self, msg, source):   # welcome as server
+        # The welcome banner itself has a fixed total length of 24 characters:
+        text= '<<<\r\n'
+        if self._welcome_msg:
+            text += time.strftime("%d.%m.%Y  %H:%M", time.localtime()) + '\r\n' 
+        #if self._WRU_ID:
+        #    text += self._WRU_ID   # send back device id
+        #else:
+        #    text += '#'
+        self._rx_buffer.extend(text)   # send text
+        if source == 'iTs':
+            # Send command to inform ITelexSrv that the welcome banner has
+            # been queued completely (unlocks non-command reads from
+            # ITelexSrv)
+            self._rx_buffer.append('\x1bWELCOME')
+        return True
+
+    def _cmd_CLI(self, msg, source):   # command line interface
+        l.info("Start CLI")
+        self.enable_cli(True)
+        return True
+
+    def _cmd_EXIT(self, msg, source):   # leave program
+        l.info("ESC-EXIT")
+        #self._set_state(S_OFFLINE)
+        raise(SystemExit('EXIT'))
+
+    def _cmd_T(self, msg, source):   # hand type simulator
+        if self._hand_type_timer:
+            self._hand_type_timer.cancel()
+            self._hand_type_timer = None
+        else:
+            self._hand_type_timer = self.scheduler.after(2.0, self._hand_type, self.id + '.hand_type')   # 2 sec delay
+
+    def _hand_type(self):
+        if not self._hand_type_buffer:
+            self._hand_type_buffer = txBase.RingBuffer(escape_texts['LOREM'])
+        a = self._hand_type_buffer.popleft()
+        self._rx_buffer.append(a)   # send text
+        wait = int(random.random()**2.0 * 5 + 2)   # emulate human typing waits
+        if a in ('\r', '\n'):
+            wait += 7
+        if a in (' ', '.', ',', '<', '>'):
+            wait += 1
+        self._hand_type_timer = self.scheduler.after((wait + 1) * 0.05, self._hand_type, self.id + '.hand_type')
+
+    # -----
 
     def idle2Hz(self):
         if self._state == S_ACTIVE_NO_P and self._continue_with_no_printer:
@@ -354,8 +377,23 @@ class TelexMCP(txBase.TelexBase):
 
     # =====
 
-    def _set_state(self, new_state:int, broadcast_state:bool=False):
-        ''' set new state and change hardware properties '''
+    def _stop(self, new_state:int, broadcast_state:bool=False, urgent:bool=False):
+        '''
+        go offline or sleeping by ESC-Z, ESC-ZZ or ESC-ST of another device;
+        text still held back by flow control is dropped, as the teleprinter
+        drivers drop their buffers (but not the last words of send_abort)
+        '''
+        if new_state != self._state and self._rx_buffer.discard_chars():
+            l.info("Text not printed yet discarded")
+        self._set_state(new_state, broadcast_state, urgent)
+
+    # -----
+
+    def _set_state(self, new_state:int, broadcast_state:bool=False, urgent:bool=False):
+        '''
+        set new state and change hardware properties; urgent broadcasts ESC-Z
+        in the priority lane (see txMessage.URGENT)
+        '''
         if self._state == new_state:
             return
         l.debug('set_state {} -> {}'.format(self._state, new_state))
@@ -385,7 +423,7 @@ class TelexMCP(txBase.TelexBase):
             self.enable_cli(False)
 
             if broadcast_state:
-                self._send_control_sequence('Z')
+                self._send_control_sequence('Z', urgent)
 
         elif new_state == S_DIALING:
             self._dial_number = ''
@@ -446,8 +484,11 @@ class TelexMCP(txBase.TelexBase):
 
     # -----
 
-    def _send_control_sequence(self, cmd:str):
-        self._rx_buffer.append('\x1b'+cmd)
+    def _send_control_sequence(self, cmd:str, urgent:bool=False):
+        if urgent:
+            self._rx_buffer.push('\x1b'+cmd)
+        else:
+            self._rx_buffer.append('\x1b'+cmd)
 
     # -----
 
@@ -471,8 +512,7 @@ class TelexMCP(txBase.TelexBase):
                         text = text.replace(us, eu)
                     text = txCode.BaudotMurrayCode.translate(text)
                     if True:
-                        mc = txCode.BaudotMurrayCode()
-                        bintext = mc.encodeA2BM(text)
+                        bintext = text.encode('ita2', 'telex')
                         with open(base_name+'_.bin', 'wb') as wfp:
                             wfp.write(bintext)
 
@@ -480,8 +520,7 @@ class TelexMCP(txBase.TelexBase):
             if name:
                 with open(name, 'rb') as fp:
                     bintext = fp.read()
-                    mc = txCode.BaudotMurrayCode(flip_bits=name.endswith('ls'))
-                    text = mc.decodeBM2A(bintext)
+                    text = bintext.decode('ita2-flipped' if name.endswith('ls') else 'ita2', 'telex')
 
             if text:
                 self._rx_buffer.extend(list(text))
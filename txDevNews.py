@@ -22,6 +22,10 @@ import txBase
 #######
 
 class TelexNews(txBase.TelexBase):
+    bus_chars = False
+    bus_commands = ('A', 'Z', 'WB')
+    bus_throttle = True
+
     class EventHandler(PatternMatchingEventHandler):
         patterns = ["*.txt", "*.rsstx", "*.news"]
         _last_path = ''
@@ -71,7 +75,7 @@ class TelexNews(txBase.TelexBase):
 
         self._newspath = params.get('newspath', './news')
         self._print_path = self.params.get('print_path', False)
-        self._rx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
         self._news_buffer = []
         self._state_counter = 1
 
@@ -92,7 +96,10 @@ class TelexNews(txBase.TelexBase):
 
     def read(self) -> str:
         if self._rx_buffer:
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
+
+    def read_many(self) -> str:
+        return self.pop_many(self._rx_buffer)
 
 
     def write(self, a:str, source:str):
@@ -9,17 +9,14 @@ __copyright__   = "Copyright 2018, JK"
 __license__     = "GPL3"
 __version__     = "0.0.1"
 
-from threading import Thread
-#import ssl
-import socket
-import time
+import asyncio
 import json
 
 import logging
 l = logging.getLogger("piTelex." + __name__)
 
 import txCode
-import txBase
+import txAsync
 import log
 
 #######
@@ -28,24 +25,27 @@ def LOG(text:str, level:int=3):
     log.LOG('\033[30;46m<'+text+'>\033[0m', level)
 
 
-class TelexREST(txBase.TelexBase):
+class TelexREST(txAsync.AsyncTelexBase):
+    bus_chars = False
+    bus_commands = ('Z',)
+
     def __init__(self, **params):
         super().__init__()
 
         self.id = 'Rst'
         self.params = params
 
+        # Connections in progress, cancelled on exit
+        self._connections = set()
+
 
     def exit(self):
-        #self.disconnect_client()
-        pass
+        for connection in list(self._connections):
+            connection.cancel()
+        super().exit()
 
     # =====
 
-    def read(self) -> str:
-        pass
-
-
     def write(self, a:str, source:str):
         if len(a) != 1:
             if a == '\x1bZ':   # end session
@@ -61,42 +61,39 @@ class TelexREST(txBase.TelexBase):
         #self._tx_buffer.append(a)
         #return True   #debug
 
-
-    def idle(self):
-        pass
-
     # =====
 
     def connect_client(self, msg):
-        Thread(target=self.thread_connect_as_client, name='REST', args=(msg,)).start()
+        connection = asyncio.run_coroutine_threadsafe(self.connect_as_client(msg), self.loop)
+        self._connections.add(connection)
+        connection.add_done_callback(self._connections.discard)
 
     # =====
 
-    def thread_connect_as_client(self, msg):
+    async def connect_as_client(self, msg):
+        writer = None
         try:
             # connect to destination Telex
-
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s_base:
-                if msg.get('SSL', False):
-                    s = ssl.wrap_socket(s_base)
-                else:
-                    s = s_base
-                LOG('connected to '+msg['Name'], 3)
-                address = (msg['Host'], int(msg['Port']))
-                s.connect(address)
-
-                a = msg['Text']
-                a = a.replace('\\r', '\r')
-                a = a.replace('\\n', '\n')
-                data = a.encode('UTF-8')
-                s.sendall(data)
-                LOG('SEND',1)
-                time.sleep(3)
-
+            LOG('connected to '+msg['Name'], 3)
+            _, writer = await asyncio.open_connection(msg['Host'], int(msg['Port']), ssl=msg.get('SSL', False) or None)
+
+            a = msg['Text']
+            a = a.replace('\\r', '\r')
+            a = a.replace('\\n', '\n')
+            data = a.encode('UTF-8')
+            writer.write(data)
+            await writer.drain()
+            LOG('SEND',1)
+            await asyncio.sleep(3)
+
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
             LOG(str(e))
 
-        #s.close()
+        finally:
+            if writer:
+                writer.close()
 
     # =====
 
@@ -69,7 +69,7 @@ class TelexRPiCtrl(txBase.TelexBase):
         if self._delay_ST:
             self._wd.init(name="DELAY_ST", callback=self._delay_ST_watchdog_callback, time_out_period=self._delay_ST)
 
-        self._rx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
         self._mode = None
 
         self._status_out = 0
@@ -174,7 +174,7 @@ class TelexRPiCtrl(txBase.TelexBase):
     def read(self) -> str:
         if self._rx_buffer:
             self._set_status('C')
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
 
     # -----
 
@@ -214,11 +214,6 @@ class TelexRPiCtrl(txBase.TelexBase):
                 self._LED_Z.on()
                 self._LED_Z_count = 0    
 
-    # -----
-
-    def idle(self):
-        pass
-
     # =====
 
     def _check_commands(self, a:str):
@@ -289,6 +284,7 @@ class TelexRPiCtrl(txBase.TelexBase):
         if level == 1:
             return
         self._rx_buffer.append('\x1b1T')
+        self.notify()
 
     def _callback_button_AT(self, gpio, level, tick):
         if level == 1:
@@ -300,6 +296,7 @@ class TelexRPiCtrl(txBase.TelexBase):
 
     def _delay_AT_watchdog_callback(self, name:str):
         self._rx_buffer.append('\x1bAT')
+        self.notify()
 
     def _callback_button_ST(self, gpio, level, tick):
         if level == 1:
@@ -310,46 +307,54 @@ class TelexRPiCtrl(txBase.TelexBase):
             self._delay_ST_watchdog_callback("")
 
     def _delay_ST_watchdog_callback(self, name:str):
-        self._rx_buffer.append('\x1bST')
+        self._rx_buffer.push('\x1bST')
+        self.notify()
 
     def _callback_button_LT(self, gpio, level, tick):
         if level == 1:
             return
         self._LT_pressed = True
         self._rx_buffer.append('\x1bLT')
+        self.notify()
 
     def _callback_button_PT(self, gpio, level, tick):
         if level == 1:
             return
         self._rx_buffer.append('\x1bPT')
+        self.notify()
 
     def _callback_button_U1(self, gpio, level, tick):
         if level == 1:
             return
         text = self.params.get('text_button_U1', 'RY')
         self._rx_buffer.extend(list(text))
+        self.notify()
 
     def _callback_button_U2(self, gpio, level, tick):
         if level == 1:
             return
         text = self.params.get('text_button_U2', 'RY'*30)
         self._rx_buffer.extend(list(text))
+        self.notify()
 
     def _callback_button_U3(self, gpio, level, tick):
         if level == 1:
             return
         text = self.params.get('text_button_U3', '#')
         self._rx_buffer.extend(list(text))
+        self.notify()
 
     def _callback_button_U4(self, gpio, level, tick):
         if level == 1:
             return
         text = self.params.get('text_button_U4', '@')
         self._rx_buffer.extend(list(text))
+        self.notify()
 
     def _callback_number_switch(self, text:str):
         if text.isnumeric():
             self._rx_buffer.append(text)
+            self.notify()
             self._set_status('PE')
         else:
             self._set_status('P')
@@ -23,6 +23,7 @@ l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txMessage
 import log
 from RPiIO import NumberSwitch, Observer, pi, pi_exit
 
@@ -39,6 +40,11 @@ S_ACTIVE_READY = 21
 #######
 
 class TelexRPiTTY(txBase.TelexBase):
+    # Flow control by printer buffer feedback (ESC-~), see txFlow
+    bus_window = 50
+    # Commands as txMessage.Message, to see urgent ones (priority lane)
+    bus_messages = True
+
     def __init__(self, **params):
         super().__init__()
 
@@ -51,8 +57,8 @@ class TelexRPiTTY(txBase.TelexBase):
         self._use_squelch = True
         self._keep_alive_counter = 0
 
-        self._tx_buffer = []
-        self._rx_buffer = []
+        self._tx_buffer = txBase.RingBuffer()
+        self._rx_buffer = txBase.RingBuffer()
 
         # get setting params
 
@@ -133,6 +139,17 @@ class TelexRPiTTY(txBase.TelexBase):
 
         self.last_wid = None
 
+        # control sequences, executed in order with the characters (see idle)
+
+        self.commands = txBase.CommandTable(self.id)
+        self.commands.add('ZZ', lambda a: self._set_state(S_SLEEPING))
+        self.commands.add('Z', self._cmd_offline)
+        self.commands.add('WB', self._cmd_dial)
+        self.commands.add('A', lambda a: self._set_state(S_ACTIVE_INIT))
+        self.commands.add('AA', lambda a: self._set_state(S_ACTIVE_READY))
+        self.commands.add('TP0', lambda a: self._enable_power(False))
+        self.commands.add('TP1', lambda a: self._enable_power(True))
+
         # init state
 
         self._set_state(S_SLEEPING)
@@ -159,7 +176,11 @@ class TelexRPiTTY(txBase.TelexBase):
     def read(self) -> str:
         ''' called by system to get next input character '''
         if self._rx_buffer:
-            return self._rx_buffer.pop(0)
+            return self._rx_buffer.popleft()
+
+    def read_many(self) -> str:
+        ''' called by system to get next command or run of input characters '''
+        return self.pop_many(self._rx_buffer)
 
     # -----
 
@@ -167,14 +188,26 @@ class TelexRPiTTY(txBase.TelexBase):
         ''' called by system to output next character or send control sequence '''
         if a:
             if a == '#':   a = '@'   # WRU - ask teletype for hardware ID (KG)
-            self._tx_buffer.append(a)
+            self._tx_buffer.push(a)
             if self._double_WR and a == '\r':
                 self._tx_buffer.append(a)
 
+    def write_many(self, text:str, source:str):
+        ''' called by system to output a run of characters '''
+        text = text.replace('#', '@')   # WRU - ask teletype for hardware ID (KG)
+        if self._double_WR:
+            text = text.replace('\r', '\r\r')
+        self._tx_buffer.extend(text)
+
     # =====
 
     def idle(self):
         ''' called by system as often as possible to do background stuff '''
+        if txMessage.is_urgent(self._tx_buffer.peek()):
+            # priority lane: act at once, even while transmitting or squelched
+            self.commands.dispatch(self._tx_buffer.popleft())
+            return
+
         if not self._tx_buffer \
             or (self._use_squelch and (time.monotonic() <= self._time_squelch)) \
             or self._is_writing_wave():
@@ -182,19 +215,17 @@ class TelexRPiTTY(txBase.TelexBase):
 
         text = ''
         while self._tx_buffer \
-            and len(self._tx_buffer[0]) == 1 \
+            and not txMessage.is_command(self._tx_buffer[0]) \
             and len(text) <= 66:
-            text += self._tx_buffer.pop(0)
+            text += self._tx_buffer.popleft()
 
         if text:
             if self._state >= S_ACTIVE_INIT:
                 self._write_wave(text)
             self._keep_alive_counter = 0
 
-        elif self._tx_buffer and len(self._tx_buffer[0]) > 1:   # control sequence
-            a = self._tx_buffer.pop(0)
-            if len(a) > 1 and a[0] == '\x1b':
-                self._check_commands(a[1:])
+        elif self._tx_buffer:   # control sequence
+            self.commands.dispatch(self._tx_buffer.popleft())
 
     # -----
 
@@ -230,7 +261,7 @@ class TelexRPiTTY(txBase.TelexBase):
                     self._rx_buffer.append(a)
                     # T68d printer is set for BU after sending WRU, set it back to Zi immediately, won't hurt on other TTYs
                     if a == '@':
-                        self._tx_buffer.insert(0, '>')
+                        self._tx_buffer.appendleft('>')
 
             if self._line_observer:
                 self._line_observer.reset()
@@ -257,7 +288,7 @@ class TelexRPiTTY(txBase.TelexBase):
             self._keep_alive_counter += 1
             if self._mode == 'V10' and self._keep_alive_counter > 60:   # 30sec
                 self._keep_alive_counter = 0
-                self._tx_buffer.insert(0, '°')
+                self._tx_buffer.appendleft('°')
 
         elif self._state == S_ACTIVE_INIT:
             if self._line_observer:
@@ -267,33 +298,18 @@ class TelexRPiTTY(txBase.TelexBase):
 
     # =====
 
-    def _check_commands(self, a:str):
-        ''' check for control sequences and set new state '''
-        if a == 'ZZ':
-            self._set_state(S_SLEEPING)
-
-        elif a == 'Z':
-            self._set_state(S_OFFLINE)
-            self._tx_buffer = []    # empty write buffer...
-            self._send_control_sequence('~0')
+    def _cmd_offline(self, a:str):
+        if txMessage.is_urgent(a) and self._is_writing_wave():
+            pi.wave_tx_stop()   # aborted by ST, see txMessage.URGENT
+        self._set_state(S_OFFLINE)
+        self._tx_buffer.clear()    # empty write buffer...
+        self._send_control_sequence('~0')
 
-        elif a == 'WB':
-            if self._mode in ('TW39', 'TW39H', 'AGT', 'AGT-TW39'):
-                self._set_state(S_DIALING_PULSE)
-            else:
-                self._set_state(S_DIALING_KEYBOARD)
-
-        elif a == 'A':
-            self._set_state(S_ACTIVE_INIT)
-
-        elif a == 'AA':
-            self._set_state(S_ACTIVE_READY)
-
-        elif a == 'TP0':
-            self._enable_power(False)
-
-        elif a == 'TP1':
-            self._enable_power(True)
+    def _cmd_dial(self, a:str):
+        if self._mode in ('TW39', 'TW39H', 'AGT', 'AGT-TW39'):
+            self._set_state(S_DIALING_PULSE)
+        else:
+            self._set_state(S_DIALING_KEYBOARD)
 
     # -----
 
@@ -352,7 +368,7 @@ class TelexRPiTTY(txBase.TelexBase):
     # -----
 
     def _send_control_sequence(self, cmd:str):
-        self._rx_buffer.append('\x1b'+cmd)
+        self._rx_buffer.push('\x1b'+cmd)
 
     # -----
 
@@ -463,6 +479,7 @@ class TelexRPiTTY(txBase.TelexBase):
     def _callback_number_switch(self, text:str):
         if text.isnumeric():
             self._rx_buffer.append(text)
+            self.notify()
 
    # -----
 
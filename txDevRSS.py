@@ -41,6 +41,7 @@ import json
 
 import txBase
 import txCode
+import txSupervisor
 
 import log
 import logging
@@ -66,22 +67,29 @@ class RSS_Client():
         self.q = queue.Queue()
         self._urls = urls
         self.running = True
-        self.thread = threading.Thread(target=self.thread_function, name='RSS_Client')
+        self._stop_event = threading.Event()
+        # guid of the latest item per url, kept when the thread is restarted
+        self._feeds = {}
+        for url in self._urls:
+            self._feeds[url] = None
+        # restarted by the supervisor if it ends by an exception; a feed
+        # taking longer than the heartbeat timeout is reported as hanging
+        self.thread = txSupervisor.register('RSS_Client', self.thread_function, heartbeat_timeout=300)
         self.thread.start()
 
    def stop(self, quit_msg='Wah!'):
         self.running = False
+        self._stop_event.set()
+        self.thread.stop()
         self.thread.join()
 
         del self
 
 
    def thread_function(self):
-        feeds = {}
-        for url in self._urls:
-            feeds[url] = None
-        print(feeds)
+        feeds = self._feeds
         while self.running:
+            self.thread.beat()
             try:
                 for url in self._urls:
                     rss = feedparser.parse(url)
@@ -98,14 +106,18 @@ class RSS_Client():
                         for item in items[::-1] :
                             self.q.put(item)
                         feeds[url] = rss['items'][0]['guid']
-                time.sleep(60)
             except Exception as e:
                 LOG("Error in rss client: {}".format(str(e)), 1)
+            self._stop_event.wait(60)
             
 
 #######
 
 class TelexRSS(txBase.TelexBase):
+    bus_chars = False
+    bus_commands = False
+    bus_throttle = True
+
     def __init__(self, **params):
         super().__init__()
 
@@ -113,24 +125,21 @@ class TelexRSS(txBase.TelexBase):
         self.params = params
 
 
-        self._rx_buffer = []
-        self._tx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
+        self._tx_buffer = txBase.RingBuffer()
 
         # init Twitter Client
         self._rss_client = RSS_Client(
             params.get("urls", [])
         )
         self._format=params.get("format","{title}\n")
-        self._running = True
-        self._thread = threading.Thread(target=self.thread_function, name='Twitter_Handler_V2')
-        self._thread.start()
+        self._formatstr, self._elements = self.parse_format(self._format)
+        self._consumer = txBase.QueueConsumer(self.handle_item, 'RSS_Handler', self._rss_client.q)
 
 
-    def __del__(self):
-        super().__del__()
-        self._running = False
-        self._twitter_client.stop()
-        self._thread.join()
+    def exit(self):
+        self._rss_client.stop()
+        self._consumer.stop()
 
     # =====
 
@@ -138,57 +147,64 @@ class TelexRSS(txBase.TelexBase):
         ret = ''
 
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
 
         return ret
 
+    def read_many(self) -> str:
+        return self.pop_many(self._rx_buffer)
+
 
     def write(self, a:str, source:str):
         pass
 
-    def thread_function(self):
+    @staticmethod
+    def parse_format(format:str):
         """
-            Twitter client handler
+            Split format into a format string with positional fields and the
+            list of item elements to fill in
         """
-        formatstr = self._format
+        formatstr = format
         elements = []
-        for match in re.findall("\{.*?\}",self._format):
+        for match in re.findall("\{.*?\}",format):
             formatstr = formatstr.replace(match,"{}")
             matchstr=str(match)
             matchstr=matchstr.replace("{","")
             matchstr=matchstr.replace("}","")
             elements.append(matchstr)
-        while self._running:
-            if not self._rss_client.q.empty() :
-                try:
-                    data = self._rss_client.q.get()
-                    values = []
-                    for e in elements :
-                        if e == "published" :
-                            pubTime = data.get("published_parsed",None)
-                            if pubTime :
-                                values.append(time.strftime("%d-%m-%y %H:%M:%S",pubTime))
-                            else:
-                                values.append(None)
-                        else :
-                            values.append(data.get(e,""))
-                    msg = formatstr.format(*values)
-                    lines = str(msg).split("\n")
-                    linewidth = 68
-                    out_lines = []
-                    for line in lines:
-                        bmc = txCode.BaudotMurrayCode.ascii_to_tty_text(line.strip())
-                        bmc = bmc.replace("@","(A)")
-                        while len(bmc) >= linewidth:
-                            out_lines.append(bmc[0:linewidth])
-                            bmc = bmc[linewidth:]
-                        out_lines.append(bmc)
-                    txt_out = "\r\n".join(out_lines)
-
-                    for c in txt_out:
-                        self._rx_buffer.append(c)
-
-                except Exception as e:
-                   LOG("txDevRSS.thread_function: {}".format(str(e)),1)
-
-        LOG('end rss handler', 2)
+        return formatstr, elements
+
+    def handle_item(self, data):
+        """
+            RSS item handler, called by the consumer thread
+        """
+        try:
+            values = []
+            for e in self._elements :
+                if e == "published" :
+                    pubTime = data.get("published_parsed",None)
+                    if pubTime :
+                        values.append(time.strftime("%d-%m-%y %H:%M:%S",pubTime))
+                    else:
+                        values.append(None)
+                else :
+                    values.append(data.get(e,""))
+            msg = self._formatstr.format(*values)
+            lines = str(msg).split("\n")
+            linewidth = 68
+            out_lines = []
+            for line in lines:
+                bmc = txCode.BaudotMurrayCode.ascii_to_tty_text(line.strip())
+                bmc = bmc.replace("@","(A)")
+                while len(bmc) >= linewidth:
+                    out_lines.append(bmc[0:linewidth])
+                    bmc = bmc[linewidth:]
+                out_lines.append(bmc)
+            txt_out = "\r\n".join(out_lines)
+
+            for c in txt_out:
+                self._rx_buffer.append(c)
+            self.notify()
+
+        except Exception as e:
+           LOG("txDevRSS.handle_item: {}".format(str(e)),1)
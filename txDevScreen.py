@@ -9,12 +9,14 @@ __license__     = "GPL3"
 __version__     = "0.0.1"
 
 import os
+import time
 
 import logging
 l = logging.getLogger("piTelex." + __name__)
 
 import txBase
 import txCode
+import txSupervisor
 
 # Windows
 if os.name == 'nt':
@@ -106,7 +108,7 @@ class TelexScreen(txBase.TelexBase):
         self.id = 'Scn'
         self.params = params
 
-        self._rx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
         self._escape = ''
 
         self._show_BuZi = self.params.get('show_BuZi', True)
@@ -133,6 +135,13 @@ class TelexScreen(txBase.TelexBase):
             # Support normal-terminal reset at exit
             atexit.register(self.set_normal_term)
 
+        # The keyboard is read by a thread, restarted by the supervisor if it
+        # ends by an exception
+        self._keys = txBase.RingBuffer()
+        self._run = True
+        self._rx_thread = txSupervisor.register('Screen_rx', self.thread_rx, heartbeat_timeout=10)
+        self._rx_thread.start()
+
 
     def __del__(self):
         ''' Resets to normal terminal.  On Windows this is a no-op. '''
@@ -142,6 +151,10 @@ class TelexScreen(txBase.TelexBase):
 
 
     def exit(self):
+        self._run = False
+        self._rx_thread.stop()
+        self._rx_thread.join(2)
+
         if os.name == 'nt':
             pass
 
@@ -163,21 +176,21 @@ class TelexScreen(txBase.TelexBase):
     def read(self) -> str:
         ret = ''
 
-        if self.kbhit():
-            k = self.getch()
+        while self._keys:
+            k = self._keys.popleft()
             if k:
                 #print(int(k))
-                if k == b'\xe0':
-                    k = self.getch()
+                if k[:1] == b'\xe0':
+                    k = k[1:]
                     c = self._LUT_replace_windows_ctrl_chars.get(k, '')
                     if c:
                         print('\033[1;33;41m{'+c[1:]+'}\033[0m', end='', flush=True)
-                        self._rx_buffer.append(c)
-                    return '' # eat cursor and control keys
+                        self._rx_buffer.push(c)
+                    continue   # eat cursor and control keys
                 if k == b'\x1b' or k == '\x1b':
                     self._escape = '\x1b'
                     print('\033[0;37;41m{\033[0m', end='', flush=True)
-                    return ''
+                    continue
 
                 if os.name == 'nt':
                     c = k.decode('cp850', errors='ignore')
@@ -187,7 +200,7 @@ class TelexScreen(txBase.TelexBase):
                 if self._escape:
                     if c == '\r' or c == '\n':
                         self._escape = self._escape.upper()
-                        self._rx_buffer.append(self._escape)
+                        self._rx_buffer.push(self._escape)
                         print('\033[0;37;41m}\033[0m', end='', flush=True)
                         self._escape = ''
                     else:
@@ -196,7 +209,7 @@ class TelexScreen(txBase.TelexBase):
                         c = self._LUT_replace_linux_escape_seqs.get(self._escape, '')
                         if c:
                             self._escape = c
-                            self._rx_buffer.append(self._escape)
+                            self._rx_buffer.push(self._escape)
                             print('\033[0;92;41m'+self._escape[1:]+'\033[0m', end='', flush=True)
                             self._escape = ''
                 else:
@@ -206,7 +219,7 @@ class TelexScreen(txBase.TelexBase):
                         c = txCode.BaudotMurrayCode.ascii_to_tty_text(c)
 
                     if c[0] == '\x1b':
-                        self._rx_buffer.append(c)
+                        self._rx_buffer.push(c)
                     else:
                         for a in c:
                             self._rx_buffer.append(a)
@@ -228,10 +241,29 @@ class TelexScreen(txBase.TelexBase):
                                 print('\033[1;31m'+a+'\033[0m', end='', flush=True)
 
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
 
         return ret
 
+    # -----
+
+    def thread_rx(self):
+        '''
+        Read the keyboard and wake up the main loop for each key. The keys are
+        handled (and echoed) by read(), so that all output is printed by the
+        main loop.
+        '''
+        while self._run:
+            self._rx_thread.beat()
+            if self.kbhit(0.5):
+                k = self.getch()
+                if k == b'\xe0':   # cursor and control keys (Windows)
+                    k += self.getch()
+                self._keys.append(k)
+                self.notify()
+            elif os.name == 'nt':
+                time.sleep(0.01)
+
 
     def write(self, a:str, source:str):
         if len(a) != 1:   # escape sequ.
@@ -258,6 +290,27 @@ class TelexScreen(txBase.TelexBase):
                 a = '\033[0;33m'+a+'\033[0m'
             print(a, end='', flush=True)
 
+
+    def write_many(self, text:str, source:str):
+        out = []
+        for a in text:
+            if a == '\r' or a == '\n':
+                out.append(a)
+                # Print line ending cue for new lines
+                if a == '\n' and self._show_line:
+                    out.append('\033[70G'+'|'+'\033[0G'+'\033[0m')
+                continue
+            if not self._show_BuZi and a in '<>':   # Bi Zi
+                continue
+            if a in self._LUT_show_special_chars:
+                a = self._LUT_show_special_chars[a]
+            if not self._show_capital:
+                a = a.lower()
+            if source == 'MCP':   # DevMCP
+                a = '\033[0;33m'+a+'\033[0m'
+            out.append(a)
+        print(''.join(out), end='', flush=True)
+
     # =====
 
     def getch(self):
@@ -273,13 +326,16 @@ class TelexScreen(txBase.TelexBase):
             return sys.stdin.read(1)
 
 
-    def kbhit(self):
-        ''' Returns True if keyboard character was hit, False otherwise. '''
+    def kbhit(self, timeout:float=0):
+        '''
+        Returns True if keyboard character was hit, False otherwise. Waits up
+        to timeout for it (not on Windows).
+        '''
         if os.name == 'nt':
             return msvcrt.kbhit()
 
         else:
-            dr, dw, de = select([sys.stdin], [], [], 0)
+            dr, dw, de = select([sys.stdin], [], [], timeout)
 
             #dr, dw, de = select([self.fd], [], [], 0)
 
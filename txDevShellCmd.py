@@ -38,6 +38,8 @@ else:
 #######
 
 class TelexShellCmd(txBase.TelexBase):
+    bus_chars = False
+
     def __init__(self, **params):
         super().__init__()
 
@@ -51,7 +53,7 @@ class TelexShellCmd(txBase.TelexBase):
             for key in keys:
                 self._LUT[key.upper().strip()] = cmd
 
-        self._rx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
 
     # -----
 
@@ -67,7 +69,7 @@ class TelexShellCmd(txBase.TelexBase):
 
     def read(self) -> str:
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
             return ret
 
     # -----
@@ -14,12 +14,14 @@ __version__     = "0.0.2"
 import serial
 import serial.rs485
 import time
+from threading import Lock
 
 import logging
 l = logging.getLogger("piTelex." + __name__)
 
 import txCode
 import txBase
+import txSupervisor
 import log
 
 #######
@@ -50,7 +52,10 @@ class TelexTerminal(txBase.TelexBase):
         self._replace_char = self.params.get('replace_char', {})
         self._replace_esc = self.params.get('replace_esc', {})
 
-        self._rx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
+        # Held while writing a character or escape text to the terminal, so
+        # that the local echo of the reader thread goes in between
+        self._tty_lock = Lock()
 
         # init serial
         if RS485:
@@ -74,6 +79,8 @@ class TelexTerminal(txBase.TelexBase):
         self._tty.dsrdtr = dsrdtr
         self._tty.rtscts = rtscts
         self._tty.xonxoff = xonxoff
+        # Let the reader thread beat and check for exit once a second
+        self._tty.timeout = 1.0
         if RS485:
             self._tty.rs485_mode = serial.rs485.RS485Settings()
 
@@ -83,9 +90,21 @@ class TelexTerminal(txBase.TelexBase):
         
         self.char_count = 0
 
+        # The keyboard is read by a thread, restarted by the supervisor if it
+        # ends by an exception (e.g. USB adapter unplugged)
+        self._run = True
+        self._rx_thread = None
+        if not self._send_only:
+            self._rx_thread = txSupervisor.register('Terminal_rx', self.thread_rx, heartbeat_timeout=10)
+            self._rx_thread.start()
+
     # -----
 
     def exit(self):
+        self._run = False
+        if self._rx_thread:
+            self._rx_thread.stop()
+            self._rx_thread.join(2)
         self._tty.close()
 
     # -----
@@ -96,27 +115,34 @@ class TelexTerminal(txBase.TelexBase):
     # =====
 
     def read(self) -> str:
-        if self._send_only:
-            return
-        if self._tty.in_waiting:
+        if self._rx_buffer:
+            return self._rx_buffer.popleft()
+
+    # -----
+
+    def thread_rx(self):
+        ''' read the keyboard and wake up the main loop for each character '''
+        while self._run:
+            self._rx_thread.beat()
             b = self._tty.read(1)
-            if b[0] < 0x20:
-                pass
-            else:
-                if self._local_echo:
+            if not b or b[0] < 0x20:
+                continue
+            if self._local_echo:
+                with self._tty_lock:
                     self._write_raw(b)
-                a = b.decode('ASCII', errors='ignore')
-                if a:
-                    a = a.upper()
-                    self._rx_buffer.append(a)
-
-        if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
-            return ret
+            a = b.decode('ASCII', errors='ignore')
+            if a:
+                self._rx_buffer.append(a.upper())
+                self.notify()
 
     # -----
 
     def write(self, a:str, source:str):
+        with self._tty_lock:
+            self._write(a, source)
+
+
+    def _write(self, a:str, source:str):
         if not a:
             return
 
@@ -201,16 +227,6 @@ class TelexTerminal(txBase.TelexBase):
 
     # =====
 
-    def idle20Hz(self):
-        pass
-
-    # -----
-
-    def idle(self):
-        pass
-
-    # =====
-
     def _check_commands(self, a:str):
         if a == 'A':
             pass
@@ -25,6 +25,7 @@ from twitivity import Event
 
 import json
 
+import txBase
 import txDevITelexCommon
 import txCode
 
@@ -39,6 +40,12 @@ def LOG(text:str, level:int=3):
 
 
 class TelexTwitter(txDevITelexCommon.TelexITelexCommon):
+    bus_commands = ('A', 'Z', 'WB')
+    # write() parses command strings itself (unlike TelexITelexCommon)
+    bus_messages = False
+    # no use for the buffer feedback of the other devices
+    bus_feedbacks = False
+
     def __init__(self, **params):
         super().__init__()
         self.id = 'Twt'
@@ -46,21 +53,23 @@ class TelexTwitter(txDevITelexCommon.TelexITelexCommon):
         self.chars_buffer = ''
         self._is_online = False
         self.twitter_client = Twitter_Client(params.get("consumer_key", ""), params.get("consumer_secret", ""), params.get("access_token_key", ""), params.get("access_token_secret", ""), params.get("follow", []),  params.get("track", []), params.get("languages", []), params.get("url", []), params.get("host", []), params.get("port", []))
-        self.thread = threading.Thread(target=self.thread_function, name='Twitter_Handler')
-        self.thread.start()
+        self._last_date = None
+        self._consumer = txBase.QueueConsumer(self.handle_msg, 'Twitter_Handler', self.twitter_client.q)
+        self._tx_consumer = txBase.QueueConsumer(self.add_chars, 'Twitter_Tx')
 
 
     def exit(self):
         self.twitter_client.stop()
         self.running = False
-        self.thread.join()
+        self._consumer.stop()
+        self._tx_consumer.stop()
 
     # =====
 
     def read(self) -> str:
         if self._rx_buffer:
             if self._is_online:
-                return self._rx_buffer.pop(0)
+                return self._rx_buffer.popleft()
             else:
                 self._is_online = True
                 return '\x1bA'
@@ -78,7 +87,7 @@ class TelexTwitter(txDevITelexCommon.TelexITelexCommon):
             return
 
         if a not in "<>":
-            self._tx_buffer.append(a)
+            self._tx_consumer.put(str(a.encode('ASCII'), 'utf8').lower())
 
     # =====
 
@@ -93,50 +102,36 @@ class TelexTwitter(txDevITelexCommon.TelexITelexCommon):
             self.chars_buffer += char
 
 
-    def thread_function(self):
+    def handle_msg(self, data):
         """
-            Twitter client handler
+            Twitter message handler, called by the consumer thread
         """
-        last_date = None
-        while self.running:
-            try:
-                data = self.twitter_client.get_msg()
-                if data is not None:
-                    if isinstance(data, dict):
-                       #LOG(json.dumps(data), 1)
-                       events = data['tweet_create_events']
-                       uname =  events[0]['user']['screen_name']
-                       ctime = datetime.datetime.strptime(events[0]['created_at'], '%a %b %d %H:%M:%S %z %Y')
-                       txt = events[0]['text']
-                    else:
-                       uname = data.user.screen_name
-                       ctime = data.created_at
-                       txt = data.text
-                    #if data['type'] == 'ACTION':
-                    msg = f'={uname} = {txt}'
-                    #if data['msg'].startswith(f'{self.irc_client.nick}:'):
-                    #    msg = f'{msg}\a\a\a' # BEL
-                    LOG(uname)
-
-                    if '@' + uname in self.twitter_client.follow or not self.twitter_client.follow:
-                        msg = f'{ctime.strftime("%H:%M")} {msg}\n\r'
-                        if last_date != ctime.timetuple().tm_yday:
-                            msg = f'{ctime.strftime("%A %d %B")}\n\r {msg}'
-                            last_date = ctime.timetuple().tm_yday
-                        text = txCode.BaudotMurrayCode.ascii_to_tty_text(msg)
-                        # TODO: insert linebreak after 65 characters
-                        for a in text:
-                            self._rx_buffer.append(a)
-
-                if self._tx_buffer:
-                    a = self._tx_buffer.pop(0)
-                    data = str(a.encode('ASCII'), 'utf8').lower()
-                    self.add_chars(data)
-            except Exception as e:
-               LOG(str(e),1)
-
-        LOG('end connection', 2)
-        self._connected = False
+        if isinstance(data, dict):
+           #LOG(json.dumps(data), 1)
+           events = data['tweet_create_events']
+           uname =  events[0]['user']['screen_name']
+           ctime = datetime.datetime.strptime(events[0]['created_at'], '%a %b %d %H:%M:%S %z %Y')
+           txt = events[0]['text']
+        else:
+           uname = data.user.screen_name
+           ctime = data.created_at
+           txt = data.text
+        #if data['type'] == 'ACTION':
+        msg = f'={uname} = {txt}'
+        #if data['msg'].startswith(f'{self.irc_client.nick}:'):
+        #    msg = f'{msg}\a\a\a' # BEL
+        LOG(uname)
+
+        if '@' + uname in self.twitter_client.follow or not self.twitter_client.follow:
+            msg = f'{ctime.strftime("%H:%M")} {msg}\n\r'
+            if self._last_date != ctime.timetuple().tm_yday:
+                msg = f'{ctime.strftime("%A %d %B")}\n\r {msg}'
+                self._last_date = ctime.timetuple().tm_yday
+            text = txCode.BaudotMurrayCode.ascii_to_tty_text(msg)
+            # TODO: insert linebreak after 65 characters
+            for a in text:
+                self._rx_buffer.append(a)
+            self.notify()
 
 
 #######
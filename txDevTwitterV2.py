@@ -35,7 +35,6 @@ __version__ = "0.5.0"
 
 
 import threading
-import time
 import datetime
 import queue
 import tweepy
@@ -76,6 +75,7 @@ class Twitter_Client_V2():
         self.last_id = 0
         self.q = queue.Queue()
         self.running = True
+        self._stop_event = threading.Event()
         self.thread = threading.Thread(target=self.thread_function, name='Twitter_Client_V2')
         self.thread.start()
 
@@ -96,6 +96,7 @@ class Twitter_Client_V2():
 
    def stop(self, quit_msg='Wah!'):
         self.running = False
+        self._stop_event.set()
         self.thread.join()
         #self.api.close()
 
@@ -147,12 +148,14 @@ class Twitter_Client_V2():
                             self.last_id=tweet['id']
                 except tweepy.TweepError as e:
                     LOG(str(e), 1)
-                
-                time.sleep(15)
+
+            self._stop_event.wait(15)
 
 #######
 
 class TelexTwitterV2(txBase.TelexBase):
+    bus_commands = False
+
     def __init__(self, **params):
         super().__init__()
 
@@ -160,8 +163,8 @@ class TelexTwitterV2(txBase.TelexBase):
         self.params = params
 
 
-        self._rx_buffer = []
-        self._tx_buffer = []
+        self._rx_buffer = txBase.RingBuffer()
+        self._tx_buffer = txBase.RingBuffer()
 
         # init Twitter Client
         self._twitter_client = Twitter_Client_V2(
@@ -172,17 +175,13 @@ class TelexTwitterV2(txBase.TelexBase):
             params.get("bearer_token", ""),  
             params.get("user_mentions", "")
         )
-        self._running = True
-        LOG("Starting thread function")
-        self._thread = threading.Thread(target=self.thread_function, name='Twitter_Handler_V2')
-        self._thread.start()
+        LOG("Starting tweet handler")
+        self._consumer = txBase.QueueConsumer(self.handle_tweet, 'Twitter_Handler_V2', self._twitter_client.q)
 
 
-    def __del__(self):
-        super().__del__()
-        self._running = False
+    def exit(self):
         self._twitter_client.stop()
-        self._thread.join()
+        self._consumer.stop()
 
     # =====
 
@@ -190,10 +189,13 @@ class TelexTwitterV2(txBase.TelexBase):
         ret = ''
 
         if self._rx_buffer:
-            ret = self._rx_buffer.pop(0)
+            ret = self._rx_buffer.popleft()
 
         return ret
 
+    def read_many(self) -> str:
+        return self.pop_many(self._rx_buffer)
+
 
     def write(self, a:str, source:str):
         if len(a) != 1:
@@ -204,7 +206,7 @@ class TelexTwitterV2(txBase.TelexBase):
                 s = ''.join(self._tx_buffer)
 
                 r = self._twitter_client.send_msg(s)
-                self._tx_buffer = []
+                self._tx_buffer.clear()
 
         elif a == '\r':
             pass
@@ -212,39 +214,35 @@ class TelexTwitterV2(txBase.TelexBase):
             self._tx_buffer.append(a)
 
 
-    def thread_function(self):
+    def handle_tweet(self, data):
         """
-            Twitter client handler
+            Tweet handler, called by the consumer thread
         """
-        while self._running:
-            if not self._twitter_client.q.empty() :
-                try:
-                    linewidth = 68
-                    data = self._twitter_client.q.get()
-                    lines = str(data['escaped']).split("\n")
-                    out_lines = []
-                    for line in lines:
-                        bmc = txCode.BaudotMurrayCode.ascii_to_tty_text(line.strip())
-                        bmc = bmc.replace("@","(A)")
-                        while len(bmc) >= linewidth:
-                            out_lines.append(bmc[0:linewidth])
-                            bmc = bmc[linewidth:]
-                        out_lines.append(bmc)
-                    tweet_txt_out = "\r\n\r".join(out_lines)
-
-                    msg = "\r---\r\n\r{}\r\n\r{} (@{})\r\n\r{}\r\r\n---\r\n\r\n\r".format(
-                          tweet_txt_out,
-                          data['user']['name'],
-                          data['user']['username'],
-                          data['tweet']["created_at"]
-                    )
-                    msg = msg.replace("@", "(A)")
-
-                    text = txCode.BaudotMurrayCode.ascii_to_tty_text(msg)
-                    for c in text:
-                        self._rx_buffer.append(c)
+        try:
+            linewidth = 68
+            lines = str(data['escaped']).split("\n")
+            out_lines = []
+            for line in lines:
+                bmc = txCode.BaudotMurrayCode.ascii_to_tty_text(line.strip())
+                bmc = bmc.replace("@","(A)")
+                while len(bmc) >= linewidth:
+                    out_lines.append(bmc[0:linewidth])
+                    bmc = bmc[linewidth:]
+                out_lines.append(bmc)
+            tweet_txt_out = "\r\n\r".join(out_lines)
+
+            msg = "\r---\r\n\r{}\r\n\r{} (@{})\r\n\r{}\r\r\n---\r\n\r\n\r".format(
+                  tweet_txt_out,
+                  data['user']['name'],
+                  data['user']['username'],
+                  data['tweet']["created_at"]
+            )
+            msg = msg.replace("@", "(A)")
 
-                except Exception as e:
-                   LOG("txDevTwitterV2.thread_function: {}".format(str(e)),1)
+            text = txCode.BaudotMurrayCode.ascii_to_tty_text(msg)
+            for c in text:
+                self._rx_buffer.append(c)
+            self.notify()
 
-        LOG('end twitter handler', 2)
+        except Exception as e:
+           LOG("txDevTwitterV2.handle_tweet: {}".format(str(e)),1)
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+"""
+Telex Flow Control - credit based throttling of fast local sources (files,
+news, macros) by the buffer feedback of the teleprinter drivers
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import time
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+# Seconds without feedback after which a sink is assumed not to print (e.g.
+# offline) and its credit is renewed, so sources never block for good
+STALE = 3.0
+
+# Seconds between deliveries of the coalesced buffer feedback (see Feedback)
+FEEDBACK_PERIOD = 0.050
+
+#######
+
+class Credit:
+    '''
+    Free capacity of a sink: its window minus the buffer length last reported
+    by its feedback command (e.g. ESC-~) minus the characters written to it
+    since then.
+    '''
+    __slots__ = ('id', 'window', 'feedback_code', 'fill', 'written', 'time',
+                 'feedbacks', 'stale', 'throttled')
+
+    def __init__(self, id:str, window:int, feedback_code:str):
+        self.id = id
+        self.window = window
+        self.feedback_code = feedback_code
+        self.fill = 0
+        self.written = 0
+        self.time = time.monotonic()
+        # Statistics
+        self.feedbacks = 0
+        self.stale = 0
+        self.throttled = 0
+
+
+    def feedback(self, fill:int):
+        ''' the sink reported fill characters still to print '''
+        self.fill = fill
+        self.written = 0
+        self.time = time.monotonic()
+        self.feedbacks += 1
+
+
+    def available(self) -> int:
+        if (self.fill or self.written) and time.monotonic() - self.time > STALE:
+            # No feedback for a while (e.g. the last one reported a full
+            # buffer, then the printer stopped reporting): renew credit
+            self.stale += 1
+            self.feedback(0)
+        return self.window - self.fill - self.written
+
+
+    def stats(self) -> dict:
+        return {
+            'window': self.window,
+            'available': self.window - self.fill - self.written,
+            'feedbacks': self.feedbacks,
+            'stale': self.stale,
+            'throttled': self.throttled,
+            }
+
+#######
+
+def create(device):
+    '''
+    Return a Credit for device if it declares bus_window (overridden by its
+    parameter "flow_window"; 0 disables flow control), else None.
+    '''
+    params = getattr(device, 'params', None) or {}
+    window = params.get('flow_window', device.bus_window)
+    if not window:
+        return None
+    return Credit(device.id, window, device.bus_feedback)
+
+
+def available(credits:list):
+    '''
+    Return the smallest credit of credits, None if empty (unlimited). Counts
+    throttling of the sink limiting the source.
+    '''
+    if not credits:
+        return None
+    ret = None
+    for credit in credits:
+        n = credit.available()
+        if ret is None or n < ret:
+            ret = n
+            limiting = credit
+    if ret <= 0:
+        limiting.throttled += 1
+    return ret
+
+#######
+
+class Feedback:
+    '''
+    Buffer feedback (ESC-~, ESC-^) read from the devices of a line, coalesced
+    to the latest value per source and command: the main loop delivers it to
+    the devices declaring bus_feedbacks every FEEDBACK_PERIOD seconds only.
+    Values replaced before delivery are counted in collapsed.
+    '''
+    def __init__(self):
+        self.pending = {}   # (source device, code) -> Message
+        # Statistics
+        self.received = 0
+        self.collapsed = 0
+        self.delivered = 0
+
+
+    def put(self, device, msg):
+        key = (device, msg.code)
+        if key in self.pending:
+            self.collapsed += 1
+        self.pending[key] = msg
+        self.received += 1
+
+
+    def take(self) -> list:
+        ''' remove and return the pending feedback as [(device, Message)] '''
+        items = [(device, msg) for (device, _), msg in self.pending.items()]
+        self.pending.clear()
+        self.delivered += len(items)
+        return items
+
+
+    def stats(self) -> dict:
+        return {
+            'received': self.received,
+            'collapsed': self.collapsed,
+            'delivered': self.delivered,
+            }
+
+#######
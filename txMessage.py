@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+"""
+Telex Message - bus commands as objects, parsed once (by the producer or the
+main loop) instead of by every device receiving them
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import time
+
+# Message kinds
+COMMAND  = 'cmd'        # plain command, e.g. A, Z, WB, AT, ST
+FEEDBACK = 'feedback'   # buffer length as int: ~ (own printer), ^ (remote printer)
+DIAL     = 'dial'       # number to dial: #<number>, #!<number>
+QUERY    = 'query'      # number to look up in the TNS: ?<number>
+READ     = 'read'       # file to print: READ <name>
+
+# Parameterized commands: code, kind, payload type, separator before payload
+PARAMETERIZED = (
+    ('READ', READ, str, ' '),
+    ('~', FEEDBACK, int, ''),
+    ('^', FEEDBACK, int, ''),
+    ('#', DIAL, str, ''),
+    ('?', QUERY, str, ''),
+    )
+
+# Priority lane: commands which may overtake the characters and commands
+# queued before them (txBase.RingBuffer.push), marked Message.urgent on the
+# bus, so that write workers and teleprinter drivers act on them at once, too:
+# - ~, ^: buffer feedback, describes the buffer at the time it is sent; always
+#   urgent
+# - ST: stop key pressed by the operator, text still queued is void
+# - Z: end of connection forced by an urgent ST (see txDevMCP)
+# Everything else keeps its place, and so do ST and Z unless queued by push,
+# e.g. ESC-ST ending a news item after its text (txDevNews) or ESC-Z ending a
+# connection after the text received.
+URGENT = ('ST', 'Z', '~', '^')
+
+# Codes of the buffer feedback commands
+FEEDBACK_CODES = tuple(code for code, kind, _, _ in PARAMETERIZED if kind == FEEDBACK)
+
+_KINDS = {code: kind for code, kind, _, _ in PARAMETERIZED}
+_SEPARATORS = {code: sep for code, _, _, sep in PARAMETERIZED}
+
+#######
+
+class Message:
+    '''
+    A command on the bus. Devices declaring bus_messages get these in write()
+    instead of the '\\x1b'-prefixed strings; str(message) is the string form
+    for all others.
+    '''
+    __slots__ = ('kind', 'code', 'payload', 'source', 'timestamp', 'urgent', '_text')
+
+    def __init__(self, code:str, payload=None, source:str=None, text:str=None):
+        self.kind = _KINDS.get(code, COMMAND)
+        self.code = code
+        self.payload = payload
+        self.source = source
+        self.timestamp = time.monotonic()
+        self.urgent = self.kind == FEEDBACK   # priority lane, see URGENT
+        self._text = text
+
+
+    def __str__(self):
+        if self._text is None:
+            text = '\x1b' + self.code
+            if self.payload is not None:
+                text += _SEPARATORS.get(self.code, '') + str(self.payload)
+            self._text = text
+        return self._text
+
+
+    def __repr__(self):
+        return 'Message({!r}, {!r})'.format(str(self), self.source)
+
+    # =====
+
+    @staticmethod
+    def parse(text:str, source:str=None):
+        '''
+        Return the Message for the command string text ('\\x1b' + command).
+        Payloads that cannot be converted are None.
+        '''
+        body = text[1:]
+        for code, kind, conv, sep in PARAMETERIZED:
+            if body.startswith(code):
+                try:
+                    payload = conv(body[len(code) + len(sep):])
+                except ValueError:
+                    payload = None
+                return Message(code, payload, source, text)
+        return Message(body, None, source, text)
+
+#######
+
+def is_command(item) -> bool:
+    ''' True for a Message or a command string, False for characters '''
+    return item.__class__ is Message or (len(item) > 1 and item[0] == '\x1b')
+
+
+def is_urgent(item) -> bool:
+    ''' True for a Message queued in the priority lane (see URGENT) '''
+    return item.__class__ is Message and item.urgent
+
+
+def to_message(item, source:str=None) -> Message:
+    ''' return item as Message; item is a Message or a command string '''
+    if item.__class__ is Message:
+        return item
+    return Message.parse(item, source)
+
+#######
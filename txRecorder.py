@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+"""
+Telex Recorder - record the bus traffic of process_data to a file and replay
+it into a headless piTelex core, comparing the output with the recording
+
+File format: JSON lines, gzip compressed if the file name ends with '.gz'.
+The first line is a header (with the ids of the devices in bus order); each
+further line holds one item read from a device:
+
+    [time in ms since start, source id, item, [ids of devices written to]]
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import gzip
+import json
+import time
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+import txBase
+import txStats
+from txMessage import FEEDBACK_CODES
+
+FORMAT = 'piTelex-record'
+VERSION = 1
+
+#######
+
+def _open(filename:str, mode:str):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode + 't', encoding='UTF-8')
+    return open(filename, mode, encoding='UTF-8')
+
+# =====
+
+class Recorder:
+    '''
+    writes the items passing through process_data to filename; devices are
+    the ids of all devices in bus order (with line prefix), so that the
+    replay routes to them in the same order
+    '''
+    def __init__(self, filename:str, devices:list=()):
+        self.filename = filename
+        self.count = 0
+        self._start = time.monotonic()
+        self._fp = _open(filename, 'w')
+        self._fp.write(json.dumps({'format': FORMAT, 'version': VERSION,
+            'start': time.strftime("%Y-%m-%d %H:%M:%S"), 'devices': list(devices)}) + '\n')
+
+
+    def record(self, source:str, item:str, targets:list, stopped_by=None, prefix:str=''):
+        '''
+        Record item read from source and written to targets up to and
+        including stopped_by, the device discarding it (None if none did).
+        prefix is prepended to the device ids (line name, see telex.Line).
+        '''
+        ids = []
+        for target in targets:
+            ids.append(prefix + target.id)
+            if target is stopped_by:
+                break
+        self._fp.write(json.dumps([round((time.monotonic() - self._start) * 1000, 1),
+            prefix + source, str(item), ids], ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.count += 1
+
+
+    def flush(self):
+        self._fp.flush()
+
+
+    def close(self):
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+            l.info("Recorded {} items to {!r}".format(self.count, self.filename))
+
+# -----
+
+def _read_header(filename:str, fp) -> dict:
+    header = json.loads(fp.readline())
+    if header.get('format') != FORMAT:
+        raise ValueError("{!r} is no piTelex recording".format(filename))
+    return header
+
+
+def read_header(filename:str) -> dict:
+    with _open(filename, 'r') as fp:
+        return _read_header(filename, fp)
+
+
+def read_records(filename:str):
+    ''' yield the records of filename as (ms, source, item, target ids) '''
+    with _open(filename, 'r') as fp:
+        _read_header(filename, fp)
+        for line in fp:
+            if line.strip():
+                yield tuple(json.loads(line))
+
+#######
+
+class ReplayDevice(txBase.TelexBase):
+    '''
+    Stands in for a recorded device: emits its recorded items when due and
+    records the items written to it. Its bus interest is set by the replayer
+    from what the device got in the recording.
+    '''
+    def __init__(self, id:str):
+        super().__init__()
+        self.id = id
+        self.bus_chars = False
+        self.bus_commands = False
+        self.bus_sources = ()
+        self._items = txBase.RingBuffer()   # (due time, item)
+        self.last_due = None
+        self.received = []   # (time, item, source)
+
+
+    def schedule(self, due:float, item:str):
+        self._items.append((due, item))
+
+
+    def next_due(self) -> float:
+        item = self._items.peek()
+        return item[0] if item else None
+
+
+    def read(self) -> str:
+        if self._items and self._items[0][0] <= time.monotonic():
+            self.last_due, item = self._items.popleft()
+            return item
+
+
+    def write(self, a:str, source:str):
+        self.received.append((time.monotonic(), str(a), source))
+
+#######
+
+def split_id(id:str) -> tuple:
+    ''' split a recorded device id into line prefix and device id '''
+    n = id.rfind('/') + 1
+    return id[:n], id[n:]
+
+#######
+
+class Replayer:
+    '''
+    Replay filename into the piTelex core (telex.process_data). All recorded
+    devices are replaced by ReplayDevices, except the real devices given
+    (e.g. a TelexMCP), whose output is compared with the recording instead.
+    The devices of each line (id prefix, see telex.Line) get a bus of their
+    own; real devices replace devices of the default line only.
+    ReplayDevices never discard data, so discarding shows up as divergence.
+    speed: 1 for real time, n for n times faster, 0 for maximum speed.
+    '''
+    def __init__(self, filename:str, speed:float=1, devices:list=()):
+        self.filename = filename
+        self.speed = speed
+        self.real = {device.id: device for device in devices}
+        self.replay = {}
+        self.recorded = []
+        self.replayed = []
+        self.latency = {}   # device id -> txStats.Histogram
+
+
+    def run(self) -> dict:
+        import telex
+
+        records = list(read_records(self.filename))
+        # bus order of the recording; recordings without it get the order of
+        # first appearance, which may differ from the recorded target order
+        ids = list(read_header(self.filename).get('devices', ()))
+        for _, source, _, targets in records:
+            for id in [source] + targets:
+                if id not in ids:
+                    ids.append(id)
+        self.lines = {'': telex.LINE}
+        telex.DEVICES[:] = []
+        for id in ids:
+            prefix, local_id = split_id(id)
+            line = self.lines.get(prefix)
+            if line is None:
+                line = self.lines[prefix] = telex.Line(prefix[:-1])
+            device = self.real.get(local_id) if not prefix else None
+            line.devices.append(device or self.replay.setdefault(id, ReplayDevice(local_id)))
+        for _, source, item, targets in records:
+            for id in targets:
+                device = self.replay.get(id)
+                if device:
+                    if item[0] == '\x1b' and item.startswith(FEEDBACK_CODES, 1):
+                        device.bus_feedbacks = True
+                    elif item[0] == '\x1b':
+                        device.bus_commands = True
+                    else:
+                        device.bus_chars = True
+                    source_id = split_id(source)[1]
+                    if source_id not in device.bus_sources:
+                        device.bus_sources += (source_id,)
+        telex.WORKERS.clear()
+        telex.CREDITS.clear()
+        for line in self.lines.values():
+            telex.init_routes(line)
+        if self.real:
+            telex.SCHEDULER.wakeup = None
+            telex.init_scheduler()
+
+        start = time.monotonic()
+        for ms, source, item, targets in records:
+            self.recorded.append((source, item, targets))
+            if source not in self.real:
+                # output of real devices is compared only
+                due = start + ms / 1000 / self.speed if self.speed else start
+                self.replay[source].schedule(due, item)
+
+        recorder = telex.RECORDER
+        telex.RECORDER = self
+        try:
+            self._loop(telex)
+        finally:
+            telex.RECORDER = recorder
+        duration = time.monotonic() - start
+        return self.report(duration, records[-1][0] / 1000 if records else 0)
+
+
+    def _loop(self, telex):
+        pending = lambda: [d for d in self.replay.values() if d.next_due() is not None]
+        while True:
+            # buffer feedback is delivered after each pass, as recorded items
+            # arrive coalesced already
+            for line in self.lines.values():
+                while telex.process_data(line):
+                    telex.flush_feedback(line)
+                telex.flush_feedback(line)
+            if self.real:
+                telex.SCHEDULER.run_due()
+            devices = pending()
+            if not devices:
+                break
+            due = min(d.next_due() for d in devices)
+            timeout = due - time.monotonic()
+            if timeout > 0:
+                time.sleep(min(timeout, 0.005) if self.real else timeout)
+        # let the real devices finish (timeouts, watchdogs)
+        if self.real and self.speed:
+            end = time.monotonic() + 1
+            while time.monotonic() < end:
+                for line in self.lines.values():
+                    telex.process_data(line)
+                telex.SCHEDULER.run_due()
+                time.sleep(0.005)
+
+    # =====
+
+    def record(self, source:str, item:str, targets:list, stopped_by=None, prefix:str=''):
+        '''
+        called by process_data instead of Recorder.record; measures the latency
+        from the recorded time of replayed items to their arrival
+        '''
+        now = time.monotonic()
+        device = self.replay.get(prefix + source)
+        due = device.last_due if device else None
+        ids = []
+        for target in targets:
+            ids.append(prefix + target.id)
+            if due is not None:
+                t = target.received[-1][0] if isinstance(target, ReplayDevice) and target.received else now
+                self.latency.setdefault(prefix + target.id, txStats.Histogram()).add(int((t - due) * 1e9))
+            if target is stopped_by:
+                break
+        self.replayed.append((prefix + source, str(item), ids))
+
+    # -----
+
+    def report(self, duration:float, recorded_duration:float) -> dict:
+        ''' compare replayed with recorded items, per source '''
+        divergence = {}
+        for source in dict.fromkeys(s for s, _, _ in self.recorded):
+            rec = [(i, t) for s, i, t in self.recorded if s == source]
+            rep = [(i, t) for s, i, t in self.replayed if s == source]
+            first = next((n for n, (a, b) in enumerate(zip(rec, rep)) if a != b), None)
+            if first is None and len(rec) != len(rep):
+                first = min(len(rec), len(rep))
+            if first is not None:
+                divergence[source] = {
+                    'recorded': len(rec),
+                    'replayed': len(rep),
+                    'first': first,
+                    'expected': rec[first] if first < len(rec) else None,
+                    'got': rep[first] if first < len(rep) else None,
+                    }
+        latency = {id: {
+            'count': h.count,
+            'p50_us': h.percentile(50) / 1000,
+            'p99_us': h.percentile(99) / 1000,
+            'max_us': h.max / 1000,
+            } for id, h in sorted(self.latency.items())}
+        return {
+            'file': self.filename,
+            'speed': self.speed or 'max',
+            'items': len(self.recorded),
+            'recorded_s': round(recorded_duration, 3),
+            'replay_s': round(duration, 3),
+            'latency': latency,
+            'divergence': divergence,
+            }
+
+#######
@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+"""
+Telex Scheduler - periodic and one-shot callbacks of the main loop, kept in a
+heap ordered by deadline
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import heapq
+import time
+from time import perf_counter, perf_counter_ns
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+import txStats
+import txStall
+
+#######
+
+class Timer:
+    '''
+    A scheduled callback with its statistics. period is None for one-shot
+    timers.
+    '''
+    __slots__ = ('name', 'callback', 'period', 'deadline', 'cancelled',
+                 'calls', 'missed', 'jitter_sum', 'jitter_max')
+
+    def __init__(self, name:str, callback, period, deadline:float):
+        self.name = name
+        self.callback = callback
+        self.period = period
+        self.deadline = deadline
+        self.cancelled = False
+        self.calls = 0
+        self.missed = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+
+    def cancel(self):
+        self.cancelled = True
+
+#######
+
+class Scheduler:
+    def __init__(self):
+        self._heap = []
+        self._seq = 0   # keeps order of registration for equal deadlines
+        self._timers = []
+        # Set by the main loop; woken when a timer is due earlier than before
+        self.wakeup = None
+
+    # =====
+
+    def every(self, period:float, callback, name:str, start:float=None) -> Timer:
+        ''' call callback every period seconds, first time at start '''
+        if start is None:
+            start = time.monotonic() + period
+        timer = Timer(name, callback, period, start)
+        self._timers.append(timer)
+        self._push(timer)
+        return timer
+
+    def after(self, delay:float, callback, name:str) -> Timer:
+        ''' call callback once after delay seconds '''
+        timer = Timer(name, callback, None, time.monotonic() + delay)
+        self._push(timer)
+        return timer
+
+    def postpone(self, timer:Timer, delay:float) -> Timer:
+        '''
+        move the deadline of a pending one-shot timer to delay seconds from
+        now. A later deadline is taken up when the timer's heap entry comes
+        due, so frequent postponing (watchdogs) doesn't grow the heap.
+        '''
+        deadline = time.monotonic() + delay
+        earlier = deadline < timer.deadline
+        timer.deadline = deadline
+        if earlier:
+            # the old entry is skipped as stale when it comes due
+            self._push(timer)
+        return timer
+
+    # -----
+
+    def _push(self, timer:Timer):
+        earlier = not self._heap or timer.deadline < self._heap[0][0]
+        heapq.heappush(self._heap, (timer.deadline, self._seq, timer))
+        self._seq += 1
+        if earlier and self.wakeup:
+            self.wakeup.set()
+
+    # =====
+
+    def next_deadline(self) -> float:
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else time.monotonic() + 1
+
+    # -----
+
+    def run_due(self) -> int:
+        '''
+        Call all callbacks that are due, return their number. Periodic timers
+        late by one or more periods count these as missed and skip them.
+        '''
+        heap = self._heap
+        now = time.monotonic()
+        count = 0
+
+        while heap and heap[0][0] <= now:
+            deadline, _, timer = heapq.heappop(heap)
+            if timer.cancelled or deadline > timer.deadline:
+                # cancelled, or stale entry of a timer postponed to earlier
+                continue
+            if deadline < timer.deadline:
+                # postponed
+                heapq.heappush(heap, (timer.deadline, self._seq, timer))
+                self._seq += 1
+                continue
+
+            jitter = now - deadline
+            timer.calls += 1
+            timer.jitter_sum += jitter
+            if jitter > timer.jitter_max:
+                timer.jitter_max = jitter
+
+            t = perf_counter_ns()
+            stall = txStall.DETECTOR
+            if stall:
+                stall.current = (timer.name, None, perf_counter())
+            try:
+                timer.callback()
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception as e:
+                l.warning("Uncaught Exception in {}(): {!r}".format(timer.name, e))
+            if stall:
+                stall.current = None
+            if txStats.ENABLED:
+                txStats.histogram(timer.name).add(perf_counter_ns() - t)
+            count += 1
+
+            if timer.period and not timer.cancelled:
+                deadline += timer.period
+                if deadline <= now:
+                    missed = int((now - deadline) / timer.period) + 1
+                    timer.missed += missed
+                    deadline += missed * timer.period
+                timer.deadline = deadline
+                heapq.heappush(heap, (deadline, self._seq, timer))
+                self._seq += 1
+
+        return count
+
+    # =====
+
+    def report(self) -> str:
+        ''' return jitter and missed deadlines of all periodic callbacks '''
+        lines = ['{:<24} {:>5} {:>9} {:>9} {:>9} {:>7}'.format(
+            'callback', 'ms', 'calls', 'avg_ms', 'max_ms', 'missed')]
+        for t in self._timers:
+            lines.append('{:<24} {:>5.0f} {:>9} {:>9.3f} {:>9.3f} {:>7}'.format(
+                t.name, t.period * 1000, t.calls,
+                t.jitter_sum / t.calls * 1000 if t.calls else 0,
+                t.jitter_max * 1000, t.missed))
+        return '\n'.join(lines)
+
+#######
@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+"""
+Telex Stall Detector - watchdog thread noticing read, write and idle calls of
+the main loop taking longer than a threshold (e.g. a blocking TNS query or
+shell command), logging the stack of the main loop while it is stuck
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from time import perf_counter
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+# The running detector, None if disabled. The main loop sets its current
+# call around each device call: DETECTOR.current = (name, item, perf_counter())
+DETECTOR = None
+
+#######
+
+class StallDetector:
+    '''
+    Watches the calls of the main loop thread announced in current. A call
+    running longer than threshold seconds is recorded once, with the stack of
+    the main loop thread, in recent (the last ring stalls). At most log_limit
+    stalls per log_period seconds are logged with their stack, the others are
+    counted in suppressed.
+    '''
+    def __init__(self, threshold:float=1.0, ring:int=20, log_limit:int=5, log_period:float=60):
+        self.threshold = threshold
+        self.log_limit = log_limit
+        self.log_period = log_period
+        self.current = None   # (name, item, start), set by the main loop
+        self.recent = deque(maxlen=ring)
+        self.count = 0
+        self.suppressed = 0
+        self._last = None   # call recorded last
+        self._log_times = deque()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+
+    def start(self, thread_id:int=None):
+        ''' watch thread_id, by default the calling thread '''
+        self._thread_id = thread_id or threading.get_ident()
+        self._thread = threading.Thread(target=self.thread_function, name='StallDetector', daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(2)
+
+    # =====
+
+    def thread_function(self):
+        interval = max(self.threshold / 4, 0.05)
+        while not self._stop.wait(interval):
+            call = self.current
+            if call is None:
+                continue
+            name, item, start = call
+            duration = perf_counter() - start
+            if call is self._last:
+                # still stuck: update the duration
+                self.recent[-1]['duration'] = round(duration, 3)
+            elif duration >= self.threshold:
+                self._last = call
+                self.record(name, item, duration)
+
+
+    def record(self, name:str, item, duration:float):
+        frame = sys._current_frames().get(self._thread_id)
+        stack = ''.join(traceback.format_stack(frame)) if frame else ''
+        self.recent.append({
+            'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'call': name,
+            'item': None if item is None else repr(item)[:80],
+            'duration': round(duration, 3),
+            'stack': stack,
+            })
+        self.count += 1
+
+        now = time.monotonic()
+        times = self._log_times
+        while times and now - times[0] > self.log_period:
+            times.popleft()
+        if len(times) >= self.log_limit:
+            self.suppressed += 1
+            return
+        times.append(now)
+        l.warning("Main loop stalled in {} for more than {:.1f} s{}, stack:\n{}".format(
+            name, duration, '' if item is None else ', processing {!r}'.format(item), stack))
+
+    # -----
+
+    def stats(self) -> dict:
+        return {
+            'threshold': self.threshold,
+            'log_limit': self.log_limit,
+            'log_period': self.log_period,
+            'stalls': self.count,
+            'suppressed': self.suppressed,
+            'recent': [{k: v for k, v in stall.items() if k != 'stack'} for stall in self.recent],
+            }
+
+#######
+
+def start(cfg:dict):
+    '''
+    Start the detector for the calling thread (the main loop) as configured
+    by "stall_threshold" (seconds, 0 to disable), "stall_ring" and
+    "stall_log_limit" (stacks logged per minute).
+    '''
+    global DETECTOR
+    threshold = cfg.get('stall_threshold', 1.0)
+    if not threshold:
+        return None
+    DETECTOR = StallDetector(threshold,
+        ring = cfg.get('stall_ring', 20),
+        log_limit = cfg.get('stall_log_limit', 5))
+    DETECTOR.start()
+    return DETECTOR
+
+
+def stop():
+    global DETECTOR
+    if DETECTOR:
+        DETECTOR.stop()
+        l.info("Stall detector stats {}".format(DETECTOR.stats()))
+        DETECTOR = None
+
+#######
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+"""
+Telex Statistics - duration histograms of the read/write/idle calls of all
+device modules
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import time
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+# Set by telex.main from config ("stats", "stats_file")
+ENABLED = True
+FILENAME = 'piTelex-stats.txt'
+
+HISTOGRAMS = {}   # name ('MCP.read', 'iTs.idle2Hz', ...) -> Histogram
+
+#######
+
+class Histogram:
+    '''
+    Durations in ns, counted in power-of-two buckets: bucket n holds
+    durations of 2**(n-1) up to 2**n-1 ns.
+    '''
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.buckets = [0] * 64
+
+    def add(self, ns:int):
+        if not self.count or ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+        self.count += 1
+        self.total += ns
+        self.buckets[ns.bit_length()] += 1
+
+    def percentile(self, p:float) -> int:
+        ''' upper bound of the bucket holding the p-th percentile, in ns '''
+        limit = self.count * p / 100
+        n = 0
+        for bucket, count in enumerate(self.buckets):
+            n += count
+            if n >= limit:
+                return min((1 << bucket) - 1, self.max)
+        return self.max
+
+#######
+
+def histogram(name:str) -> Histogram:
+    h = HISTOGRAMS.get(name)
+    if h is None:
+        h = HISTOGRAMS[name] = Histogram()
+    return h
+
+
+def clear():
+    HISTOGRAMS.clear()
+
+# =====
+
+def report() -> str:
+    ''' return all histograms as table, durations in µs '''
+    lines = [time.strftime("%Y-%m-%d %H:%M:%S"),
+        '{:<20} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'call', 'count', 'min_us', 'avg_us', 'p99_us', 'max_us')]
+    for name in sorted(HISTOGRAMS):
+        h = HISTOGRAMS[name]
+        if not h.count:
+            continue
+        lines.append('{:<20} {:>10} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            name, h.count, h.min / 1000, h.total / h.count / 1000,
+            h.percentile(99) / 1000, h.max / 1000))
+    return '\n'.join(lines)
+
+
+def slowest(count:int=3) -> list:
+    ''' return names and p99 in µs of the calls with the highest p99 '''
+    ret = [(h.percentile(99) / 1000, name) for name, h in HISTOGRAMS.items() if h.count]
+    ret.sort(reverse=True)
+    return [(name, p99) for p99, name in ret[:count]]
+
+
+def dump() -> str:
+    ''' write report to log and FILENAME (appending), return the latter '''
+    text = report()
+    l.info("Statistics:\n" + text)
+    try:
+        with open(FILENAME, 'a', encoding='UTF-8') as fp:
+            fp.write(text + '\n\n')
+    except OSError as e:
+        l.error("OS error while trying to write statistics: {!s}".format(e))
+    return FILENAME
+
+# -----
+
+def install_signal_handler():
+    ''' dump statistics on SIGUSR1 (not available on Windows) '''
+    import signal
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: dump())
+
+#######
@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+"""
+Telex Supervisor - restart of module threads ending by an exception or
+unexpectedly, with exponential backoff, and liveness check by heartbeats
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+import threading
+import time
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+# Delay before restarting a thread, doubled on each restart up to
+# BACKOFF_MAX; back to BACKOFF_MIN after the thread has run BACKOFF_MAX
+# seconds without ending
+BACKOFF_MIN = 1.0
+BACKOFF_MAX = 60.0
+
+#######
+
+class Supervised:
+    '''
+    A module thread running target, started by the Supervisor. Threads
+    registered with heartbeat_timeout must call beat() at least that often
+    (seconds); otherwise they are reported as hanging. Python can't stop a
+    hanging thread, so it is not restarted. The module calls stop() before
+    ending the thread on purpose (e.g. in its exit()), then join().
+    '''
+    def __init__(self, name:str, target, heartbeat_timeout:float=None, daemon:bool=False):
+        self.name = name
+        self.target = target
+        self.heartbeat_timeout = heartbeat_timeout
+        self.daemon = daemon
+        self.thread = None
+        self.started = None
+        self.heartbeat = None
+        self.stopped = False
+        self.backoff = BACKOFF_MIN
+        self.restart_time = None
+        self.hanging = False
+        # Statistics
+        self.restarts = 0
+        self.crashes = 0
+        self.hangs = 0
+        self.last_error = None
+
+
+    def beat(self):
+        ''' called by the thread to show it is alive '''
+        self.heartbeat = time.monotonic()
+
+
+    def stop(self):
+        ''' don't restart the thread anymore '''
+        self.stopped = True
+
+
+    def join(self, timeout:float=None):
+        ''' wait up to timeout for the end of the thread '''
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+
+    def is_alive(self) -> bool:
+        return bool(self.thread and self.thread.is_alive())
+
+    # =====
+
+    def start(self):
+        self.started = self.heartbeat = time.monotonic()
+        self.hanging = False
+        self.thread = threading.Thread(target=self.thread_function, name=self.name, daemon=self.daemon)
+        self.thread.start()
+
+
+    def thread_function(self):
+        try:
+            self.target()
+        except Exception as e:
+            self.last_error = repr(e)
+            self.crashes += 1
+            if not self.stopped:
+                l.error("Thread {} ended by exception: {!r}".format(self.name, e), exc_info=True)
+        else:
+            if not self.stopped:
+                l.warning("Thread {} ended unexpectedly".format(self.name))
+
+    # -----
+
+    def stats(self) -> dict:
+        return {
+            'alive': self.is_alive(),
+            'restarts': self.restarts,
+            'crashes': self.crashes,
+            'hangs': self.hangs,
+            'last_error': self.last_error,
+            }
+
+#######
+
+class Supervisor:
+    '''
+    Registry of the supervised module threads; check() is called periodically
+    by the main loop.
+    '''
+    def __init__(self):
+        self._threads = []
+        self._lock = threading.Lock()
+
+
+    def register(self, name:str, target, heartbeat_timeout:float=None, daemon:bool=False) -> Supervised:
+        '''
+        return the handle of a supervised thread running target, to be started
+        by its start(); use this if target needs the handle (for beat())
+        '''
+        supervised = Supervised(name, target, heartbeat_timeout, daemon)
+        with self._lock:
+            self._threads.append(supervised)
+        return supervised
+
+
+    def start_thread(self, name:str, target, heartbeat_timeout:float=None, daemon:bool=False) -> Supervised:
+        ''' start a supervised thread running target, return its handle '''
+        supervised = self.register(name, target, heartbeat_timeout, daemon)
+        supervised.start()
+        return supervised
+
+
+    def check(self):
+        ''' restart threads that ended, report hanging ones '''
+        now = time.monotonic()
+        with self._lock:
+            threads = [s for s in self._threads if not s.stopped]
+
+        for s in threads:
+            if s.is_alive():
+                if now - s.started > BACKOFF_MAX:
+                    s.backoff = BACKOFF_MIN
+                if s.heartbeat_timeout and now - s.heartbeat > s.heartbeat_timeout:
+                    if not s.hanging:
+                        s.hanging = True
+                        s.hangs += 1
+                        l.warning("Thread {} hangs, no heartbeat for {:.0f} s".format(s.name, now - s.heartbeat))
+                else:
+                    s.hanging = False
+            elif s.restart_time is None:
+                s.restart_time = now + s.backoff
+                l.warning("Thread {} not running, restart in {:.0f} s".format(s.name, s.backoff))
+            elif now >= s.restart_time:
+                s.restart_time = None
+                s.backoff = min(s.backoff * 2, BACKOFF_MAX)
+                s.restarts += 1
+                l.info("Restarting thread {} ({}. restart)".format(s.name, s.restarts))
+                try:
+                    s.start()
+                except Exception as e:
+                    l.error("Restarting thread {} failed: {!r}".format(s.name, e))
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {s.name: s.stats() for s in self._threads}
+
+
+    def restarts(self) -> int:
+        with self._lock:
+            return sum(s.restarts for s in self._threads)
+
+#######
+
+# The supervisor of this process
+SUPERVISOR = Supervisor()
+
+def register(name:str, target, heartbeat_timeout:float=None, daemon:bool=False) -> Supervised:
+    return SUPERVISOR.register(name, target, heartbeat_timeout, daemon)
+
+def start_thread(name:str, target, heartbeat_timeout:float=None, daemon:bool=False) -> Supervised:
+    return SUPERVISOR.start_thread(name, target, heartbeat_timeout, daemon)
+
+#######
@@ -17,8 +17,19 @@ l = logging.getLogger("piTelex." + __name__)
 #######
 
 class Watchdog():
+    '''
+    Named timeouts calling callback(name), or callback(name + '_ABORT') after
+    abort_period since the first restart. Without a scheduler process() has to
+    be called periodically; with one (set_scheduler) each running timeout is
+    a one-shot timer of the main loop, so restart() and disable() must then
+    be called from the main loop thread only.
+    '''
     def __init__(self):
         self._wds = {}
+        self._scheduler = None
+
+    def set_scheduler(self, scheduler):
+        self._scheduler = scheduler
 
     def init(self, name:str, callback, time_out_period:int, abort_period:int=None):
         wd = {}
@@ -27,6 +38,8 @@ class Watchdog():
         wd['abort_period'] = abort_period
         wd['time_out'] = None
         wd['time_abort'] = None
+        wd['timer_out'] = None
+        wd['timer_abort'] = None
         self._wds[name] = wd
 
     def restart(self, name:str, temp_time_out_period:int=0):
@@ -36,21 +49,41 @@ class Watchdog():
             top = temp_time_out_period
         if top:
             wd['time_out'] = time.monotonic() + top
+            if self._scheduler:
+                if wd['timer_out']:
+                    self._scheduler.postpone(wd['timer_out'], top)
+                else:
+                    wd['timer_out'] = self._scheduler.after(top, lambda: self._expired(name, ''), 'watchdog ' + name)
         if not wd['time_abort'] and wd['abort_period']:
             wd['time_abort'] = time.monotonic() + wd['abort_period']
+            if self._scheduler:
+                wd['timer_abort'] = self._scheduler.after(wd['abort_period'], lambda: self._expired(name, '_ABORT'), 'watchdog ' + name + '_ABORT')
 
     def restart_if_active(self, name:str):
         if self._wds[name]['time_out']:
             self.restart(name)
 
     def disable(self, name:str):
-        self._wds[name]['time_out'] = None
-        self._wds[name]['time_abort'] = None
+        wd = self._wds[name]
+        wd['time_out'] = None
+        wd['time_abort'] = None
+        for timer in ('timer_out', 'timer_abort'):
+            if wd[timer]:
+                wd[timer].cancel()
+                wd[timer] = None
 
     def is_active(self, name:str):
         return self._wds[name]['time_out']
 
+    def _expired(self, name:str, suffix:str):
+        wd = self._wds[name]
+        self.disable(name)
+        wd['callback'](name + suffix)
+        l.debug("Watchdog {!r}{}: {!r}".format(name, suffix, wd["callback"]))
+
     def process(self):
+        if self._scheduler:
+            return
         time_act = time.monotonic()
 
         for name, wd in self._wds.items():
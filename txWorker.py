@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+"""
+Telex Write Worker - decouple slow write() calls of a device from the main
+loop by a bounded queue and a worker thread per device
+"""
+__author__      = "Jochen Krapf"
+__email__       = "jk@nerd2nerd.org"
+__copyright__   = "Copyright 2018, JK"
+__license__     = "GPL3"
+__version__     = "0.0.1"
+
+from threading import Thread
+from collections import deque
+import queue
+
+from txMessage import is_urgent
+
+import logging
+l = logging.getLogger("piTelex." + __name__)
+
+OVERFLOW_POLICIES = ('drop_new', 'drop_old', 'block')
+
+# Queued to wake the worker for the priority lane
+_WAKEUP = object()
+
+#######
+
+class WriteWorker:
+    '''
+    Stands in for a device in the routing table of the main loop. Data written
+    to it is queued and handed to the device's write()/write_many() by a
+    worker thread, keeping the order; urgent commands (see txMessage.URGENT)
+    overtake the queued items instead. Return values of the device's write()
+    are lost, so devices discarding data for others must not use this.
+    '''
+    def __init__(self, device, size:int=1000, overflow:str='drop_new'):
+        self.device = device
+        self.id = device.id
+        self.batch_write = True
+        self.bus_messages = device.bus_messages
+
+        if overflow not in OVERFLOW_POLICIES:
+            l.warning("{}: unknown async_overflow {!r}, using 'drop_new'".format(self.id, overflow))
+            overflow = 'drop_new'
+        self._overflow = overflow
+        self._queue = queue.Queue(size)
+        self._urgent = deque()   # priority lane, written before the next queued item
+
+        # Statistics
+        self.queued = 0
+        self.urgent = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+        self._thread = Thread(target=self.thread_worker, name=self.id + '_write', daemon=True)
+        self._thread.start()
+
+
+    def exit(self):
+        ''' stop the worker after the queued data has been written '''
+        self._put(None, force=True)
+        self._thread.join(2)
+        if self._thread.is_alive():
+            l.warning("{}: write worker did not stop, {} items left".format(self.id, self._queue.qsize()))
+
+    # =====
+
+    def write(self, a:str, source:str):
+        if is_urgent(a):
+            self._urgent.append((a, source, False))
+            self.urgent += 1
+            try:
+                self._queue.put_nowait(_WAKEUP)
+            except queue.Full:
+                pass   # worker is busy and checks the priority lane anyway
+            return
+        self._put((a, source, False))
+
+    def write_many(self, text:str, source:str):
+        self._put((text, source, True))
+
+    # -----
+
+    def _put(self, item, force:bool=False):
+        if force or self._overflow == 'block':
+            self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                if self.dropped == 1 or not self.dropped % 100:
+                    l.warning("{}: write queue full, {} items dropped".format(self.id, self.dropped))
+                if self._overflow == 'drop_new':
+                    return
+                # drop_old: make room for the new item
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                self._queue.put_nowait(item)
+        self.queued += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    # -----
+
+    def stats(self) -> dict:
+        return {
+            'depth': self._queue.qsize(),
+            'max_depth': self.max_depth,
+            'queued': self.queued,
+            'urgent': self.urgent,
+            'dropped': self.dropped,
+            }
+
+    # =====
+
+    def thread_worker(self):
+        while True:
+            item = self._queue.get()
+            while self._urgent:
+                self._write(self._urgent.popleft())
+            if item is None:
+                break
+            if item is not _WAKEUP:
+                self._write(item)
+
+
+    def _write(self, item):
+        device = self.device
+        a, source, many = item
+        try:
+            if not many:
+                device.write(a, source)
+            elif device.batch_write:
+                device.write_many(a, source)
+            else:
+                for c in a:
+                    device.write(c, source)
+        except Exception as e:
+            l.warning("Uncaught Exception in {}.write({!r}), {!r}: {!r}".format(self.id, a, source, e))
+
+#######
+
+def create(device):
+    '''
+    Return a WriteWorker for device if configured by its parameters
+    "async_write", "async_queue_size" and "async_overflow", else None.
+    '''
+    params = getattr(device, 'params', None) or {}
+    if not params.get('async_write', False):
+        return None
+    worker = WriteWorker(device,
+        size = params.get('async_queue_size', 1000),
+        overflow = params.get('async_overflow', 'drop_new'))
+    l.info("{}: asynchronous write, queue size {}, overflow {!r}".format(device.id, worker._queue.maxsize, worker._overflow))
+    return worker
+
+#######
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+"""
+codec.py: Baudot-Murray-Code codec benchmark
+
+Compares encodeA2BM searching each character with str.index() in the layers
+of the coding, as it did before, with the reverse tables built per coding
+(txCode.BaudotMurrayCode._build_A2BM), for all codings. The output of both
+is compared first.
+
+With --bulk, compares encodeA2BM and decodeBM2A with the bulk codec used for
+files (encodeA2BM_bulk, decodeBM2A_bulk), plain and with flipped bits.
+
+With --flip, checks do_flip_bits (table lookup) against the former bit by bit
+reversal for all 32 codes and all byte values, checks that flipped encoding
+and decoding give back the text, and compares the speed of both.
+
+Run from the piTelex directory:
+
+    python3 utils/bench/codec.py [text length]
+    python3 utils/bench/codec.py --bulk [text length]
+    python3 utils/bench/codec.py --flip [data length]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txCode
+
+BMC = txCode.BaudotMurrayCode
+CODINGS = (
+    ('ITA2', BMC.CODING_ITA2),
+    ('US', BMC.CODING_US),
+    ('MKT2', BMC.CODING_MKT2),
+    ('ZUSE', BMC.CODING_ZUSE),
+    )
+
+#######
+
+def encode_search(mc, ascii:str) -> bytearray:
+    ''' former encodeA2BM: search the current layer, then the other ones '''
+    ret = bytearray()
+    ascii = ascii.upper()
+    if mc._mode is None:
+        mc._mode = 0
+        ret.append(mc._LUT_BMsw[mc._mode])
+    for a in ascii:
+        try:
+            nm = mc._mode
+            b = mc._LUT_BM2A[nm].index(a)
+            ret.append(b)
+            if b in mc._LUT_BMsw:
+                mc._mode = mc._LUT_BMsw.index(b)
+        except ValueError:
+            try:
+                nm += 1
+                if nm >= len(mc._LUT_BM2A):
+                    nm = 0
+                b = mc._LUT_BM2A[nm].index(a)
+                ret.append(mc._LUT_BMsw[nm])
+                ret.append(b)
+                mc._mode = nm
+            except ValueError:
+                try:
+                    nm += 1
+                    if nm >= len(mc._LUT_BM2A):
+                        nm = 0
+                    b = mc._LUT_BM2A[nm].index(a)
+                    ret.append(mc._LUT_BMsw[nm])
+                    ret.append(b)
+                    mc._mode = nm
+                except:
+                    pass
+        except:
+            pass
+    if ret and mc._flip_bits:
+        ret = mc.do_flip_bits(ret)
+    return ret
+
+
+def flip_branches(code) -> bytearray:
+    ''' former do_flip_bits: reverse the 5 data bits bit by bit '''
+    ret = bytearray()
+    for b in code:
+        rb = 0
+        if b & 1:
+            rb |= 16
+        if b & 2:
+            rb |= 8
+        if b & 4:
+            rb |= 4
+        if b & 8:
+            rb |= 2
+        if b & 16:
+            rb |= 1
+        ret.append(rb)
+    return ret
+
+
+def sample_text(coding:int, length:int) -> str:
+    ''' text using all characters of coding, shifts included '''
+    lut = BMC(coding=coding)._LUT_BM2A
+    chars = ''.join(lut) + 'THE QUICK BROWN FOX 1234 ?x'
+    return (chars * (length // len(chars) + 1))[:length]
+
+
+def bench(name:str, encode, text:str, per_char:bool, repeat:int=5) -> float:
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        if per_char:
+            for a in text:
+                encode(a)
+        else:
+            encode(text)
+        dt = time.perf_counter() - t
+        if best is None or dt < best:
+            best = dt
+    print("{:<28} {:>10.3f} ms".format(name, best * 1000))
+    return best
+
+#######
+
+def main_bulk(length:int):
+    text = ('RYRYRY THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG 1234567890 +-/ ()\r\n' * (length // 72 + 1))[:length]
+    print("file of {} characters".format(length))
+    for name, coding in CODINGS:
+        for flip in (False, True):
+            label = name + (' flipped' if flip else '')
+            data = BMC(coding=coding, flip_bits=flip).encodeA2BM(text)
+            if (BMC(coding=coding, flip_bits=flip).encodeA2BM_bulk(text) != data
+                    or BMC(coding=coding, flip_bits=flip).decodeBM2A_bulk(data) != BMC(coding=coding, flip_bits=flip).decodeBM2A(data)):
+                print("{}: bulk output differs".format(label))
+                sys.exit(1)
+            t_enc = bench(label + ' encode', lambda t: BMC(coding=coding, flip_bits=flip).encodeA2BM(t), text, False, 3)
+            t_enc_bulk = bench(label + ' encode bulk', lambda t: BMC(coding=coding, flip_bits=flip).encodeA2BM_bulk(t), text, False, 3)
+            t_dec = bench(label + ' decode', lambda d: BMC(coding=coding, flip_bits=flip).decodeBM2A(d), data, False, 3)
+            t_dec_bulk = bench(label + ' decode bulk', lambda d: BMC(coding=coding, flip_bits=flip).decodeBM2A_bulk(d), data, False, 3)
+            print("{} speedup encode: {:.1f}x, decode: {:.1f}x".format(label, t_enc / t_enc_bulk, t_dec / t_dec_bulk))
+
+
+def main_flip(length:int):
+    errors = 0
+    for b in range(256):
+        expected = flip_branches([b])
+        got = BMC.do_flip_bits([b])
+        if got != expected or type(got) is not bytearray:
+            print("code {:#04x}: expected {!r}, got {!r}".format(b, expected, got))
+            errors += 1
+    for b in range(32):
+        if BMC.do_flip_bits(BMC.do_flip_bits([b])) != bytes([b]):
+            print("code {:#04x}: flipping twice doesn't give it back".format(b))
+            errors += 1
+    for name, coding in CODINGS:
+        text = sample_text(coding, 1000).upper()
+        plain = BMC(coding=coding).encodeA2BM(text)
+        flipped = BMC(coding=coding, flip_bits=True).encodeA2BM(text)
+        if flipped != flip_branches(plain):
+            print("{}: flipped encoding differs".format(name))
+            errors += 1
+        if BMC(coding=coding, flip_bits=True).decodeBM2A(flipped) != BMC(coding=coding).decodeBM2A(plain):
+            print("{}: flipped decoding differs".format(name))
+            errors += 1
+    if errors:
+        sys.exit(1)
+    print("all 32 codes and 256 byte values flipped as before")
+
+    data = bytes(range(32)) * (length // 32 + 1)
+    data = data[:length]
+    print("data of {} bytes".format(length))
+    t_old = bench('bit by bit', flip_branches, data, False)
+    t_new = bench('table', BMC.do_flip_bits, data, False)
+    print("speedup: {:.0f}x".format(t_old / t_new))
+
+
+def main():
+    if '--flip' in sys.argv:
+        sys.argv.remove('--flip')
+        main_flip(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
+        return
+
+    if '--bulk' in sys.argv:
+        sys.argv.remove('--bulk')
+        main_bulk(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
+        return
+
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    for name, coding in CODINGS:
+        text = sample_text(coding, length)
+        for flip in (False, True):
+            old, new = BMC(coding=coding, flip_bits=flip), BMC(coding=coding, flip_bits=flip)
+            for chunk in [text] + list(text):
+                if encode_search(old, chunk) != new.encodeA2BM(chunk) or old._mode != new._mode:
+                    print("{}: output differs for {!r}".format(name, chunk))
+                    sys.exit(1)
+    print("output identical for all codings")
+
+    print("text of {} characters".format(length))
+    for name, coding in CODINGS:
+        text = sample_text(coding, length)
+        old, new = BMC(coding=coding), BMC(coding=coding)
+        t_old = bench(name + ' search, text', lambda t: encode_search(old, t), text, False)
+        t_new = bench(name + ' tables, text', new.encodeA2BM, text, False)
+        t_old_char = bench(name + ' search, per char', lambda t: encode_search(old, t), text, True)
+        t_new_char = bench(name + ' tables, per char', new.encodeA2BM, text, True)
+        print("{} speedup text: {:.1f}x, per character: {:.1f}x".format(
+            name, t_old / t_new, t_old_char / t_new_char))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+
+"""
+e2e.py: end-to-end throughput and latency benchmark
+
+Runs the piTelex core (event-driven main loop, real MCP and i-Telex server)
+with a simulated teleprinter and a scripted i-Telex peer calling over
+localhost. Scenarios:
+
+- inbound:        the peer sends a message, printed by the teleprinter
+- outbound:       the teleprinter types a message, sent to the peer
+- bidirectional:  both at once
+- news:           a local source floods the teleprinter (no connection,
+                  throttled by flow control)
+- stop:           ST is pressed while the teleprinter has a backlog of
+                  --backlog characters (flow control off); measures the
+                  time until it stops printing (priority lane)
+
+Per scenario, prints throughput, latency from the i-Telex socket to the
+teleprinter driver and back (p50/p99/max), the Acknowledge packets seen by
+the peer, the flow control statistics and the CPU time as JSON, so that runs
+can be compared.
+
+Run from the piTelex directory:
+
+    python3 utils/bench/e2e.py [--baud 50] [--length 100] [--backlog 5000] [--out e2e.json] [scenario ...]
+
+At 50 baud, each scenario takes about length * 0.15 s; use e.g. --baud 1000
+for a quick run.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import telex
+import txBase
+import txCode
+import txDevITelexSrv
+import txDevMCP
+import txScheduler
+from txMessage import Message
+
+TEXT = 'RYRYRYRY THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG 1234567890\r\n'
+
+#######
+
+class SimTeleprinter(txBase.TelexBase):
+    '''
+    Teleprinter driver stand-in: prints the characters written to it at the
+    speed of baud (7.5 bit per character), reports its buffer by ESC-~ like
+    the real drivers do and types the text given to type_text at the same
+    speed. Commands are executed in order with the text, urgent ones at once
+    (like txDevRPiTTY). Answers ESC-A (printer start) by ESC-AA, ESC-Z drops
+    the text not printed yet. window 0 disables flow control.
+    '''
+    bus_window = 50
+    bus_messages = True
+
+    def __init__(self, baud:float=50, feedback_interval:float=0.5, window:int=50):
+        super().__init__()
+        self.id = 'Sim'
+        self.params = {'flow_window': window}
+        self.char_time = 7.5 / baud
+        self.feedback_interval = feedback_interval
+
+        self._rx_buffer = txBase.RingBuffer()
+        self._typing = txBase.RingBuffer(locked=True)   # (due time, char)
+        self._print_buffer = txBase.RingBuffer()
+        self._print_next = 0
+        self._feedback_time = 0
+        self._feedback_printed = None
+
+        # Statistics
+        self.received = []   # (time, char, source) written to us
+        self.typed = []   # (time, char) read from us
+        self.printed = []   # time of each character printed
+        self.max_fill = 0
+        self.feedbacks = 0
+        self.stops = []   # (time, characters dropped, urgent) per ESC-Z
+
+        self.commands = txBase.CommandTable(self.id)
+        self.commands.add('A', self._cmd_start)
+        self.commands.add('Z', self._cmd_stop)
+
+
+    def type_text(self, text:str):
+        ''' type text, starting now '''
+        due = time.monotonic()
+        with self._typing.lock:
+            for a in text:
+                self._typing.append((due, a))
+                due += self.char_time
+
+
+    def typing(self) -> bool:
+        return bool(self._typing)
+
+
+    def printing(self) -> bool:
+        return bool(self._print_buffer)
+
+
+    def fill(self) -> int:
+        ''' characters not printed yet '''
+        return sum(a.__class__ is str for a in list(self._print_buffer))
+
+
+    def press_stop(self) -> float:
+        ''' press the ST key, return the time '''
+        self._rx_buffer.push('\x1bST')
+        self.notify()
+        return time.monotonic()
+
+    # =====
+
+    def read(self) -> str:
+        if self._rx_buffer:
+            return self._rx_buffer.popleft()
+        item = self._typing.peek()
+        if item and item[0] <= time.monotonic():
+            self._typing.popleft()
+            self.typed.append((time.monotonic(), item[1]))
+            return item[1]
+
+
+    def write(self, a:str, source:str):
+        if a.__class__ is Message:
+            self._print_buffer.push(a)
+            return
+        now = time.monotonic()
+        if not self._print_buffer and self._print_next < now:
+            self._print_next = now + self.char_time
+        self._print_buffer.append(a)
+        self.received.append((now, a, source))
+        if len(self._print_buffer) > self.max_fill:
+            self.max_fill = len(self._print_buffer)
+
+
+    def idle(self):
+        now = time.monotonic()
+        buffer = self._print_buffer
+        while buffer:
+            if buffer[0].__class__ is Message:
+                a = buffer.popleft()
+                self.commands.dispatch(a, a.source)
+                if self._print_next < now:
+                    self._print_next = now + self.char_time
+            elif self._print_next <= now:
+                buffer.popleft()
+                self.printed.append(self._print_next)
+                self._print_next += self.char_time
+            else:
+                break
+
+        # feedback when characters have been printed since the last one, like
+        # txDevED1000SC
+        if len(self.printed) != self._feedback_printed and now - self._feedback_time >= self.feedback_interval:
+            self._rx_buffer.push('\x1b~' + str(self.fill()))
+            self._feedback_printed = len(self.printed)
+            self._feedback_time = now
+            self.feedbacks += 1
+
+    # -----
+
+    def _cmd_start(self, a, source):
+        self._rx_buffer.append('\x1bAA')
+        # report the buffer at once
+        self._feedback_printed = None
+        self._feedback_time = 0
+
+
+    def _cmd_stop(self, a, source):
+        self.stops.append((time.monotonic(), self.fill(), a.urgent))
+        self._print_buffer.clear()
+
+#######
+
+class NewsFlood(txBase.TelexBase):
+    '''
+    Local source putting out a long text at once, like txDevNews does with a
+    news item: ESC-A, the text, ESC-ST. Throttled by flow control.
+    '''
+    bus_chars = False
+    bus_commands = False
+    bus_throttle = True
+
+    def __init__(self):
+        super().__init__()
+        self.id = 'Nws'
+        self._rx_buffer = txBase.RingBuffer(locked=True)
+        self.emitted = []   # (time, char) read from us
+
+
+    def flood(self, text:str):
+        self._rx_buffer.push_many(['\x1bA'] + list(text) + ['\x1bST'])
+        self.notify()
+
+
+    def pending(self) -> bool:
+        return bool(self._rx_buffer)
+
+
+    def read_many(self) -> str:
+        text = self.pop_many(self._rx_buffer)
+        if text and text[0] != '\x1b':
+            now = time.monotonic()
+            self.emitted.extend((now, a) for a in text)
+        return text
+
+#######
+
+class ITelexPeer:
+    '''
+    Scripted i-Telex station (protocol version 1, Baudot) calling piTelex:
+    sends text keeping at most window characters unacknowledged, and
+    acknowledges received text at once, like an instantly printing
+    teleprinter.
+    '''
+    def __init__(self, port:int, window:int=48):
+        self.port = port
+        self.window = window
+        self._bmc_tx = txCode.BaudotMurrayCode(False, False, True)
+        self._bmc_rx = txCode.BaudotMurrayCode(False, False, True)
+        self._cond = threading.Condition()
+        self._socket = None
+        self._thread = None
+
+        self.sent = 0   # Baudot codes sent, including shifts
+        self.sent_chars = []   # (time, char)
+        self.ack = None   # last Acknowledge received
+        self.acks = []   # (time, unprinted)
+        self.acks_sent = 0
+        self.stalls = 0
+        self.received_codes = 0
+        self.received = []   # (time, char) without shifts
+        self.ended = False
+        self.reject = None
+
+
+    def connect(self):
+        self._socket = socket.create_connection(('127.0.0.1', self.port))
+        self._socket.sendall(bytes([7, 1, 1]))   # Version 1
+        self._socket.sendall(bytes([1, 1, 0]))   # Direct Dial, extension 0
+        self._thread = threading.Thread(target=self.thread_receive, name='Peer', daemon=True)
+        self._thread.start()
+
+
+    def close(self, timeout:float=5):
+        try:
+            self._socket.sendall(bytes([3, 0]))   # End
+        except OSError:
+            pass
+        with self._cond:
+            self._cond.wait_for(lambda: self.ended, timeout)
+        self._socket.close()
+        self._thread.join(timeout)
+
+    # =====
+
+    def unprinted(self) -> int:
+        return (self.sent - (self.ack or 0)) & 0xFF
+
+
+    def wait(self, predicate, timeout:float) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: self.ended or predicate(), timeout) and not self.ended
+
+
+    def send_text(self, text:str, timeout:float):
+        ''' send text in Baudot data packets within window '''
+        codes = [self._bmc_tx.encodeA2BM(a) for a in text]
+        end = time.monotonic() + timeout
+        i = 0
+        while i < len(codes):
+            if self.unprinted() + len(codes[i]) > self.window:
+                self.stalls += 1
+                if not self.wait(lambda: self.unprinted() + len(codes[i]) <= self.window, end - time.monotonic()):
+                    break
+            free = min(self.window - self.unprinted(), 50)
+            data = bytearray()
+            start = i
+            while i < len(codes) and len(data) + len(codes[i]) <= free:
+                data += codes[i]
+                i += 1
+            now = time.monotonic()
+            self._socket.sendall(bytes([2, len(data)]) + data)
+            with self._cond:
+                self.sent += len(data)
+            self.sent_chars.extend((now, a) for a in text[start:i])
+
+    # -----
+
+    def _recv(self, n:int) -> bytes:
+        data = b''
+        while len(data) < n:
+            d = self._socket.recv(n - len(data))
+            if not d:
+                raise ConnectionError('closed by piTelex')
+            data += d
+        return data
+
+
+    def thread_receive(self):
+        try:
+            while not self.ended:
+                kind, length = self._recv(2)
+                payload = self._recv(length) if length else b''
+                now = time.monotonic()
+                with self._cond:
+                    if kind == 2:   # Baudot data
+                        self.received.extend((now, a) for a in self._bmc_rx.decodeBM2A(payload) if a not in '<>')
+                        self.received_codes += length
+                        self._socket.sendall(bytes([6, 1, self.received_codes & 0xFF]))
+                        self.acks_sent += 1
+                    elif kind == 6:   # Acknowledge
+                        self.ack = payload[0]
+                        self.acks.append((now, self.unprinted()))
+                    elif kind == 3:   # End
+                        self.ended = True
+                    elif kind == 4:   # Reject
+                        self.reject = payload.decode('ASCII', errors='replace').rstrip('\x00')
+                        self.ended = True
+                    self._cond.notify_all()
+        except OSError:
+            pass
+        with self._cond:
+            self.ended = True
+            self._cond.notify_all()
+
+    # -----
+
+    def ack_stats(self) -> dict:
+        times = [t for t, _ in self.acks]
+        intervals = [b - a for a, b in zip(times, times[1:])]
+        return {
+            'received': len(self.acks),
+            'interval_p50_ms': ms(percentile(intervals, 50)),
+            'interval_max_ms': ms(max(intervals, default=None)),
+            'max_unprinted': max((n for _, n in self.acks), default=None),
+            'final_unprinted': self.unprinted() if self.ack is not None else None,
+            'window_stalls': self.stalls,
+            'sent_by_peer': self.acks_sent,
+            'reject': self.reject,
+            }
+
+#######
+
+class Core:
+    '''
+    The piTelex core with MCP, the simulated teleprinter and, optionally, the
+    i-Telex server and a news flood source; the main loop runs in a thread.
+    '''
+    def __init__(self, baud:float, itelex:bool=True, news:bool=False, window:int=50):
+        telex.DEVICES[:] = []
+        telex.ROUTES.clear()
+        telex.WORKERS.clear()
+        telex.CREDITS.clear()
+        telex.FLOW.clear()
+        telex.SCHEDULER = txScheduler.Scheduler()
+        telex.SCHEDULER.wakeup = telex.WAKEUP
+
+        self.mcp = txDevMCP.TelexMCP()
+        self.tty = SimTeleprinter(baud, window=window)
+        self.srv = self.news = None
+        devices = [self.mcp, self.tty]
+        if itelex:
+            self.port = free_port()
+            self.srv = txDevITelexSrv.TelexITelexSrv(port=self.port, tns_pin=1)
+            devices.append(self.srv)
+        if news:
+            self.news = NewsFlood()
+            devices.insert(0, self.news)
+        telex.DEVICES.extend(devices)
+        telex.init_devices()
+
+
+    def start(self):
+        self._stop = threading.Event()
+        self._cpu_main_loop = None
+        self._thread = threading.Thread(target=self.thread_main_loop, name='MainLoop')
+        self._wall = time.monotonic()
+        self._cpu = time.process_time()
+        self._thread.start()
+
+
+    def stop(self) -> dict:
+        ''' stop the main loop and the devices, return the resources used '''
+        wall = time.monotonic() - self._wall
+        cpu = time.process_time() - self._cpu
+        credit = telex.CREDITS.get(self.tty)
+        self._stop.set()
+        telex.WAKEUP.set()
+        self._thread.join()
+        for device in telex.DEVICES:
+            device.exit()
+        return {
+            'wall_s': round(wall, 3),
+            'cpu_s': round(cpu, 3),
+            'cpu_main_loop_s': round(self._cpu_main_loop, 3),
+            'cpu_percent': round(cpu / wall * 100, 1),
+            'flow_control': credit.stats() if credit else None,
+            'feedback': telex.LINE.feedback.stats(),
+            'printer_max_fill': self.tty.max_fill,
+            'printer_feedbacks': self.tty.feedbacks,
+            }
+
+
+    def thread_main_loop(self):
+        t = time.thread_time()
+        telex.main_loop_event(self._stop)
+        self._cpu_main_loop = time.thread_time() - t
+
+# =====
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values:list, p:float):
+    ''' nearest-rank percentile, None if empty '''
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * p / 100) - 1, 0)]
+
+
+def ms(seconds) -> float:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def latency(sent:list, received:list) -> dict:
+    '''
+    Match the (time, char) lists sent and received in order and return the
+    latency statistics.
+    '''
+    delays = [r - s for (s, _), (r, _) in zip(sent, received)]
+    return {
+        'chars': len(sent),
+        'arrived': len(received),
+        'mismatches': sum(a != b for (_, a), (_, b) in zip(sent, received)),
+        'p50_ms': ms(percentile(delays, 50)),
+        'p99_ms': ms(percentile(delays, 99)),
+        'max_ms': ms(max(delays, default=None)),
+        }
+
+
+def throughput(count:int, start:float, end:float) -> float:
+    if not count or end is None or end <= start:
+        return None
+    return round(count / (end - start), 2)
+
+#######
+# Scenarios
+
+def connect(core:Core, args) -> ITelexPeer:
+    ''' call piTelex, wait until the printer has started (first Acknowledge) '''
+    peer = ITelexPeer(core.port, args.window)
+    peer.connect()
+    if not peer.wait(lambda: peer.ack is not None, 10):
+        raise RuntimeError('printer start failed (reject {!r})'.format(peer.reject))
+    return peer
+
+
+def inbound_result(core:Core, peer:ITelexPeer, start:float) -> dict:
+    got = [(t, a) for t, a, source in core.tty.received if source == 'iTs' and a not in '<>']
+    printed = [t for t in core.tty.printed if t > start]
+    return {
+        'latency': latency(peer.sent_chars, got),
+        'throughput_cps': throughput(len(printed), start, printed[-1] if printed else None),
+        }
+
+
+def outbound_done(core:Core, peer:ITelexPeer) -> bool:
+    ''' all typed text arrived at the peer, after the welcome banner '''
+    banner = sum(source == 'MCP' and a not in '<>' for _, a, source in core.tty.received)
+    return not core.tty.typing() and len(peer.received) >= banner + len(core.tty.typed)
+
+
+def outbound_result(core:Core, peer:ITelexPeer) -> dict:
+    typed = core.tty.typed
+    # the welcome banner precedes the typed text
+    got = peer.received[-len(typed):] if typed else []
+    return {
+        'latency': latency(typed, got),
+        'throughput_cps': throughput(len(got), typed[0][0], got[-1][0]) if got else None,
+        }
+
+
+def scenario_inbound(core:Core, text:str, args) -> dict:
+    peer = connect(core, args)
+    start = time.monotonic()
+    peer.send_text(text, args.timeout)
+    peer.wait(lambda: peer.unprinted() == 0 and not core.tty.printing(), args.timeout)
+    peer.close()
+    ret = {'inbound': inbound_result(core, peer, start)}
+    ret['acknowledge'] = peer.ack_stats()
+    return ret
+
+
+def scenario_outbound(core:Core, text:str, args) -> dict:
+    peer = connect(core, args)
+    core.tty.type_text(text)
+    peer.wait(lambda: outbound_done(core, peer), args.timeout)
+    peer.close()
+    ret = {'outbound': outbound_result(core, peer)}
+    ret['acknowledge'] = peer.ack_stats()
+    return ret
+
+
+def scenario_bidirectional(core:Core, text:str, args) -> dict:
+    peer = connect(core, args)
+    start = time.monotonic()
+    core.tty.type_text(text)
+    peer.send_text(text, args.timeout)
+    peer.wait(lambda: peer.unprinted() == 0 and not core.tty.printing() and outbound_done(core, peer),
+        args.timeout)
+    peer.close()
+    ret = {
+        'inbound': inbound_result(core, peer, start),
+        'outbound': outbound_result(core, peer),
+        }
+    ret['acknowledge'] = peer.ack_stats()
+    return ret
+
+
+def scenario_news(core:Core, text:str, args) -> dict:
+    start = time.monotonic()
+    core.news.flood(text)
+    end = start + args.timeout
+    while (core.news.pending() or core.tty.printing()) and time.monotonic() < end:
+        time.sleep(0.05)
+    got = [(t, a) for t, a, source in core.tty.received if source == 'Nws']
+    printed = core.tty.printed
+    return {
+        'news': {
+            'latency': latency(core.news.emitted, got),
+            'throughput_cps': throughput(len(printed), start, printed[-1] if printed else None),
+            },
+        }
+
+
+def scenario_stop(core:Core, text:str, args) -> dict:
+    start = time.monotonic()
+    backlog = (TEXT * (args.backlog // len(TEXT) + 1))[:args.backlog]
+    core.news.flood(backlog)
+    end = start + args.timeout
+    received = lambda: sum(source == 'Nws' for _, _, source in core.tty.received)
+    while received() < len(backlog) and time.monotonic() < end:
+        time.sleep(0.01)
+    fill = core.tty.fill()
+    printed = len(core.tty.printed)
+    pressed = core.tty.press_stop()
+    stop = None
+    while stop is None and time.monotonic() < end:
+        time.sleep(0.001)
+        stop = next(((t, n) for t, n, urgent in core.tty.stops if urgent), None)
+    return {
+        'stop': {
+            'backlog': fill,
+            'latency_ms': ms(stop[0] - pressed) if stop else None,
+            'dropped': stop[1] if stop else None,
+            'printed_meanwhile': len(core.tty.printed) - printed,
+            # time an ESC-Z queued in order with the text would have waited
+            'in_order_s': round(fill * core.tty.char_time, 1),
+            },
+        }
+
+
+SCENARIOS = {
+    'inbound': (scenario_inbound, {}),
+    'outbound': (scenario_outbound, {}),
+    'bidirectional': (scenario_bidirectional, {}),
+    'news': (scenario_news, {'itelex': False, 'news': True}),
+    'stop': (scenario_stop, {'itelex': False, 'news': True, 'window': 0}),
+    }
+
+#######
+
+def main():
+    parser = argparse.ArgumentParser(description='piTelex end-to-end benchmark.')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+        help="scenarios to run: {} (default: all)".format(', '.join(SCENARIOS)))
+    parser.add_argument('--baud', type=float, default=50, help="speed of the simulated teleprinter")
+    parser.add_argument('--length', type=int, default=100, help="characters per message")
+    parser.add_argument('--backlog', type=int, default=5000,
+        help="characters in the teleprinter buffer when ST is pressed (scenario stop)")
+    parser.add_argument('--window', type=int, default=48,
+        help="unacknowledged characters the i-Telex peer sends ahead")
+    parser.add_argument('--timeout', type=float, help="seconds per scenario (default: from length and baud)")
+    parser.add_argument('--log', default='ERROR', help="log level of piTelex")
+    parser.add_argument('--out', help="write the results to this file instead of stdout")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("unknown scenario {!r}".format(name))
+
+    logging.basicConfig(level=args.log.upper())
+    text = (TEXT * (args.length // len(TEXT) + 1))[:args.length]
+    if args.timeout is None:
+        args.timeout = args.length * 7.5 / args.baud * 3 + 20
+
+    try:
+        rev = telex.find_rev()
+    except Exception:
+        rev = None
+    results = {
+        'piTelex': rev,
+        'date': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'baud': args.baud,
+        'nominal_cps': round(args.baud / 7.5, 2),
+        'length': args.length,
+        'window': args.window,
+        'scenarios': {},
+        }
+
+    for name in args.scenarios or SCENARIOS:
+        function, options = SCENARIOS[name]
+        print("running {} ...".format(name), file=sys.stderr)
+        core = Core(args.baud, **options)
+        core.start()
+        try:
+            result = function(core, text, args)
+        except Exception as e:
+            result = {'error': repr(e)}
+        finally:
+            resources = core.stop()
+        result.update(resources)
+        results['scenarios'][name] = result
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding='UTF-8') as fp:
+            fp.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
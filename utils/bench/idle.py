@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+"""
+idle.py: idle CPU check of the service modules
+
+Runs the piTelex core (event-driven main loop, real MCP and archive) with
+stand-ins of the feed modules (RSS, TwitterV2, Twitter, IRC), which need
+network access and libraries not installed everywhere. Like these, each
+stand-in has a poller thread sleeping between fetches and hands received
+items and text to write to txBase.QueueConsumer threads. Nothing is
+received or typed, so the process should use next to no CPU time.
+
+Prints the CPU time of the process over the interval as JSON and exits
+with 1 if it exceeds --max percent of one core. With --poll, the stand-ins
+poll their queues by "if not q.empty()" in a loop, as the feed modules did
+before, for comparison.
+
+Run from the piTelex directory:
+
+    python3 utils/bench/idle.py [--feeds 4] [--interval 5] [--max 2] [--poll]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import telex
+import txBase
+import txDevArchive
+import txDevMCP
+import txScheduler
+
+#######
+
+class FeedStandIn(txBase.TelexBase):
+    '''
+    Feed module stand-in: a poller thread fetching nothing every
+    poll_interval, received items and text to send handed to QueueConsumer
+    threads (or polled from plain queues with poll=True)
+    '''
+    def __init__(self, index:int, poll:bool=False, poll_interval:float=60):
+        super().__init__()
+        self.id = 'F{}'.format(index)
+        self._rx_buffer = txBase.RingBuffer()
+        self._stop = threading.Event()
+        self._poll_interval = poll_interval
+        self._rx_queue = queue.Queue()
+        self._tx_queue = queue.Queue()
+        self._threads = [threading.Thread(target=self.thread_poller, name=self.id + '_Client', daemon=True)]
+        if poll:
+            self._consumers = []
+            for q, handler in ((self._rx_queue, self.handle_item), (self._tx_queue, self.send)):
+                self._threads.append(threading.Thread(target=self.thread_poll_queue, args=(q, handler),
+                    name=self.id + '_Poll', daemon=True))
+        else:
+            self._consumers = [
+                txBase.QueueConsumer(self.handle_item, self.id + '_Handler', self._rx_queue),
+                txBase.QueueConsumer(self.send, self.id + '_Sender', self._tx_queue),
+                ]
+        for thread in self._threads:
+            thread.start()
+
+
+    def exit(self):
+        self._stop.set()
+        for consumer in self._consumers:
+            consumer.stop(1)
+
+
+    def read(self) -> str:
+        if self._rx_buffer:
+            return self._rx_buffer.popleft()
+
+
+    def write(self, a:str, source:str):
+        self._tx_queue.put(a)
+
+    # =====
+
+    def thread_poller(self):
+        while not self._stop.wait(self._poll_interval):
+            pass
+
+
+    def thread_poll_queue(self, q:queue.Queue, handler):
+        ''' former feed module loop '''
+        while not self._stop.is_set():
+            if not q.empty():
+                handler(q.get())
+
+
+    def handle_item(self, item):
+        self._rx_buffer.extend(item)
+        self.notify()
+
+
+    def send(self, a:str):
+        pass
+
+#######
+
+class Core:
+    ''' the piTelex core with MCP, archive and feeds; the main loop runs in a thread '''
+    def __init__(self, feeds:int, poll:bool, archive_path:str):
+        telex.DEVICES[:] = []
+        telex.ROUTES.clear()
+        telex.WORKERS.clear()
+        telex.CREDITS.clear()
+        telex.FLOW.clear()
+        telex.SCHEDULER = txScheduler.Scheduler()
+        telex.SCHEDULER.wakeup = telex.WAKEUP
+
+        telex.DEVICES.append(txDevMCP.TelexMCP())
+        telex.DEVICES.append(txDevArchive.TelexArchive(path=archive_path))
+        telex.DEVICES.extend(FeedStandIn(i, poll) for i in range(feeds))
+        telex.init_devices()
+        telex.init_scheduler()
+
+
+    def run(self, interval:float, warmup:float=1.0) -> dict:
+        stop = threading.Event()
+        thread = threading.Thread(target=telex.main_loop_event, args=(stop,), name='MainLoop')
+        thread.start()
+        try:
+            time.sleep(warmup)
+            wall = time.monotonic()
+            cpu = time.process_time()
+            time.sleep(interval)
+            wall = time.monotonic() - wall
+            cpu = time.process_time() - cpu
+            threads = threading.active_count()
+        finally:
+            stop.set()
+            telex.WAKEUP.set()
+            thread.join()
+            for device in telex.DEVICES:
+                device.exit()
+        return {
+            'wall_s': round(wall, 3),
+            'cpu_s': round(cpu, 3),
+            'cpu_percent': round(cpu / wall * 100, 2),
+            'threads': threads,
+            }
+
+#######
+
+def main():
+    parser = argparse.ArgumentParser(description='piTelex idle CPU check.')
+    parser.add_argument('--feeds', type=int, default=4, help="number of feed module stand-ins")
+    parser.add_argument('--interval', type=float, default=5, help="seconds to measure")
+    parser.add_argument('--max', type=float, default=2, help="CPU percent allowed")
+    parser.add_argument('--poll', action='store_true', help="poll the queues as the feed modules did before")
+    parser.add_argument('--log', default='ERROR', help="log level of piTelex")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log.upper())
+
+    with tempfile.TemporaryDirectory() as archive_path:
+        core = Core(args.feeds, args.poll, archive_path)
+        result = core.run(args.interval)
+
+    result = {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'feeds': args.feeds,
+        'poll': args.poll,
+        'max_percent': args.max,
+        **result,
+        }
+    print(json.dumps(result, indent=2))
+    if result['cpu_percent'] > args.max:
+        print("FAILED: idle CPU {:.2f} % > {:.2f} %".format(result['cpu_percent'], args.max))
+        sys.exit(1)
+    print("OK")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+replay.py: replay a recording of the piTelex bus (config option "record")
+into a headless piTelex core
+
+All recorded devices are simulated by their recordings, except MCP with
+--mcp, which then runs for real. Prints latency per device and divergence
+from the recorded output as JSON.
+
+With --check, records a short conversation of devices not in order of
+appearance (MCP first) through the core, with a second line using the same
+device ids, and checks that its replay (MCP running as real device) reports
+no divergence.
+
+Run from the piTelex directory:
+
+    python3 utils/bench/replay.py record.jsonl.gz [--speed 1|4|max] [--mcp]
+    python3 utils/bench/replay.py --check
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txRecorder
+
+#######
+
+def check() -> bool:
+    ''' record items through the core, replay them, expect no divergence '''
+    import telex
+
+    line2 = telex.Line('L2')
+    lines = [telex.LINE, line2]
+    for line, ids in ((telex.LINE, ('MCP', 'RPiTTY', 'Scn')), (line2, ('RPiTTY', 'Scn'))):
+        line.devices[:] = [txRecorder.ReplayDevice(id) for id in ids]
+        for device in line.devices:
+            device.bus_chars = device.bus_commands = True
+            device.bus_sources = None
+        line.workers.clear()
+        line.credits.clear()
+        telex.init_routes(line)
+    _, tty, scn = telex.LINE.devices
+    _, scn2 = line2.devices
+
+    filename = os.path.join(tempfile.mkdtemp(), 'check.jsonl')
+    telex.RECORDER = txRecorder.Recorder(filename,
+        [line.prefix + device.id for line in lines for device in line.devices])
+    now = time.monotonic()
+    # MCP, first on the bus, sends nothing: it appears in the records as
+    # target only, after the first source
+    scn.schedule(now, 'H')
+    tty.schedule(now, 'X')
+    scn.schedule(now, 'I')
+    # on a bus of its own, must not reach the devices of the default line
+    scn2.schedule(now, 'J')
+    try:
+        while any([telex.process_data(line) for line in lines]):
+            pass
+    finally:
+        telex.RECORDER.close()
+        telex.RECORDER = None
+
+    # MCP (sending nothing) runs as real device, interested in everything: it
+    # must get the items of its own line only
+    mcp = txRecorder.ReplayDevice('MCP')
+    mcp.bus_chars = mcp.bus_commands = True
+    mcp.bus_sources = None
+    report = txRecorder.Replayer(filename, 0, [mcp]).run()
+    os.remove(filename)
+    os.rmdir(os.path.dirname(filename))
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return report['items'] == 4 and not report['divergence']
+
+
+def main():
+    if '--check' in sys.argv:
+        ok = check()
+        print('OK' if ok else 'FAILED')
+        sys.exit(0 if ok else 1)
+
+    parser = argparse.ArgumentParser(description='Replay a piTelex bus recording.')
+    parser.add_argument('filename')
+    parser.add_argument('--speed', default='1',
+        help="1 for real time, n for n times faster, 'max' for maximum speed")
+    parser.add_argument('--mcp', action='store_true',
+        help="run the real MCP instead of replaying its recorded output")
+    parser.add_argument('--out', help="write the report to this file instead of stdout")
+    args = parser.parse_args()
+
+    speed = 0 if args.speed == 'max' else float(args.speed)
+    devices = []
+    if args.mcp:
+        import txDevMCP
+        devices.append(txDevMCP.TelexMCP())
+
+    report = txRecorder.Replayer(args.filename, speed, devices).run()
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, 'w', encoding='UTF-8') as fp:
+            fp.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
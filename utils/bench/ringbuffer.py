@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+ringbuffer.py: rx/tx buffer benchmark
+
+Compares consuming a backlog of characters (e.g. a long news item or a
+read_file playout) from a Python list by pop(0), as the device modules did
+before, with txBase.RingBuffer, character by character (read) and in runs
+(read_many).
+
+Run from the piTelex directory:
+
+    python3 utils/bench/ringbuffer.py [backlog length]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import txBase
+
+BASE = txBase.TelexBase()
+
+#######
+
+def bench(name:str, fill, consume, repeat:int=5):
+    best = None
+    for _ in range(repeat):
+        buffer = fill()
+        t = time.perf_counter()
+        consume(buffer)
+        dt = time.perf_counter() - t
+        if best is None or dt < best:
+            best = dt
+    print("{:<28} {:>10.3f} ms".format(name, best * 1000))
+    return best
+
+
+def pop_all_list(buffer):
+    while buffer:
+        buffer.pop(0)
+
+def pop_all_ring(buffer):
+    while buffer:
+        buffer.popleft()
+
+def pop_runs(buffer):
+    while buffer:
+        BASE.pop_many(buffer)
+
+#######
+
+def main():
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    text = ('RYRYRYRY THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG 1234567890\r\n' * (length // 66 + 1))[:length]
+    print("backlog of {} characters".format(length))
+
+    t_list = bench('list.pop(0)', lambda: list(text), pop_all_list)
+    t_ring = bench('RingBuffer.popleft()', lambda: txBase.RingBuffer(text), pop_all_ring)
+    t_list_runs = bench('list, runs of 64', lambda: list(text), pop_runs)
+    t_ring_runs = bench('RingBuffer, runs of 64', lambda: txBase.RingBuffer(text), pop_runs)
+    bench('RingBuffer(locked), runs', lambda: txBase.RingBuffer(text, locked=True), pop_runs)
+
+    print("speedup per character: {:.1f}x, in runs: {:.1f}x".format(
+        t_list / t_ring, t_list_runs / t_ring_runs))
+
+if __name__ == '__main__':
+    main()